@@ -0,0 +1,48 @@
+"""
+    Benchmarks the processing of the database files by the ID mapper build for different numbers of parse workers.
+    Uses the files downloaded by update_id_mapper(delete_database_files=False).
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/build_id_mapping.py [workers ...]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import resource
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+
+def run_build(parse_workers):
+    from mergem import __database_processing as database_processing
+
+    manifest = database_processing.load_download_manifest()
+    database_processing.kegg_metabolites_filename = database_processing.files_dir + manifest['kegg']['filename']
+    database_processing.max_parse_workers = parse_workers
+    database_processing.log_dir = tempfile.mkdtemp() + "/"
+    database_processing.log = lambda message: None
+
+    tic = perf_counter()
+    database_processing.process_database_files()
+    database_processing.clean_reaction_ids()
+    database_processing.clean_metabolite_ids()
+    toc = perf_counter()
+
+    print(f"{parse_workers:>7} {toc - tic:10.1f} s {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:10.0f} MB")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--run":
+        run_build(int(sys.argv[2]))
+        return
+
+    print(f"{'workers':>7} {'time':>12} {'peak memory':>13}")
+    for parse_workers in sys.argv[1:] or ["1", "2", "4"]:
+        # Each build runs in a new process, since the build state is kept in module variables
+        subprocess.run([sys.executable, __file__, "--run", parse_workers], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+    Benchmarks clustering large collections of models, with synthetic models drawn from families of related
+    models, each model keeping most reactions of its family and a few random reactions. Measures the Jaccard
+    distances and the hierarchical clustering of cluster_models, without loading models or mapping tables.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/cluster_models.py [models ...]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+import numpy as np
+
+num_reactions = 50000  # reactions of all families
+family_reactions = 1500  # reactions of each family
+num_families = 40
+
+
+def generate_models(num_models, seed=0):
+    rng = np.random.default_rng(seed)
+    families = [rng.choice(num_reactions, family_reactions, replace=False) for _ in range(num_families)]
+    model_reactions = []
+    for model in range(num_models):
+        family = families[model % num_families]
+        kept_reactions = family[rng.random(family_reactions) < 0.85]
+        model_reactions.append(np.unique(np.concatenate([kept_reactions, rng.integers(0, num_reactions, 200)])))
+
+    return model_reactions
+
+
+def run_clustering(num_models):
+    from mergem import __cluster_models as cluster_models
+
+    model_reactions = generate_models(num_models)
+
+    tic = perf_counter()
+    distances = cluster_models.compute_jaccard_distances(model_reactions, num_reactions)
+    toc = perf_counter()
+    linkage = cluster_models.compute_linkage(distances.copy(), 'average')
+    clusters = cluster_models.get_clusters(linkage, num_clusters=num_families)
+    tac = perf_counter()
+
+    # Models of the same family should be found in the same cluster
+    family_clusters = {(model % num_families, cluster) for model, cluster in enumerate(clusters)}
+    print(f"{num_models:>6} {toc - tic:10.1f} s {tac - toc:10.1f} s "
+          f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:10.0f} MB "
+          f"{len(family_clusters) == min(num_models, num_families)!s:>9}")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--run":
+        run_clustering(int(sys.argv[2]))
+        return
+
+    print(f"{'models':>6} {'distances':>12} {'clustering':>12} {'peak memory':>13} {'families':>9}")
+    for num_models in sys.argv[1:] or ["100", "1000", "5000"]:
+        # Each collection is clustered in a new process to measure its memory
+        subprocess.run([sys.executable, __file__, "--run", num_models], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+    Benchmarks building community models with different numbers of members, copies of a model with their own
+    compartments sharing the extracellular metabolites. Uses the textbook E. coli core model of cobrapy unless
+    another model file is given, and the mapping tables saved by update_id_mapper.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/community_model.py [model_file] [members ...]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+
+def run_build(model_filename, members):
+    import cobra
+    import mergem
+    from mergem import __merge_models
+
+    __merge_models.numbered_duplicate_reac_ids = True  # keeps the reaction IDs of hundreds of members short
+    model = cobra.io.load_model("textbook") if model_filename == "textbook" else mergem.load_model(model_filename)
+    member_models = []
+    for member in range(members):
+        member_model = model.copy()
+        member_model.id = f"{model.id}_{member}"
+        member_models.append(member_model)
+
+    tic = perf_counter()
+    results = mergem.merge(member_models, community_model=True)
+    toc = perf_counter()
+
+    community_model = results['merged_model']
+    print(f"{members:>7} {toc - tic:10.1f} s {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:10.0f} MB "
+          f"{len(community_model.metabolites):>11} {len(community_model.reactions):>9}")
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_build(sys.argv[2], int(sys.argv[3]))
+        return
+
+    arguments = sys.argv[1:]
+    model_filename = arguments.pop(0) if arguments and not arguments[0].isdigit() else "textbook"
+
+    print(f"{'members':>7} {'time':>12} {'peak memory':>13} {'metabolites':>11} {'reactions':>9}")
+    for members in arguments or ["10", "100", "500"]:
+        # Each community is built in a new process to measure its memory
+        subprocess.run([sys.executable, __file__, "--run", model_filename, members], check=True)
+
+
+if __name__ == "__main__":
+    main()
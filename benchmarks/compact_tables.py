@@ -0,0 +1,91 @@
+"""
+    Benchmarks the memory and lookup time of the mapping tables loaded as dictionaries and as compact tables.
+    Uses the mapping tables saved by update_id_mapper unless another data directory is given.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/compact_tables.py [data_dir]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import os
+import random
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+table_filenames = {'dict': ['metaboliteIdMapper.p', 'metaboliteInfo.p', 'reactionIdMapper.p', 'reactionInfo.p'],
+                   'compact': ['metaboliteIdMapperCompact.p', 'metaboliteInfoCompact.p',
+                               'reactionIdMapperCompact.p', 'reactionInfoCompact.p']}
+lookups = 100000
+
+
+def run_lookups(representation, data_dir):
+    from mergem import __model_handling as model_handling
+
+    for name, filename in zip(['met_univ_id_dict_file', 'met_univ_id_prop_dict_file',
+                               'reac_univ_id_dict_file', 'reac_univ_id_prop_dict_file'], table_filenames['dict']):
+        setattr(model_handling, name, os.path.join(data_dir, filename))
+    for name, filename in zip(['met_univ_id_compact_dict_file', 'met_univ_id_prop_compact_dict_file',
+                               'reac_univ_id_compact_dict_file', 'reac_univ_id_prop_compact_dict_file'],
+                              table_filenames['compact']):
+        setattr(model_handling, name, os.path.join(data_dir, filename))
+    model_handling.use_compact_tables = representation == 'compact'
+
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    tic = perf_counter()
+    model_handling.load_met_univ_id_dict()
+    model_handling.load_met_univ_id_prop_dict()
+    model_handling.load_reac_univ_id_dict()
+    model_handling.load_reac_univ_id_prop_dict()
+    load_time = perf_counter() - tic
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - start_rss
+
+    random.seed(0)
+    met_ids = random.choices(list(model_handling.met_univ_id_dict), k=lookups)
+    tic = perf_counter()
+    met_univ_ids = [model_handling.map_metabolite_univ_id(met_id) for met_id in met_ids]
+    map_time = perf_counter() - tic
+
+    tic = perf_counter()
+    for met_univ_id in met_univ_ids:
+        model_handling.get_metabolite_properties(met_univ_id)
+    properties_time = perf_counter() - tic
+
+    # Properties of the same univ IDs again, which the compact tables have cached
+    repeated_univ_ids = met_univ_ids[:1000] * (lookups // 1000)
+    tic = perf_counter()
+    for met_univ_id in repeated_univ_ids:
+        model_handling.get_metabolite_properties(met_univ_id)
+    repeated_properties_time = perf_counter() - tic
+
+    print(f"{representation:>14} {rss:10.0f} MB {load_time:8.1f} s "
+          f"{map_time / lookups * 1e6:12.1f} us {properties_time / lookups * 1e6:16.1f} us "
+          f"{repeated_properties_time / len(repeated_univ_ids) * 1e6:17.1f} us")
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_lookups(sys.argv[2], sys.argv[3])
+        return
+
+    if len(sys.argv) == 2:
+        data_dir = sys.argv[1]
+    else:
+        from mergem import __model_handling as model_handling
+        data_dir = model_handling.data_dir
+
+    print(f"{'representation':>14} {'memory':>13} {'load':>10} {'map_metabolite':>15} {'get_properties':>19} "
+          f"{'repeated':>20}")
+    for representation in ['dict', 'compact']:
+        if not all(os.path.exists(os.path.join(data_dir, filename)) for filename in table_filenames[representation]):
+            print(f"{representation:>14} tables not found in {data_dir}")
+            continue
+
+        # Each representation is loaded in a new process to measure its memory
+        subprocess.run([sys.executable, __file__, "--run", representation, data_dir], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+    Benchmarks comparing two versions of a synthetic model with diff, against merging them with merge.
+    The new version renames a fraction of the metabolites of the old version to other ids of the same mergem id, and
+    removes, adds, renames (half of them reversed), and changes the stoichiometry of a fraction of its reactions. The
+    changes found by diff are checked against them. Uses a synthetic mapping table of the metabolites instead of the
+    mapping tables saved by update_id_mapper, and 10,000 reactions unless other sizes are given.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/diff_models.py [reactions ...]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import random
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+change_rate = 0.02  # fraction of the metabolites renamed, and of the reactions removed, added, renamed, and with
+                    # changed stoichiometry
+
+
+def get_met_univ_id_dict(num_reactions):
+    """
+    Returns a metabolite mapping table of the synthetic models, mapping the id of each metabolite and its alias to
+    the same universal id.
+    """
+    met_univ_id_dict = {'C00080': 0}
+    for index in range(num_reactions // 2):
+        met_univ_id_dict[f"met{index}"] = met_univ_id_dict[f"alias{index}"] = index + 1
+    return met_univ_id_dict
+
+
+def generate_models(num_reactions, seed=0):
+    import cobra
+
+    rng = random.Random(seed)
+    metabolites = [cobra.Metabolite(f"met{index}_c", compartment='c') for index in range(num_reactions // 2)]
+
+    old_model = cobra.Model("old_version")
+    reactions = []
+    for index in range(num_reactions):
+        reaction = cobra.Reaction(f"R{index}")
+        reaction_metabolites = rng.sample(metabolites, rng.randint(2, 6))
+        reaction.add_metabolites({metabolite: (-1 if position % 2 else 1) * rng.randint(1, 3)
+                                  for position, metabolite in enumerate(reaction_metabolites)})
+        reactions.append(reaction)
+    old_model.add_reactions(reactions)
+
+    new_model = old_model.copy()
+    new_model.id = "new_version"
+    changes = {'metabolite': [], 'removed': [], 'added': [], 'renamed': [], 'stoichiometry': []}
+    for metabolite in rng.sample(list(new_model.metabolites), int(len(metabolites) * change_rate)):
+        changes['metabolite'].append(metabolite.id)
+        metabolite.id = metabolite.id.replace("met", "alias")
+
+    changed_reactions = rng.sample(list(new_model.reactions), 3 * int(num_reactions * change_rate))
+    num_changes = len(changed_reactions) // 3
+
+    new_model.remove_reactions(changed_reactions[:num_changes])
+    changes['removed'] = [reaction.id for reaction in changed_reactions[:num_changes]]
+
+    for position, reaction in enumerate(changed_reactions[num_changes:2 * num_changes]):
+        changes['renamed'].append(reaction.id)
+        if position % 2:
+            reaction.add_metabolites({metabolite: -2 * coefficient
+                                      for metabolite, coefficient in reaction.metabolites.items()})
+        reaction.id = reaction.id + "_renamed"
+
+    for reaction in changed_reactions[2 * num_changes:]:
+        changes['stoichiometry'].append(reaction.id)
+        reaction.add_metabolites({rng.choice(list(reaction.metabolites)): 1})
+
+    added_reactions = []
+    for index in range(num_changes):
+        reaction = cobra.Reaction(f"R{num_reactions + index}")
+        substrate, product = rng.sample(list(new_model.metabolites), 2)
+        reaction.add_metabolites({substrate: -1, product: 1})
+        added_reactions.append(reaction)
+        changes['added'].append(reaction.id)
+    new_model.add_reactions(added_reactions)
+
+    return old_model, new_model, changes
+
+
+def run_diff(num_reactions, compare_merge):
+    import mergem
+    from mergem import __model_handling as model_handling
+
+    model_handling.met_univ_id_dict = get_met_univ_id_dict(num_reactions)
+    old_model, new_model, changes = generate_models(num_reactions)
+
+    tic = perf_counter()
+    differences = mergem.diff(old_model, new_model, exact_sto=True)
+    toc = perf_counter()
+
+    found_changes = {}
+    for entity_type, change, id_column in [('metabolite', 'renamed', 'old_id'), ('reaction', 'removed', 'old_id'),
+                                           ('reaction', 'added', 'new_id'), ('reaction', 'renamed', 'old_id'),
+                                           ('reaction', 'stoichiometry', 'old_id')]:
+        change_ids = differences.loc[(differences['type'] == entity_type) & (differences['change'] == change), id_column]
+        found_changes['metabolite' if entity_type == 'metabolite' else change] = sorted(change_ids)
+    found_changes = len(differences) == sum(map(len, changes.values())) \
+        and found_changes == {change: sorted(ids) for change, ids in changes.items()}
+
+    merge_time = float('nan')
+    if compare_merge:
+        tic_merge = perf_counter()
+        mergem.merge([old_model, new_model], exact_sto=True)
+        merge_time = perf_counter() - tic_merge
+
+    print(f"{num_reactions:>9} {toc - tic:10.1f} s {merge_time:10.1f} s "
+          f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:10.0f} MB {found_changes!s:>7}")
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_diff(int(sys.argv[2]), sys.argv[3] == "merge")
+        return
+
+    print(f"{'reactions':>9} {'diff':>12} {'merge':>12} {'peak memory':>13} {'changes':>7}")
+    for num_reactions in sys.argv[1:] or ["10000"]:
+        # Each comparison runs in a new process to measure its memory; merge is skipped for the largest models
+        compare_merge = "merge" if int(num_reactions) <= 10000 else "diff"
+        subprocess.run([sys.executable, __file__, "--run", num_reactions, compare_merge], check=True)
+
+
+if __name__ == "__main__":
+    main()
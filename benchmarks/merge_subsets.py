@@ -0,0 +1,79 @@
+"""
+    Benchmarks merging every pair and every leave-one-out subset of a panel of models with merge_subsets, against
+    calling merge for each subset. The panel is made of variants of a model, each without a random fraction of its
+    reactions. Uses the textbook E. coli core model of cobrapy unless another model file is given, and the mapping
+    tables saved by update_id_mapper.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/merge_subsets.py [model_file] [panel_size ...]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import itertools
+import random
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+removed_reactions = 0.1  # fraction of the reactions removed from each variant of the model
+
+
+def create_panel(model, panel_size, seed=0):
+    rng = random.Random(seed)
+    panel = []
+    for variant in range(panel_size):
+        variant_model = model.copy()
+        variant_model.id = f"{model.id}_{variant}"
+        variant_model.remove_reactions(rng.sample(list(variant_model.reactions),
+                                                  int(len(variant_model.reactions) * removed_reactions)))
+        panel.append(variant_model)
+
+    return panel
+
+
+def run_subsets(model_filename, panel_size, compare_merge):
+    import cobra
+    import mergem
+    from mergem import __merge_subsets as merge_subsets
+
+    model = cobra.io.load_model("textbook") if model_filename == "textbook" else mergem.load_model(model_filename)
+    panel = create_panel(model, panel_size)
+    subsets = [list(pair) for pair in itertools.combinations(range(panel_size), 2)]
+    subsets += [[other for other in range(panel_size) if other != left_out] for left_out in range(panel_size)]
+
+    tic = perf_counter()
+    results = merge_subsets.merge_subsets(panel, subsets)
+    toc = perf_counter()
+
+    merge_time, same_statistics = float('nan'), None
+    if compare_merge:
+        tic_merge = perf_counter()
+        merge_results = [mergem.merge([panel[model_index].copy() for model_index in subset]) for subset in subsets]
+        merge_time = perf_counter() - tic_merge
+        same_statistics = all(result['num_met_merged'] == merge_result['num_met_merged'] and
+                              result['num_reac_merged'] == merge_result['num_reac_merged']
+                              for result, merge_result in zip(results, merge_results))
+
+    print(f"{panel_size:>5} {len(subsets):>7} {toc - tic:10.1f} s {merge_time:10.1f} s "
+          f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:10.0f} MB {same_statistics!s:>10}")
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--run":
+        run_subsets(sys.argv[2], int(sys.argv[3]), sys.argv[4] == "merge")
+        return
+
+    arguments = sys.argv[1:]
+    model_filename = arguments.pop(0) if arguments and not arguments[0].isdigit() else "textbook"
+
+    print(f"{'panel':>5} {'subsets':>7} {'merge_subsets':>12} {'merge':>12} {'peak memory':>13} {'statistics':>10}")
+    for panel_size in arguments or ["10", "30"]:
+        # Each panel runs in a new process to measure its memory; merge is only compared for small panels
+        compare_merge = "merge" if int(panel_size) <= 10 else "subsets"
+        subprocess.run([sys.executable, __file__, "--run", model_filename, panel_size, compare_merge], check=True)
+
+
+if __name__ == "__main__":
+    main()
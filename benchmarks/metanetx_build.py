@@ -0,0 +1,55 @@
+"""
+    Benchmarks the metabolite steps of the ID mapper build on the MetaNetX chem_prop and chem_xref files.
+    Uses the files downloaded by update_id_mapper(delete_database_files=False) unless other paths are given.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/metanetx_build.py [chem_prop.tsv chem_xref.tsv]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import resource
+import sys
+import tempfile
+from time import perf_counter
+
+from mergem import __database_processing as database_processing
+
+
+def main():
+    if len(sys.argv) == 3:
+        chem_prop_filename, chem_xref_filename = sys.argv[1:]
+    else:
+        chem_prop_filename = database_processing.mx_chem_prop_filename
+        chem_xref_filename = database_processing.mx_met_xref_filename
+
+    database_processing.log_dir = tempfile.mkdtemp() + "/"
+    database_processing.log = lambda message: None
+
+    steps = [("chem_prop", lambda: database_processing.process_met_file(
+                chem_prop_filename, database_processing.metanetx_chem_prop_line_reader)),
+             ("chem_xref ids", lambda: database_processing.process_met_file(
+                chem_xref_filename, database_processing.metanetx_chem_xref_line_reader)),
+             ("chem_xref cross-references", lambda: database_processing.process_cross_ref_info(
+                chem_xref_filename, database_processing.metanetx_chem_xref_reader)),
+             ("merged properties", database_processing.resolve_merged_identifiers),
+             ("repeated ids", database_processing.add_repeated_ids),
+             ("cleaning", lambda: database_processing.clean_id_mapping_dictionary(
+                database_processing.met_univ_id_dict, database_processing.met_univ_id_prop_dict))]
+
+    total_time = 0
+    for step_name, step in steps:
+        tic = perf_counter()
+        step()
+        toc = perf_counter()
+        total_time += toc - tic
+        print(f"{step_name:<30}{toc - tic:10.2f} s")
+
+    print(f"{'total':<30}{total_time:10.2f} s")
+    print(f"Metabolite ids: {len(database_processing.met_univ_id_dict)}")
+    print(f"Univ ids: {len(database_processing.met_univ_id_prop_dict)}")
+    print(f"Peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+    Benchmarks an offline build of the ID mapper from a synthetic directory of database files, so that the build
+    can be measured reproducibly without network access. The database files are generated by synthetic_sources.py
+    and the build runs in a temporary downloads directory, without changing the mapping tables of the package.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/offline_build.py [compounds ...]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from synthetic_sources import generate_sources
+
+
+def run_build(source_dir):
+    from mergem import __database_processing as database_processing
+
+    build_dir = tempfile.mkdtemp()
+    database_processing.set_files_dir(os.path.join(build_dir, "downloads"))
+    database_processing.download_manifest_filename = os.path.join(build_dir, "downloadManifest.json")
+    database_processing.log_dir = os.path.join(build_dir, "logs", "")
+    database_processing.log = lambda message: None
+
+    tic = perf_counter()
+    met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict = \
+        database_processing.build_id_mapping(False, force=True, source_dir=source_dir)
+    toc = perf_counter()
+
+    print(f"{toc - tic:10.1f} s {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:10.0f} MB "
+          f"{len(met_univ_id_dict):>12} {len(met_univ_id_prop_dict):>12} "
+          f"{len(reac_univ_id_dict):>12} {len(reac_univ_id_prop_dict):>12}")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--run":
+        run_build(sys.argv[2])
+        return
+
+    print(f"{'compounds':>9} {'time':>12} {'peak memory':>13} {'met ids':>12} {'met univ ids':>12} "
+          f"{'reac ids':>12} {'reac univ ids':>12}")
+    for compounds in sys.argv[1:] or ["2000", "20000"]:
+        source_dir = tempfile.mkdtemp()
+        generate_sources(source_dir, int(compounds))
+
+        # Each build runs in a new process, since the build state is kept in module variables
+        build = subprocess.run([sys.executable, __file__, "--run", source_dir], check=True, capture_output=True,
+                               text=True)
+        print(f"{compounds:>9} {build.stdout.splitlines()[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+    Generates a synthetic directory of database files for an offline build of the ID mapper, with the files and
+    formats of the downloads directory and their manifest. The compounds and reactions are random but reproducible
+    from their seed, with their IDs shared across databases and some of them merged into the same univ ID.
+    Requires mergem to be installed (pip install -e .):
+
+        python benchmarks/synthetic_sources.py source_dir [compounds] [seed] [merge_rate]
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import gzip
+import json
+import os
+import pickle
+import random
+import sys
+
+from mergem import __database_processing as database_processing
+
+kegg_filename = "kegg_synthetic.p"
+
+
+def generate_compounds(rnd, count, merge_rate):
+    """
+    Returns a list of synthetic compounds with their IDs in each database and their properties.
+    """
+    compounds = []
+    for i in range(1, count + 1):
+        compounds.append({'kegg': f"C{i:05d}" if rnd.random() < 0.7 else None,
+                          'chebi': str(10000 + i) if rnd.random() < 0.8 else None,
+                          'mnx': f"MNXM{i}",
+                          'bigg': f"met{i}" if rnd.random() < 0.6 else None,
+                          'seed': f"cpd{i:05d}" if rnd.random() < 0.8 else None,
+                          'name': f"compound {i}",
+                          'formula': f"C{i % 7 + 1}H{i % 11 + 1}O{i % 3}",
+                          'mass': f"{i * 1.37:.4f}",
+                          'inchikey': f"IK{i:06d}XYZ"})
+
+    # Compounds linked to the MetaNetX ID of another compound, so that their univ IDs are merged
+    for _ in range(int(count * merge_rate)):
+        compound, other_compound = rnd.sample(compounds, 2)
+        other_compound['alt_mnx'] = compound['mnx']
+
+    return compounds
+
+
+def generate_reactions(rnd, count):
+    """
+    Returns a list of synthetic reactions with their IDs in each database and their properties.
+    """
+    return [{'mnx': f"MNXR{i}",
+             'seed': f"rxn{i:05d}" if rnd.random() < 0.8 else None,
+             'bigg': f"RXN{i}" if rnd.random() < 0.6 else None,
+             'kegg': f"R{i:05d}" if rnd.random() < 0.7 else None,
+             'rhea': str(20000 + i) if rnd.random() < 0.5 else None,
+             'ec': f"1.1.1.{i % 300}",
+             'name': f"reaction {i}"} for i in range(1, count + 1)]
+
+
+def write_metabolite_files(rnd, compounds, source_dir):
+    count = len(compounds)
+    seed_ids = [compound['seed'] for compound in compounds if compound['seed']]
+
+    kegg_compounds = {}
+    for compound in compounds:
+        if compound['kegg']:
+            names = [compound['name'], compound['name'].upper()] if rnd.random() < 0.3 else [compound['name']]
+            chebi_ids = ["chebi:" + compound['chebi']] if compound['chebi'] and rnd.random() < 0.8 else []
+            kegg_compounds[compound['kegg']] = {'Name': names, 'mass': [compound['mass']],
+                                                'formula': [compound['formula']], 'chebi': chebi_ids}
+    with open(os.path.join(source_dir, kegg_filename), 'wb') as file:
+        pickle.dump(kegg_compounds, file)
+
+    with gzip.open(os.path.join(source_dir, "chebi_structures.csv.gz"), 'wt') as file:
+        file.write("ID,COMPOUND_ID,STRUCTURE,TYPE,DIMENSION,DEFAULT_STRUCTURE,AUTOGEN_STRUCTURE\n")
+        for row, compound in enumerate(compounds):
+            if compound['chebi']:
+                file.write(f"{row},{compound['chebi']},{compound['inchikey']},InChIKey,1D,N,N\n")
+                if rnd.random() < 0.3:
+                    file.write(f"{row},{compound['chebi']},InChI=1S/x,InChI,1D,N,N\n")
+
+    with gzip.open(os.path.join(source_dir, "chebi_compounds.tsv.gz"), 'wt') as file:
+        file.write("ID\tSTATUS\tCHEBI_ACCESSION\tSOURCE\tPARENT_ID\tNAME\tDEFINITION\tMODIFIED_ON\tCREATED_BY\tSTAR\n")
+        for row, compound in enumerate(compounds):
+            if compound['chebi']:
+                name = "null" if rnd.random() < 0.05 else \
+                    (compound['name'].title() if rnd.random() < 0.5 else compound['name'])
+                file.write(f"{row}\tC\tCHEBI:{compound['chebi']}\tChEBI\tnull\t{name}\tdef\t2020\tx\t3\n")
+
+    with open(os.path.join(source_dir, "metanetx_chem_prop.tsv"), 'w') as file:
+        file.write("### MNXref Version 4.4 ###\n#ID\tname\treference\tformula\tcharge\tmass\tInChI\tInChIKey\tSMILES\n")
+        for compound in compounds:
+            if rnd.random() < 0.1:
+                file.write(f"{compound['mnx']}\t{compound['name']}\tchebi:{compound['chebi']}\n")
+            else:
+                mass = compound['mass'] if rnd.random() < 0.9 else ""
+                inchikey = ("InChIKey=" + compound['inchikey']) if rnd.random() < 0.8 else ""
+                file.write(f"{compound['mnx']}\t{compound['name']}\tchebi:{compound['chebi']}\t{compound['formula']}"
+                           f"\t0\t{mass}\tInChI=1S\t{inchikey}\tO\n")
+
+    with open(os.path.join(source_dir, "metanetx_chem_depr.tsv"), 'w') as file:
+        file.write("### MNXref Version 4.4 ###\n#VERSION 4.4\n#deprecated_ID\tID\tversion\n")
+        for compound in compounds:
+            if rnd.random() < 0.1:
+                file.write(f"{compound['mnx']}old\t{compound['mnx']}\t4.4\n")
+            if rnd.random() < 0.02:
+                file.write(f"{compound['mnx']}older\t{compound['mnx']}\t3.2\n")
+
+    with open(os.path.join(source_dir, "metanetx_chem_xref.tsv"), 'w') as file:
+        file.write("### MNXref Version 4.4 ###\n#source\tID\tdescription\n")
+        file.write("mnx:MNXM0\tMNXM0\tPROTON\n")
+        for compound in compounds:
+            mnx_id, name = compound['mnx'], compound['name']
+            file.write(f"mnx:{mnx_id}\t{mnx_id}\t{name}\n")
+            if compound['kegg']:
+                file.write(f"kegg.compound:{compound['kegg']}\t{mnx_id}\t{name}\n")
+                file.write(f"keggC:{compound['kegg']}\t{mnx_id}\tsecondary/obsolete\n")
+            if compound['chebi']:
+                file.write(f"chebi:{compound['chebi']}\t{mnx_id}\t{name}||{name.upper()}\n")
+                file.write(f"CHEBI:{compound['chebi']}\t{mnx_id}\t{name}\n")
+            if compound['bigg']:
+                file.write(f"bigg.metabolite:{compound['bigg']}\t{mnx_id}\t{name}\n")
+            if compound['seed']:
+                file.write(f"seed.compound:{compound['seed']}\t{mnx_id}\t{name}\n")
+            file.write(f"metacyc.compound:META-{mnx_id}\t{mnx_id}\t{name}\n")
+            if rnd.random() < 0.2:
+                file.write(f"sabiork.compound:{rnd.randint(1, count)}\t{mnx_id}\t{name}\n")
+            if rnd.random() < 0.05:
+                file.write(f"hmdb:HMDB{rnd.randint(1, 99)}\t{mnx_id}\tunknown compound\n")
+            if 'alt_mnx' in compound:
+                file.write(f"slm:{compound['alt_mnx']}\t{mnx_id}\tgeneric\n")
+                if compound['seed']:
+                    file.write(f"seed.compound:{compound['seed']}\t{compound['alt_mnx']}\t{name}\n")
+
+    with open(os.path.join(source_dir, "bigg_models_metabolites.txt"), 'w') as file:
+        file.write("bigg_id\tuniversal_bigg_id\tname\tmodel_list\tdatabase_links\told_bigg_ids\n")
+        for compound in compounds:
+            if not compound['bigg']:
+                continue
+            links = []
+            if compound['kegg']:
+                links.append(f"KEGG Compound: http://identifiers.org/kegg.compound/{compound['kegg']}")
+            if compound['chebi']:
+                links.append(f"CHEBI: http://identifiers.org/chebi/CHEBI:{compound['chebi']}")
+            links.append(f"MetaNetX (MNX) Chemical: http://identifiers.org/metanetx.chemical/{compound['mnx']}")
+            if compound['seed'] and rnd.random() < 0.7:
+                links.append(f"SEED Compound: http://identifiers.org/seed.compound/{compound['seed']}")
+            links.append(f"InChI Key: https://identifiers.org/inchikey/{compound['inchikey']}")
+            rnd.shuffle(links)
+            for compartment in ['c', 'e']:
+                file.write(f"{compound['bigg']}_{compartment}\t{compound['bigg']}\t{compound['name'].capitalize()}"
+                           f"\tiML1515\t{'; '.join(links)}\t{compound['bigg']}_{compartment}\n")
+
+    with open(os.path.join(source_dir, "modelSeed_compounds.tsv"), 'w') as file:
+        file.write("id\tabbreviation\tname\tformula\tmass\tsource\tinchikey\tcharge\tis_core\tis_obsolete"
+                   "\tlinked_compound\tnotes\n")
+        for compound in compounds:
+            if not compound['seed']:
+                continue
+            mass = rnd.choice([compound['mass'], compound['mass'], "None", "null", "10000000", ""])
+            linked_compounds = "null" if rnd.random() < 0.9 else ";".join(rnd.sample(seed_ids, 2))
+            file.write(f"{compound['seed']}\tabbr\t{compound['name']}\t{compound['formula']}\t{mass}\tPrimary"
+                       f"\t{compound['inchikey']}\t0\t1\t0\t{linked_compounds}\tx\n")
+
+    with open(os.path.join(source_dir, "modelseed_compound_aliases.txt"), 'w') as file:
+        file.write("ModelSEED ID\tExternal ID\tSource\n")
+        for compound in compounds:
+            if not compound['seed']:
+                continue
+            if compound['kegg']:
+                file.write(f"{compound['seed']}\t{compound['kegg']}\tKEGG\n")
+            file.write(f"{compound['seed']}\t{compound['mnx']}\tMetaNetX.chemical\n")
+            if compound['bigg']:
+                file.write(f"{compound['seed']}\t{compound['bigg']}\tBiGG\n")
+            file.write(f"{compound['seed']}\tX{compound['seed']}\tAraCyc\n")
+
+
+def write_reaction_files(rnd, reactions, source_dir):
+    count = len(reactions)
+    seed_ids = [reaction['seed'] for reaction in reactions if reaction['seed']]
+
+    with open(os.path.join(source_dir, "modelSeed_reactions.tsv"), 'w') as file:
+        file.write("\t".join(f"column{column}" for column in range(22)) + "\n")
+        for reaction in reactions:
+            if not reaction['seed']:
+                continue
+            columns = ["x"] * 22
+            columns[0], columns[2] = reaction['seed'], reaction['name']
+            columns[13] = rnd.choice([reaction['ec'], "null", ""])
+            columns[19] = "null" if rnd.random() < 0.9 else ";".join(rnd.sample(seed_ids, 2))
+            file.write("\t".join(columns) + "\n")
+
+    with open(os.path.join(source_dir, "modelSeed_reaction_aliases.txt"), 'w') as file:
+        file.write("ModelSEED ID\tExternal ID\tSource\n")
+        for reaction in reactions:
+            if reaction['seed'] and reaction['kegg']:
+                file.write(f"{reaction['seed']}\t{reaction['kegg']}\tKEGG\n")
+
+    with open(os.path.join(source_dir, "modelSeed_reaction_pathways.txt"), 'w') as file:
+        file.write("ModelSEED ID\tExternal ID\tSource\n")
+        for reaction in reactions:
+            if reaction['seed'] and rnd.random() < 0.5:
+                file.write(f"{reaction['seed']}\tpathway {rnd.randint(1, 50)}\tKEGG\n")
+
+    with open(os.path.join(source_dir, "metaNetX_reac_prop.tsv"), 'w') as file:
+        file.write("### MNXref Version 4.4 ###\n#ID\tmnx_equation\treference\tclassifs\tis_balanced\tis_transport\n")
+        for reaction in reactions:
+            reference = f"rheaR:{reaction['rhea']}" if reaction['rhea'] else f"mnx:{reaction['mnx']}"
+            if rnd.random() < 0.1:
+                file.write(f"{reaction['mnx']}\teq\t{reference}\n")
+            else:
+                file.write(f"{reaction['mnx']}\teq\t{reference}\t{reaction['ec']}\tB\t\n")
+
+    with open(os.path.join(source_dir, "metaNetX_reac_xref.tsv"), 'w') as file:
+        file.write("### MNXref Version 4.4 ###\n#source\tID\tdescription\n")
+        for reaction in reactions:
+            mnx_id = reaction['mnx']
+            file.write(f"mnx:{mnx_id}\t{mnx_id}\t\n")
+            if reaction['kegg']:
+                file.write(f"kegg.reaction:{reaction['kegg']}\t{mnx_id}\t\n")
+                file.write(f"keggR:{reaction['kegg']}\t{mnx_id}\t\n")
+            if reaction['seed']:
+                file.write(f"seed.reaction:{reaction['seed']}\t{mnx_id}\t\n")
+            if reaction['bigg']:
+                file.write(f"bigg.reaction:{reaction['bigg']}\t{mnx_id}\t\n")
+            if reaction['rhea']:
+                file.write(f"rhea:{reaction['rhea']}\t{mnx_id}\t\n")
+            if rnd.random() < 0.05:
+                file.write(f"metacyc.reaction:X{rnd.randint(1, count)}\tEMPTY\t\n")
+            if rnd.random() < 0.05:
+                file.write(f"seed.reaction:rxn{rnd.randint(1, count):05d}\t{mnx_id}\t\n")
+
+    with open(os.path.join(source_dir, "bigg_models_reactions.txt"), 'w') as file:
+        file.write("bigg_id\tname\treaction_string\tmodel_list\tdatabase_links\told_bigg_ids\n")
+        for reaction in reactions:
+            if not reaction['bigg']:
+                continue
+            links = [f"MetaNetX (MNX) Equation: http://identifiers.org/metanetx.reaction/{reaction['mnx']}",
+                     f"EC Number: http://identifiers.org/ec-code/{reaction['ec']}"]
+            if reaction['seed']:
+                links.append(f"SEED Reaction: http://identifiers.org/seed.reaction/{reaction['seed']}")
+            if reaction['kegg']:
+                links.append(f"KEGG Reaction: http://identifiers.org/kegg.reaction/{reaction['kegg']}")
+            file.write(f"{reaction['bigg']}\t{reaction['name']}\ta <=> b\tiML1515\t{'; '.join(links)}"
+                       f"\t{reaction['bigg']}_old; {reaction['bigg']}_old2\n")
+
+
+def write_manifest(source_dir):
+    """
+    Writes the manifest of the database files in the format of the download manifest.
+    """
+    manifest = {}
+    for filename, url in database_processing.url_dictionary.items():
+        source_filename = os.path.join(source_dir, os.path.basename(filename))
+        manifest[os.path.basename(filename)] = {'url': url, 'size': os.path.getsize(source_filename),
+                                                'sha256': database_processing.file_checksum(source_filename)}
+    manifest['kegg'] = {'filename': kegg_filename}
+
+    with open(os.path.join(source_dir, os.path.basename(database_processing.download_manifest_filename)), 'w') \
+            as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+
+def generate_sources(source_dir, compounds=2000, seed=0, merge_rate=0.1):
+    """
+    Generates the synthetic database files and their manifest.\n
+    :param source_dir: directory of the database files
+    :param compounds: number of compounds, and of reactions
+    :param seed: seed of the random generator
+    :param merge_rate: fraction of compounds linked to the MetaNetX ID of another compound
+    """
+    os.makedirs(source_dir, exist_ok=True)
+    rnd = random.Random(seed)
+    write_metabolite_files(rnd, generate_compounds(rnd, compounds, merge_rate), source_dir)
+    write_reaction_files(rnd, generate_reactions(rnd, compounds), source_dir)
+    write_manifest(source_dir)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    generate_sources(sys.argv[1], *[int(arg) for arg in sys.argv[2:4]],
+                     *[float(arg) for arg in sys.argv[4:5]])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+    Coroutines to use mergem from asyncio applications without blocking their event loop.
+    Models are loaded, saved, merged, and translated in an executor, and the mapping tables are updated
+    in a thread while the database files are downloaded asynchronously on the event loop.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from . import __database_processing, __model_handling
+from .__database_processing import log
+from .__merge_models import merge, translate
+from concurrent.futures import CancelledError
+from functools import partial
+from threading import Event
+from time import perf_counter
+import asyncio
+import os
+import ssl
+
+try:
+    import httpx
+except ImportError:  # database files are then downloaded in threads, as by update_id_mapper
+    httpx = None
+
+async_executor = None  # executor running the blocking work of the coroutines, or None for the default executor of the event loop
+
+
+async def merge_async(input_models, set_objective='merge', exact_sto=False, use_prot=False, extend_annot=False,
+                      trans_to_db=None, community_model=False, sources_table=False, near_duplicates=0,
+                      progress_callback=None, executor=None):
+    """
+    Merges models as merge does, running the merge in an executor so that the event loop is not blocked.
+    If the coroutine is cancelled while the models are merged, the merge cannot be interrupted,
+    and its result is discarded once it finishes.\n
+    :param input_models: list of cobra models or file names
+    :param set_objective: objective reaction from one of the models or merge (default) all model objectives
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used during merging
+    :param use_prot: Boolean to consider hydrogen and proton when merging reactions
+    :param extend_annot: Boolean to add additional metabolite and reaction annotations from mergem dictionaries
+    :param trans_to_db: target database to be translated to
+    :param community_model: Boolean to consider community metabolites when merging
+    :param sources_table: Boolean to return met & reac sources as tables with their presence matrices
+    :param near_duplicates: maximum number of metabolites by which near-duplicate reactions can differ
+    :param progress_callback: function called on the event loop with the record of each finished step
+    :param executor: executor running the merge instead of async_executor
+    :return: dictionary of results, as returned by merge
+    """
+    return await run_step('merge', partial(merge, input_models, set_objective, exact_sto, use_prot, extend_annot,
+                                           trans_to_db, community_model, sources_table, near_duplicates),
+                          {'models': len(input_models)}, progress_callback, executor)
+
+
+async def translate_async(input_model, trans_to_db=None, progress_callback=None, executor=None):
+    """
+    Translates metabolite and reaction IDs to a target namespace as translate does, in an executor.\n
+    :param input_model: a cobra model or file name
+    :param trans_to_db: target database to be translated to
+    :param progress_callback: function called on the event loop with the record of each finished step
+    :param executor: executor running the translation instead of async_executor
+    :return: model with translated metabolite and reaction IDs.
+    """
+    return await run_step('translate', partial(translate, input_model, trans_to_db),
+                          {'trans_to_db': trans_to_db}, progress_callback, executor)
+
+
+async def load_model_async(filename, progress_callback=None, executor=None):
+    """
+    Loads a model from the given filename/path in an executor.\n
+    :param filename: Name of file to load model from.
+    :param progress_callback: function called on the event loop with the record of each finished step
+    :param executor: executor loading the model instead of async_executor
+    :return: Cobra model loaded from file.
+    """
+    return await run_step('load_model', partial(__model_handling.load_model, filename),
+                          {'file': filename}, progress_callback, executor)
+
+
+async def save_model_async(cobra_model, file_name, progress_callback=None, executor=None):
+    """
+    Exports a cobra model as file_name in an executor.\n
+    :param cobra_model: cobra model to be saved.
+    :param file_name: filename with format extension to save model as.
+    :param progress_callback: function called on the event loop with the record of each finished step
+    :param executor: executor saving the model instead of async_executor
+    """
+    await run_step('save_model', partial(__model_handling.save_model, cobra_model, file_name),
+                   {'file': file_name}, progress_callback, executor)
+
+
+async def run_step(step_name, function, step_record, progress_callback, executor):
+    """
+    Runs a blocking step in an executor and reports its record with its wall time once it finishes.\n
+    :param step_name: name of the step
+    :param function: function running the step, without arguments
+    :param step_record: dictionary describing the step, reported with its name and wall time
+    :param progress_callback: function called with the record of the step, or None
+    :param executor: executor running the step, or None for async_executor
+    :return: result of the function
+    """
+    loop = asyncio.get_running_loop()
+    tic = perf_counter()
+    result = await loop.run_in_executor(executor or async_executor, function)
+    if progress_callback is not None:
+        progress_callback(dict(step_record, stage=step_name, wall_time=perf_counter() - tic))
+
+    return result
+
+
+async def update_id_mapper_async(delete_database_files=True, save_annotations=True, force=False, resume=False,
+                                 source_dir=None, progress_callback=None, executor=None):
+    """
+    Updates the mapping tables as update_id_mapper does, processing the database files in a thread of an executor
+    while the database files are downloaded asynchronously on the event loop, with httpx if it is installed.
+    If the coroutine is cancelled, the downloads are cancelled and the build stops before its next stage, and the
+    coroutine returns once the build thread has stopped, so the update can be continued later with resume=True.\n
+    :param delete_database_files: delete the downloaded database files after processing them
+    :param save_annotations: precompute and save the annotations of each universal id used to extend annotations
+    :param force: rebuild the mapping tables even if no database changed
+    :param resume: continue an interrupted update from its last checkpoint, without downloading the database files again
+    :param source_dir: build the mapping tables from a directory of database files instead of downloading them
+    :param progress_callback: function called on the event loop with the record of each downloaded database file
+            and each finished stage of the update, as saved in the build report
+    :param executor: thread executor running the update, or None for the default executor of the event loop
+    """
+    loop = asyncio.get_running_loop()
+    stop_event = Event()
+    downloads = []
+
+    def report_progress(record):
+        if progress_callback is not None:
+            try:
+                loop.call_soon_threadsafe(progress_callback, record)
+            except RuntimeError:  # the event loop was closed while the build was stopping
+                pass
+
+    def download_files(download_force):
+        if stop_event.is_set():
+            raise CancelledError("Update stopped before downloading the database files")
+
+        download = asyncio.run_coroutine_threadsafe(
+            download_database_files_async(download_force, report_progress), loop)
+        downloads.append(download)
+        return download.result()
+
+    update = partial(run_id_mapper_update, delete_database_files, save_annotations, force, resume, source_dir,
+                     download_files if httpx is not None else None, report_progress, stop_event)
+    update_future = loop.run_in_executor(executor, update)
+    try:
+        await asyncio.shield(update_future)
+    except asyncio.CancelledError:
+        stop_event.set()
+        for download in downloads:
+            download.cancel()
+        while not update_future.done():  # the build stops before its next stage, even if cancelled again
+            try:
+                await asyncio.shield(update_future)
+            except (CancelledError, asyncio.CancelledError):
+                pass
+        raise
+
+
+def run_id_mapper_update(delete_database_files, save_annotations, force, resume, source_dir, download_files,
+                         build_stage_callback, stop_event):
+    """
+    Updates the mapping tables, reporting each stage of the build and stopping it once the stop event is set.\n
+    :param download_files: function downloading the database files, or None to download them in threads
+    :param build_stage_callback: function called with the record of each finished stage
+    :param stop_event: threading.Event that stops the build before its next stage when set
+    """
+    force = force or not __model_handling.mapping_tables_exist()
+    id_mapping = __database_processing.build_id_mapping(delete_database_files, force, resume,
+                                                        source_dir=source_dir, download_files=download_files,
+                                                        build_stage_callback=build_stage_callback,
+                                                        stop_event=stop_event)
+    if id_mapping is not None:
+        __model_handling.save_id_mapping(id_mapping, save_annotations, build_stage_callback)
+
+
+async def download_database_files_async(force=False, progress_callback=None):
+    """
+    Downloads the database files concurrently on the event loop while checking for a KEGG update in a thread,
+    as download_database_files does.\n
+    :param force: download all files even if they have not changed
+    :param progress_callback: function called with the record of each downloaded database file
+    :return: True if any database changed since the last update or force is set, False otherwise
+    """
+    loop = asyncio.get_running_loop()
+    __database_processing.configure_https_verification()
+    last_manifest = {} if force else __database_processing.load_download_manifest()
+    url_dictionary = __database_processing.url_dictionary
+    download_slots = asyncio.Semaphore(__database_processing.max_download_workers)
+
+    async with httpx.AsyncClient(verify=ssl._create_default_https_context(), follow_redirects=True,
+                                 timeout=__database_processing.download_timeout) as client:
+        kegg_future = loop.run_in_executor(None, __database_processing.get_kegg_release_filename)
+        file_entries = await asyncio.gather(*[
+            download_database_file_async(client, download_slots, filename, url,
+                                         last_manifest.get(os.path.basename(filename)), progress_callback)
+            for filename, url in url_dictionary.items()])
+        file_entries = dict(zip(url_dictionary, file_entries))
+        kegg_filename = await kegg_future
+
+        if not __database_processing.check_database_changes(file_entries, kegg_filename, last_manifest, force):
+            return False
+
+        missing_filenames = [filename for filename in file_entries if not os.path.isfile(filename)]
+        kegg_future = loop.run_in_executor(None, __database_processing.download_kegg_release, kegg_filename)
+        missing_entries = await asyncio.gather(*[
+            download_database_file_async(client, download_slots, filename, url_dictionary[filename], None,
+                                         progress_callback)
+            for filename in missing_filenames])
+        file_entries.update(zip(missing_filenames, missing_entries))
+        await kegg_future
+
+    __database_processing.set_download_manifest(file_entries, kegg_filename)
+    return True
+
+
+async def download_database_file_async(client, download_slots, filename, url, manifest_entry=None,
+                                       progress_callback=None):
+    """
+    Downloads a database file as download_database_file does, decompressing it in a thread.\n
+    :param client: httpx.AsyncClient
+    :param download_slots: semaphore limiting the number of concurrent downloads
+    :param filename: name of file to save
+    :param url: url of file
+    :param manifest_entry: dictionary with url, etag, last modified date, size, and sha256 of last download
+    :param progress_callback: function called with the record of the downloaded file
+    :return: manifest entry of file, including if it changed since last download
+    """
+    loop = asyncio.get_running_loop()
+    tic = perf_counter()
+    async with download_slots:
+        log("Downloading " + filename)
+        file_stats = await download_file_async(client, url, filename,
+                                               __database_processing.get_conditional_headers(url, manifest_entry))
+
+    file_entry = await loop.run_in_executor(None, __database_processing.create_file_entry, filename, url,
+                                            manifest_entry, file_stats)
+    if file_entry is None:
+        return await download_database_file_async(client, download_slots, filename, url, None, progress_callback)
+
+    if progress_callback is not None:
+        progress_callback({'stage': 'download_database_file', 'file': os.path.basename(filename),
+                           'size': file_entry['size'], 'changed': file_entry['changed'],
+                           'wall_time': perf_counter() - tic})
+
+    return file_entry
+
+
+async def download_file_async(client, url, filename, headers=None):
+    """
+    Downloads a file as download_file does, into a partial file that is resumed with HTTP range requests
+    if the download fails, only if the file has not changed, and retrying failed downloads with exponential backoff.
+    The partial file is written in an executor, so that the event loop is not blocked.\n
+    :param client: httpx.AsyncClient
+    :param url: url of file
+    :param filename: name of file to save
+    :param headers: dictionary of additional request headers (e.g., conditional request headers)
+    :return: dictionary with size, sha256 checksum, etag, last modified date, download time, and number of attempts,
+             or None if the server replies that the file was not modified
+    """
+    loop = asyncio.get_running_loop()
+    partial_filename = filename + ".part"
+    etag, last_modified = None, None
+    tic = perf_counter()
+    attempt = 0
+
+    while True:
+        attempt += 1
+        downloaded_size, resume_headers, validators = await loop.run_in_executor(
+            None, __database_processing.get_resume_headers, partial_filename)
+
+        try:
+            async with client.stream('GET', url, headers=resume_headers or headers or {}) as r:
+                if r.status_code == 304:
+                    return None
+
+                if r.status_code >= 400:
+                    error = httpx.HTTPStatusError(f"{r.status_code} {r.reason_phrase}", request=r.request, response=r)
+                    if r.status_code == 416:  # partial file cannot be resumed
+                        await loop.run_in_executor(None, __database_processing.remove_partial_file, partial_filename)
+                    elif r.status_code < 500 and r.status_code != 429:
+                        raise error
+
+                else:
+                    resumed = await loop.run_in_executor(None, __database_processing.check_resumed_response,
+                                                         partial_filename, downloaded_size, r.status_code,
+                                                         r.headers.get('Content-Range'))
+                    expected_size = r.headers.get('Content-Length')
+                    if resumed:
+                        etag, last_modified = validators
+                    else:
+                        etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+                        await loop.run_in_executor(None, __database_processing.save_partial_validators,
+                                                   partial_filename, etag, last_modified)
+                    received_size = 0
+                    buffer = bytearray()  # data received is buffered, and kept if the download fails
+                    f = await loop.run_in_executor(None, open, partial_filename, 'ab' if resumed else 'wb')
+                    try:
+                        async for chunk in r.aiter_raw():
+                            buffer += chunk
+                            received_size += len(chunk)
+                            if len(buffer) >= __database_processing.download_chunk_size:
+                                await loop.run_in_executor(None, f.write, bytes(buffer))
+                                buffer.clear()
+                    finally:
+                        await loop.run_in_executor(None, write_and_close, f, bytes(buffer))
+
+                    if (expected_size is not None) and (received_size < int(expected_size)):
+                        raise ConnectionError(f"received {received_size} of {expected_size} bytes")
+                    break
+
+        except (httpx.TransportError, OSError) as e:  # connection errors and timeouts
+            error = e
+
+        if attempt > __database_processing.max_download_retries:
+            raise error
+
+        delay = __database_processing.download_retry_delay * 2 ** (attempt - 1)
+        log(f"Download of {filename} failed ({error}). Retrying in {delay} s")
+        await asyncio.sleep(delay)
+
+    toc = perf_counter()
+    await loop.run_in_executor(None, complete_download, partial_filename, filename)
+
+    return {'size': await loop.run_in_executor(None, os.path.getsize, filename),
+            'sha256': await loop.run_in_executor(None, __database_processing.file_checksum, filename),
+            'etag': etag,
+            'last_modified': last_modified,
+            'time': toc - tic,
+            'attempts': attempt}
+
+
+def write_and_close(file, data):
+    with file:
+        file.write(data)
+
+
+def complete_download(partial_filename, filename):
+    """
+    Replaces a file with its completely downloaded partial file, removing the validators saved with it.\n
+    :param partial_filename: name of partial file
+    :param filename: name of file
+    """
+    os.replace(partial_filename, filename)
+    __database_processing.remove_partial_file(partial_filename)
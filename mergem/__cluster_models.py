@@ -0,0 +1,294 @@
+"""
+    Clusters models by the Jaccard distances of their reactions or metabolites in mergem namespace,
+    with hierarchical clustering, to group related models and order them for merging.
+    Models are reduced to the codes of their reactions or metabolites one at a time, and the distances are
+    computed in blocks of shared reactions or metabolites, so that thousands of models can be clustered.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from . import __model_handling
+from .__merge_models import map_metabolite_to_mergem_id, create_reaction_key
+import numpy as np
+
+feature_block_size = 4096  # reactions or metabolites in each block of the distance computation
+linkage_methods = ['single', 'complete', 'average', 'weighted']
+
+
+def cluster_models(input_models, num_clusters=None, distance_threshold=None, method='average',
+                   cluster_by='reactions', exact_sto=False, use_prot=False):
+    """
+    Takes a list of cobra models or file names as input and clusters them hierarchically by the Jaccard distances of
+    their reactions or metabolites, compared as when merging them. Models given as file names are loaded one at a time,
+    so that only their reactions or metabolites are kept in memory.\n
+    :param input_models: list of cobra models or file names
+    :param num_clusters: number of clusters of the cluster assignments
+    :param distance_threshold: maximum distance between models merged in the same cluster, if num_clusters is not set
+    :param method: linkage method between clusters ('single', 'complete', 'average', or 'weighted')
+    :param cluster_by: compare the 'reactions' or 'metabolites' of the models
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used to compare reactions
+    :param use_prot: Boolean to consider hydrogen and proton when comparing reactions
+    :return: a dictionary of the model ids, the matrix of Jaccard distances, the linkage matrix,
+            the suggested merge order, and the cluster assignments.
+    """
+    if method not in linkage_methods:
+        raise ValueError(f"Invalid linkage method {method}, expected one of {', '.join(linkage_methods)}")
+    if cluster_by not in ['reactions', 'metabolites']:
+        raise ValueError(f"Invalid cluster_by {cluster_by}, expected 'reactions' or 'metabolites'")
+
+    __model_handling.load_met_univ_id_dict()
+
+    model_ids, model_features, feature_codes = [], [], {}
+    for input_model in input_models:
+        if isinstance(input_model, str):
+            try:
+                model = __model_handling.load_model(input_model)
+            except Exception as e:
+                print("Error loading model: ", e)
+                continue
+        else:
+            model = input_model
+
+        model_ids.append(model.id or str(input_model))
+        if cluster_by == 'reactions':
+            model_features.append(get_reaction_codes(model, feature_codes, exact_sto, use_prot))
+        else:
+            model_features.append(get_metabolite_codes(model, feature_codes))
+
+    if not model_ids:
+        raise ValueError("No models to cluster")
+
+    distances = compute_jaccard_distances(model_features, len(feature_codes))
+    linkage = compute_linkage(distances.copy(), method)
+
+    if num_clusters is not None:
+        clusters = get_clusters(linkage, num_clusters=num_clusters)
+    elif distance_threshold is not None:
+        clusters = get_clusters(linkage, distance_threshold=distance_threshold)
+    else:
+        clusters = None
+
+    results = {}
+    results['model_ids'] = model_ids
+    results['jacc_distances'] = distances
+    results['linkage'] = linkage
+    results['merge_order'] = get_leaf_order(linkage)
+    results['clusters'] = clusters
+
+    return results
+
+
+def get_metabolite_codes(model, feature_codes):
+    """
+    Returns the codes of the metabolites of a model, identified by their mergem id or their id if not mapped.\n
+    :param model: cobra model
+    :param feature_codes: dictionary of codes of metabolites, extended with new metabolites
+    :return: array of unique metabolite codes
+    """
+    codes = set()
+    for metabolite in model.metabolites:
+        met_id = map_metabolite_to_mergem_id(metabolite) or metabolite.id
+        codes.add(feature_codes.setdefault(met_id, len(feature_codes)))
+
+    return np.fromiter(codes, dtype=np.int64, count=len(codes))
+
+
+def get_reaction_codes(model, feature_codes, exact_sto, use_prot):
+    """
+    Returns the codes of the reactions of a model except its objective reactions, identified by their reaction key
+    as when merging, so that reactions are the same as reactions of other models with the same or reverse key.\n
+    :param model: cobra model
+    :param feature_codes: dictionary of codes of reaction keys, extended with new reactions
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used
+    :param use_prot: Boolean to consider hydrogen and proton
+    :return: array of unique reaction codes
+    """
+    objective_expression = str(model.objective)
+    codes = set()
+    for reaction in model.reactions:
+        if reaction.id in objective_expression:
+            continue
+
+        reaction_key, rev_reaction_key = create_reaction_key(reaction, exact_sto, use_prot)
+        code = feature_codes.get(reaction_key)
+        if code is None:
+            code = feature_codes.get(rev_reaction_key)
+            if code is None:
+                code = feature_codes[reaction_key] = len(feature_codes)
+        codes.add(code)
+
+    return np.fromiter(codes, dtype=np.int64, count=len(codes))
+
+
+def compute_jaccard_distances(model_features, num_features):
+    """
+    Computes the Jaccard distances between the sets of reactions or metabolites of models.
+    The intersections are counted with matrix products of blocks of the reactions or metabolites found in more
+    than one model, so that only a block of the presence matrix is kept in memory.\n
+    :param model_features: list of arrays of unique reaction or metabolite codes of each model
+    :param num_features: number of reaction or metabolite codes
+    :return: matrix of Jaccard distances between models
+    """
+    num_models = len(model_features)
+    sizes = np.array([len(features) for features in model_features], dtype=np.float32)
+    model_indexes = np.repeat(np.arange(num_models), [len(features) for features in model_features])
+    features = np.concatenate(model_features) if num_models else np.zeros(0, dtype=np.int64)
+
+    # Reactions or metabolites of a single model add to its size but never to an intersection
+    feature_counts = np.bincount(features, minlength=num_features)
+    shared_codes = np.cumsum(feature_counts > 1) - 1
+    is_shared = feature_counts[features] > 1
+    model_indexes, features = model_indexes[is_shared], shared_codes[features[is_shared]]
+
+    feature_order = np.argsort(features, kind='stable')
+    model_indexes, features = model_indexes[feature_order], features[feature_order]
+    num_shared_features = int(shared_codes[-1]) + 1 if num_features else 0
+
+    intersections = np.zeros((num_models, num_models), dtype=np.float32)
+    for block_start in range(0, num_shared_features, feature_block_size):
+        start, end = np.searchsorted(features, [block_start, block_start + feature_block_size])
+        presence = np.zeros((num_models, feature_block_size), dtype=np.float32)
+        presence[model_indexes[start:end], features[start:end] - block_start] = 1
+        for row_start in range(0, num_models, feature_block_size):
+            intersections[row_start:row_start + feature_block_size] += \
+                presence[row_start:row_start + feature_block_size] @ presence.T
+
+    # Distances computed in place of the intersections, a block of rows at a time
+    distances = intersections
+    for row_start in range(0, num_models, feature_block_size):
+        rows = distances[row_start:row_start + feature_block_size]
+        unions = sizes[row_start:row_start + feature_block_size, None] + sizes[None, :] - rows
+        np.divide(rows, unions, out=rows, where=unions > 0)
+        rows[unions == 0] = 1
+        np.subtract(1, rows, out=rows)
+    np.fill_diagonal(distances, 0)
+
+    return distances
+
+
+def compute_linkage(distances, method):
+    """
+    Clusters models hierarchically with the nearest-neighbor chain algorithm, which merges pairs of clusters
+    that are nearest neighbors of each other in quadratic time, updating the distances with the Lance-Williams formula.
+    The distance matrix is overwritten.\n
+    :param distances: square matrix of distances between models
+    :param method: linkage method between clusters ('single', 'complete', 'average', or 'weighted')
+    :return: linkage matrix with a row for each merge, in increasing distance, with the two merged clusters,
+            their distance, and the number of models of the new cluster. Clusters are numbered as in SciPy,
+            with the models as clusters 0 to n-1 and the cluster of each row i numbered n+i.
+    """
+    num_models = len(distances)
+    np.fill_diagonal(distances, np.inf)
+    cluster_sizes = np.ones(num_models)
+    active = np.ones(num_models, dtype=bool)
+    merges = []
+    chain = []
+    while len(merges) < num_models - 1:
+        if not chain:
+            chain.append(int(np.argmax(active)))
+
+        cluster = chain[-1]
+        row = distances[cluster]
+        neighbor = int(np.argmin(row))
+        # Ties are broken towards the previous cluster of the chain, so that the chain always ends
+        if len(chain) > 1 and row[chain[-2]] <= row[neighbor]:
+            neighbor = chain[-2]
+
+        if len(chain) == 1 or neighbor != chain[-2]:
+            chain.append(neighbor)
+            continue
+
+        chain = chain[:-2]
+        distance = float(row[neighbor])
+        merges.append((cluster, neighbor, distance))
+
+        # The merged cluster takes the place of the neighbor
+        if method == 'single':
+            new_distances = np.minimum(distances[cluster], distances[neighbor])
+        elif method == 'complete':
+            new_distances = np.maximum(distances[cluster], distances[neighbor])
+        elif method == 'average':
+            new_distances = (cluster_sizes[cluster] * distances[cluster] + cluster_sizes[neighbor] *
+                             distances[neighbor]) / (cluster_sizes[cluster] + cluster_sizes[neighbor])
+        else:
+            new_distances = (distances[cluster] + distances[neighbor]) / 2
+
+        new_distances[~active] = np.inf
+        new_distances[[cluster, neighbor]] = np.inf
+        distances[neighbor], distances[:, neighbor] = new_distances, new_distances
+        distances[cluster], distances[:, cluster] = np.inf, np.inf
+        cluster_sizes[neighbor] += cluster_sizes[cluster]
+        active[cluster] = False
+
+    # Merges relabeled in increasing distance, with the current cluster of each model found in a disjoint-set forest
+    linkage = np.zeros((max(num_models - 1, 0), 4))
+    parents = list(range(2 * num_models - 1))
+    sizes = [1] * (2 * num_models - 1)
+
+    def find(cluster):
+        while parents[cluster] != cluster:
+            parents[cluster] = parents[parents[cluster]]
+            cluster = parents[cluster]
+        return cluster
+
+    for row, merge_index in enumerate(sorted(range(len(merges)), key=lambda index: merges[index][2])):
+        cluster, neighbor, distance = merges[merge_index]
+        cluster, neighbor = sorted([find(cluster), find(neighbor)])
+        new_cluster = num_models + row
+        parents[cluster] = parents[neighbor] = new_cluster
+        sizes[new_cluster] = sizes[cluster] + sizes[neighbor]
+        linkage[row] = [cluster, neighbor, distance, sizes[new_cluster]]
+
+    return linkage
+
+
+def get_leaf_order(linkage):
+    """
+    Returns the order of the models in the dendrogram of a linkage, with the models of each cluster next to each other,
+    which is the suggested order to merge them.\n
+    :param linkage: linkage matrix
+    :return: list of model indexes
+    """
+    num_models = len(linkage) + 1
+    order = []
+    clusters = [2 * num_models - 2]
+    while clusters:
+        cluster = clusters.pop()
+        if cluster < num_models:
+            order.append(cluster)
+        else:
+            row = linkage[cluster - num_models]
+            clusters += [int(row[1]), int(row[0])]
+
+    return order
+
+
+def get_clusters(linkage, num_clusters=None, distance_threshold=None):
+    """
+    Returns the cluster of each model after the merges of a linkage up to a number of clusters or a distance.\n
+    :param linkage: linkage matrix
+    :param num_clusters: number of clusters
+    :param distance_threshold: maximum distance of the merges, if num_clusters is not set
+    :return: list of the cluster number of each model, numbered from 1 in the suggested merge order
+    """
+    num_models = len(linkage) + 1
+    if num_clusters is not None:
+        num_merges = num_models - min(max(num_clusters, 1), num_models)
+    else:
+        num_merges = int(np.searchsorted(linkage[:, 2], distance_threshold, side='right'))
+
+    parents = list(range(2 * num_models - 1))
+    for row in range(num_merges):
+        parents[int(linkage[row, 0])] = parents[int(linkage[row, 1])] = num_models + row
+
+    def find(cluster):
+        while parents[cluster] != cluster:
+            parents[cluster] = parents[parents[cluster]]
+            cluster = parents[cluster]
+        return cluster
+
+    cluster_numbers, clusters = {}, [0] * num_models
+    for model_index in get_leaf_order(linkage):
+        clusters[model_index] = cluster_numbers.setdefault(find(model_index), len(cluster_numbers) + 1)
+
+    return clusters
@@ -0,0 +1,282 @@
+"""
+    Compact representation of the ID mapping tables, which keeps their strings in byte buffers and their integers
+    in arrays instead of millions of Python objects, so that every process loading the tables uses less memory.
+    The tables are read-only mappings with the same keys, values, and order as the dictionaries they represent.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from array import array
+from collections.abc import ItemsView, Mapping, ValuesView
+from itertools import accumulate
+from zlib import crc32
+
+
+def unsigned_array(values):
+    """
+    Returns an array of non-negative integers, with four bytes per integer if they all fit.
+    """
+    values = list(values)
+    return array('I' if max(values, default=0) < 2 ** 32 else 'Q', values)
+
+
+class StringColumn:
+    """
+    Strings concatenated in a single UTF-8 buffer, with the offset of each string in an array.
+    """
+    def __init__(self, strings):
+        encoded_strings = [string.encode(errors='surrogatepass') for string in strings]
+        self.buffer = b"".join(encoded_strings)
+        self.offsets = unsigned_array(accumulate(map(len, encoded_strings), initial=0))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.get_bytes(index).decode(errors='surrogatepass')
+
+    def get_bytes(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+
+class ValueColumn:
+    """
+    Values of a property of all univ IDs, as strings in a StringColumn.
+    Database IDs can be split into the code of their interned database name and their ID in the database.
+    Values that are not strings, such as integer masses, are kept as they are.
+    """
+    max_prefix_codes = 2 ** 16
+
+    def __init__(self, values, intern_prefixes=False):
+        self.prefixes = [''] if intern_prefixes else None
+        self.prefix_codes = array('H') if intern_prefixes else None
+        self.other_values = {}
+        prefix_codes = {}
+
+        strings = []
+        for index, value in enumerate(values):
+            if not isinstance(value, str):
+                self.other_values[index] = value
+                value = ''
+
+            if intern_prefixes:
+                prefix, separator, db_id = value.partition(':')
+                if separator and (prefix not in prefix_codes) and (len(self.prefixes) < self.max_prefix_codes):
+                    prefix_codes[prefix] = len(self.prefixes)
+                    self.prefixes.append(prefix + ':')
+
+                prefix_code = prefix_codes.get(prefix, 0) if separator else 0
+                if prefix_code:
+                    value = db_id
+                self.prefix_codes.append(prefix_code)
+
+            strings.append(value)
+
+        self.strings = StringColumn(strings)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, index):
+        if index in self.other_values:
+            return self.other_values[index]
+
+        if self.prefix_codes is None:
+            return self.strings[index]
+
+        return self.prefixes[self.prefix_codes[index]] + self.strings[index]
+
+    def get_values(self, start, end):
+        """
+        Returns the list of values from index start to index end.
+        """
+        buffer, offsets = self.strings.buffer, self.strings.offsets
+        values = [buffer[offsets[index]:offsets[index + 1]].decode(errors='surrogatepass')
+                  for index in range(start, end)]
+        if self.prefix_codes is not None:
+            prefixes = self.prefixes
+            values = [prefixes[prefix_code] + value for prefix_code, value in zip(self.prefix_codes[start:end], values)]
+        if self.other_values:
+            for index in range(start, end):
+                if index in self.other_values:
+                    values[index - start] = self.other_values[index]
+
+        return values
+
+
+class CompactIdMapper(Mapping):
+    """
+    Read-only mapping of database IDs to univ IDs, with the IDs in a StringColumn and their univ IDs in an array.
+    The IDs are kept whole, since the IDs of the mapping tables have no database prefix to intern.
+    IDs are looked up in an open-addressing hash table of their indexes, half empty so that lookups probe few slots.
+    The hash table uses CRC-32 since the hashes of Python strings change between processes.
+    """
+    def __init__(self, id_mapper):
+        self.db_ids = StringColumn(id_mapper)
+        self.univ_ids = unsigned_array(id_mapper.values())
+
+        # Each slot has the index of an ID plus one, or zero if empty
+        slot_count = 2 * len(self.db_ids) + 1
+        self.slots = array('I' if slot_count < 2 ** 32 else 'Q', [0]) * slot_count
+        for index in range(len(self.db_ids)):
+            slot = crc32(self.db_ids.get_bytes(index)) % slot_count
+            while self.slots[slot]:
+                slot = (slot + 1) % slot_count
+            self.slots[slot] = index + 1
+
+    def find_index(self, db_id):
+        """
+        Returns the index of a database ID, or None if it is not mapped.
+        """
+        if not isinstance(db_id, str):
+            return None
+
+        encoded_id = db_id.encode(errors='surrogatepass')
+        slot = crc32(encoded_id) % len(self.slots)
+        while index := self.slots[slot]:
+            if self.db_ids.get_bytes(index - 1) == encoded_id:
+                return index - 1
+            slot = (slot + 1) % len(self.slots)
+
+        return None
+
+    def __getitem__(self, db_id):
+        index = self.find_index(db_id)
+        if index is None:
+            raise KeyError(db_id)
+
+        return self.univ_ids[index]
+
+    def __contains__(self, db_id):
+        return self.find_index(db_id) is not None
+
+    def __iter__(self):
+        return (self.db_ids[index] for index in range(len(self.db_ids)))
+
+    def __len__(self):
+        return len(self.univ_ids)
+
+    def items(self):
+        return CompactItemsView(self)
+
+    def values(self):
+        return CompactValuesView(self)
+
+    def value_iter(self):
+        return iter(self.univ_ids)
+
+
+class CompactPropertyTable(Mapping):
+    """
+    Read-only mapping of univ IDs to their properties, dictionaries of lists of values.
+    The values of each property are kept in a ValueColumn, with the start of the values of each univ ID in an array,
+    and the property names of each univ ID are kept as a code of their interned tuple.
+    Decoded properties are cached, so looking up a univ ID again returns the same dictionary, as the dictionaries of
+    the mapping tables do, and the cache is emptied when it reaches max_cached_rows.
+    """
+    max_cached_rows = 2 ** 16
+
+    def __init__(self, prop_dict):
+        self.cached_rows = {}
+        self.univ_ids = unsigned_array(prop_dict)
+        self.rows = array('i', [-1]) * (max(self.univ_ids, default=-1) + 1)
+        for row, univ_id in enumerate(self.univ_ids):
+            self.rows[univ_id] = row
+
+        self.property_names = []
+        property_name_codes = {}
+        self.row_property_names = array('H')
+        for properties in prop_dict.values():
+            names = tuple(properties)
+            names_code = property_name_codes.get(names)
+            if names_code is None:
+                names_code = property_name_codes[names] = len(self.property_names)
+                self.property_names.append(names)
+            self.row_property_names.append(names_code)
+
+        self.columns, self.column_starts = {}, {}
+        for name in dict.fromkeys(name for names in self.property_names for name in names):
+            self.columns[name] = ValueColumn((value for properties in prop_dict.values()
+                                              for value in properties.get(name, ())), intern_prefixes=(name == 'ids'))
+            self.column_starts[name] = unsigned_array(accumulate((len(properties.get(name, ()))
+                                                                  for properties in prop_dict.values()), initial=0))
+
+    def find_row(self, univ_id):
+        """
+        Returns the row of a univ ID, or None if it has no properties.
+        """
+        if (not isinstance(univ_id, int)) or (univ_id < 0) or (univ_id >= len(self.rows)) or (self.rows[univ_id] < 0):
+            return None
+
+        return self.rows[univ_id]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['cached_rows'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cached_rows = {}
+
+    def __getitem__(self, univ_id):
+        properties = self.cached_rows.get(univ_id)
+        if properties is not None:
+            return properties
+
+        row = self.find_row(univ_id)
+        if row is None:
+            raise KeyError(univ_id)
+
+        properties = self.decode_row(row)
+        if len(self.cached_rows) >= self.max_cached_rows:
+            self.cached_rows.clear()
+        self.cached_rows[univ_id] = properties
+
+        return properties
+
+    def decode_row(self, row):
+        """
+        Returns the properties of the univ ID of a row.
+        """
+        properties = {}
+        for name in self.property_names[self.row_property_names[row]]:
+            starts = self.column_starts[name]
+            properties[name] = self.columns[name].get_values(starts[row], starts[row + 1])
+
+        return properties
+
+    def __contains__(self, univ_id):
+        return self.find_row(univ_id) is not None
+
+    def __iter__(self):
+        return iter(self.univ_ids)
+
+    def __len__(self):
+        return len(self.univ_ids)
+
+    def items(self):
+        return CompactItemsView(self)
+
+    def values(self):
+        return CompactValuesView(self)
+
+    def value_iter(self):
+        # Rows are decoded without caching them, so that iterating the table does not replace the cached rows
+        return (self.cached_rows.get(univ_id) or self.decode_row(row) for row, univ_id in enumerate(self.univ_ids))
+
+
+class CompactItemsView(ItemsView):
+    """
+    Items of a compact table, iterated without looking up each key.
+    """
+    def __iter__(self):
+        return zip(self._mapping, self._mapping.value_iter())
+
+
+class CompactValuesView(ValuesView):
+    """
+    Values of a compact table, iterated without looking up each key.
+    """
+    def __iter__(self):
+        return self._mapping.value_iter()
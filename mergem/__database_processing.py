@@ -6,20 +6,40 @@
 """
 
 import urllib.request
+import urllib.error
+import http.client
 import shutil
-from contextlib import closing
+from collections import Counter, deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from functools import partial
 from datetime import datetime
 from gzip import open as gzip_open
-from sys import maxsize
-from time import perf_counter
+from hashlib import sha256
+from itertools import islice
+from sys import maxsize, platform
+from threading import Lock, local
+from time import perf_counter, process_time, sleep
 from pickle import dump, load
+import gc
+import io
+import json
 import os
 import requests
 import ssl
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 curr_dir = os.path.dirname(__file__)
 files_dir = os.path.join(curr_dir, "downloads/")
 log_dir = os.path.join(curr_dir, "logs/")
+download_manifest_filename = os.path.join(curr_dir, "data", "downloadManifest.json")
+checkpoints_dir = files_dir + "checkpoints/"  # build state after stages of the last build
+build_checkpoints_filename = "buildCheckpoints.json"
 
 # Database URLs
 modelSeed_met_url = "https://raw.githubusercontent.com/ModelSEED/ModelSEEDDatabase/master/Biochemistry/compounds.tsv"
@@ -82,6 +102,43 @@ url_dictionary_chebi = {chebi_compounds_filename: chebi_compounds_zipped_filenam
                         chebi_compound_structure_filename: chebi_compound_st_zipped_filename
                         }
 
+# Paths in the directory of the database files, which set_files_dir moves
+files_dir_variables = ['checkpoints_dir',
+                       'ms_met_filename', 'ms_met_aliases_filename', 'mx_chem_prop_filename', 'mx_met_xref_filename',
+                       'mx_met_depr_filename', 'bigg_metabolites_filename', 'kegg_metabolites_filename',
+                       'chebi_compound_st_zipped_filename', 'chebi_compound_structure_filename',
+                       'chebi_compounds_zipped_filename', 'chebi_compounds_filename',
+                       'ms_reac_filename', 'ms_reac_aliases_filename', 'ms_reac_pathways_filename',
+                       'mx_reac_prop_filename', 'mx_reac_xref_filename', 'bigg_reactions_filename']
+
+# Download settings
+max_download_workers = 4
+max_download_retries = 5
+download_retry_delay = 2  # seconds, doubled after each failed attempt
+download_timeout = 300  # seconds without receiving data
+download_chunk_size = 1024 * 1024
+
+# KEGG API settings
+kegg_api_url = "http://rest.kegg.jp"
+kegg_batch_size = 10  # maximum number of entries per get request
+max_kegg_workers = 3
+kegg_requests_per_second = 3
+kegg_checkpoint_interval = 100  # batches between checkpoints
+
+# Parse settings
+max_parse_workers = min(4, os.cpu_count() or 1)  # processes parsing files ahead, or 1 to parse them in order
+parse_chunk_size = 16 * 1024 * 1024  # bytes of a database file parsed by each task
+use_columnar_readers = True  # parse the MetaNetX xref files with their columnar readers
+row_batch_size = 100000  # rows filtered and mapped together by columnar readers
+
+# Build checkpoint settings
+build_checkpoint_interval = 600  # seconds of processing between checkpoints of the build state
+checkpoint_stages = ['resolve_metabolites', 'resolve_reactions']  # stages always checkpointed
+
+# Build report settings
+trace_build_memory = False  # also report the peak memory traced by tracemalloc in each stage, which slows the build
+log_buffer_size = 100  # log messages buffered before writing them to the log file
+
 # Dictionaries
 met_univ_id_dict = {}
 met_univ_id_prop_dict = {}
@@ -89,18 +146,161 @@ reac_univ_id_dict = {}
 reac_univ_id_prop_dict = {}
 list_primary_ids = set()
 met_last_univ_id, reac_last_univ_id = 0, 0
+# Disjoint-set forests of univ ids: parent of each univ id, size of each set and lowest univ id of each set
+met_univ_id_parents, reac_univ_id_parents = [0], [0]
+met_univ_id_sizes, reac_univ_id_sizes = [0], [0]
+met_univ_id_labels, reac_univ_id_labels = [0], [0]
+# Merged univ ids whose properties are replayed into the lowest univ id after processing
+met_univ_id_merges, reac_univ_id_merges = {}, {}
+met_repeated_ids = {}
+# Databases of the ids of each metabolite univ id
+met_univ_id_databases = {}
+build_state_variables = ['met_univ_id_dict', 'met_univ_id_prop_dict', 'reac_univ_id_dict', 'reac_univ_id_prop_dict',
+                         'met_last_univ_id', 'reac_last_univ_id',
+                         'met_univ_id_parents', 'reac_univ_id_parents', 'met_univ_id_sizes', 'reac_univ_id_sizes',
+                         'met_univ_id_labels', 'reac_univ_id_labels', 'met_univ_id_merges', 'reac_univ_id_merges',
+                         'met_repeated_ids', 'met_univ_id_databases']
 start_time = datetime.now().strftime("%Y%m%d_%HH%MM")
+download_manifest = {}
 primary_dbs = ['seed', 'metanetx', 'bigg', 'kegg', 'chebi']
+# MetaNetX cross-reference prefixes without a database name before a dot that are not mapped
+metanetx_chem_xref_skipped_dbs = {"keggC", "envipathM", "envipath", "seedM", "CHEBI", "biggM", "keggD", "SLM", "keggE",
+                                  "keggG", "reactomeM", "sabiorkM", "rheaP", "rheaG", "lipidmapsM", "metacycM"}
+invalid_property_values = {'\'\'', '\"\"', 'null', '-', ''}
+log_lock = Lock()
+log_buffer = []
+build_report = []
+kegg_sessions = local()
+build_progress = local()  # stage callback and stop event of the build running in each thread
+kegg_request_lock = Lock()
+next_kegg_request_time = 0
 
 
 def log(message):
     dt_string = datetime.now().strftime("%Y%m%d_%H:%M:%S")
     log_line = dt_string + " " + message
-    print(log_line)
-    log_file = open(log_dir + start_time + "_DatabasesDownloadLog.txt", "a")
+    with log_lock:
+        print(log_line)
+        log_buffer.append(log_line + "\n")
+        if len(log_buffer) >= log_buffer_size:
+            write_log_buffer()
+
+
+def flush_log():
+    """
+    Writes the buffered log messages to the log file.
+    """
+    with log_lock:
+        write_log_buffer()
+
+
+def write_log_buffer():
+    if log_buffer:
+        with open(log_dir + start_time + "_DatabasesDownloadLog.txt", "a") as log_file:
+            log_file.writelines(log_buffer)
+        log_buffer.clear()
+
+
+@contextmanager
+def report_build_stage(stage_name):
+    """
+    Measures a stage of the build and adds its record to the build report, which is saved after each stage.
+    The record has the wall and CPU time of the stage, the peak memory of the build process,
+    the rows read by the stage, and the number of IDs and univ IDs after the stage and added, or merged
+    (or removed), by the stage.\n
+    :param stage_name: name of the stage
+    :return: record of the stage, where the rows read by the stage are counted
+    """
+    start_id_counts = get_id_counts()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    stage_record = {'stage': stage_name, 'rows_read': 0}
+    start_wall_time, start_cpu_time = perf_counter(), process_time()
+
+    yield stage_record
+
+    stage_record['wall_time'] = perf_counter() - start_wall_time
+    stage_record['cpu_time'] = process_time() - start_cpu_time
+    stage_record['peak_rss_mb'] = get_peak_rss()
+    stage_record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20 if tracemalloc.is_tracing() else None
+
+    id_counts = get_id_counts()
+    for mapping in ('met', 'reac'):
+        ids, univ_ids, last_univ_id = id_counts[mapping]
+        start_ids, start_univ_ids, start_last_univ_id = start_id_counts[mapping]
+        stage_record[mapping] = {'ids': ids, 'univ_ids': univ_ids, 'ids_added': ids - start_ids,
+                                 'univ_ids_added': last_univ_id - start_last_univ_id,
+                                 'univ_ids_merged': (last_univ_id - start_last_univ_id) - (univ_ids - start_univ_ids)}
+
+    build_report.append(stage_record)
+    log(f"Stage {stage_name} finished in {stage_record['wall_time']:0.1f} s")
+    save_build_report()
+    build_stage_callback = getattr(build_progress, 'stage_callback', None)
+    if build_stage_callback is not None:
+        build_stage_callback(stage_record)
+
+
+@contextmanager
+def report_build_progress(build_stage_callback=None, stop_event=None):
+    """
+    Sets the function called with the record of each finished stage and the event stopping the build
+    for the builds and saves of mapping tables run in this thread, restoring the previous ones afterwards.\n
+    :param build_stage_callback: function called with the record of each stage when it finishes, or None
+    :param stop_event: threading.Event that stops the build before its next stage when set, or None
+    """
+    previous_progress = (getattr(build_progress, 'stage_callback', None), getattr(build_progress, 'stop_event', None))
+    build_progress.stage_callback, build_progress.stop_event = build_stage_callback, stop_event
+    try:
+        yield
+    finally:
+        build_progress.stage_callback, build_progress.stop_event = previous_progress
+
+
+def get_id_counts():
+    """
+    Returns the number of IDs, the number of univ IDs, and the last univ ID of the metabolite and reaction mappings.
+    """
+    return {'met': (len(met_univ_id_dict), len(met_univ_id_prop_dict), met_last_univ_id),
+            'reac': (len(reac_univ_id_dict), len(reac_univ_id_prop_dict), reac_last_univ_id)}
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident set size of the build process in MB, or None if it is not available.
+    """
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / 2 ** 20 if platform == 'darwin' else peak_rss / 2 ** 10  # bytes on macOS, KB on Linux
+
 
-    log_file.write(log_line + "\n")
-    log_file.close()
+def save_build_report():
+    """
+    Saves the records of the build stages as a JSON report in the log directory, and writes the buffered log messages.
+    """
+    with open(log_dir + start_time + "_BuildReport.json", "w") as file:
+        json.dump(build_report, file, indent=2)
+
+    flush_log()
+
+
+def set_files_dir(directory):
+    """
+    Sets the directory of the database files, with the build checkpoints,
+    instead of the downloads directory of the package.\n
+    :param directory: directory of database files
+    """
+    global files_dir, url_dictionary, url_dictionary_chebi
+    directory = os.path.join(directory, "")
+    module_variables = globals()
+    for name in files_dir_variables:
+        module_variables[name] = directory + module_variables[name][len(files_dir):]
+
+    url_dictionary = {directory + filename[len(files_dir):]: url for filename, url in url_dictionary.items()}
+    url_dictionary_chebi = {directory + filename[len(files_dir):]: directory + zipped_filename[len(files_dir):]
+                            for filename, zipped_filename in url_dictionary_chebi.items()}
+    files_dir = directory
 
 
 def create_directories():
@@ -111,27 +311,414 @@ def create_directories():
         os.makedirs(log_dir)
 
 
-def download_database_files():
-    global kegg_metabolites_filename
+def download_database_files(force=False):
+    """
+    Downloads the database files in parallel while checking for a KEGG update.
+    Files listed in the download manifest of the last update are requested conditionally,
+    and unchanged files are only downloaded again if a rebuild is needed and they were deleted.
+    ChEBI files are decompressed as soon as they are downloaded.\n
+    :param force: download all files even if they have not changed
+    :return: True if any database changed since the last update or force is set, False otherwise
+    """
+    configure_https_verification()
+    last_manifest = {} if force else load_download_manifest()
+
+    with ThreadPoolExecutor(max_workers=max_download_workers) as executor:
+        kegg_future = executor.submit(get_kegg_release_filename)
+        download_futures = {filename: executor.submit(download_database_file, filename, url,
+                                                      last_manifest.get(os.path.basename(filename)))
+                            for filename, url in url_dictionary.items()}
+
+        file_entries = {filename: future.result() for filename, future in download_futures.items()}
+        kegg_filename = kegg_future.result()
+
+    if not check_database_changes(file_entries, kegg_filename, last_manifest, force):
+        return False
+
+    missing_filenames = [filename for filename in file_entries if not os.path.isfile(filename)]
+    with ThreadPoolExecutor(max_workers=max_download_workers) as executor:
+        kegg_future = executor.submit(download_kegg_release, kegg_filename)
+        download_futures = {filename: executor.submit(download_database_file, filename, url_dictionary[filename], None)
+                            for filename in missing_filenames}
+
+        for filename, future in download_futures.items():
+            file_entries[filename] = future.result()
+        kegg_future.result()
+
+    set_download_manifest(file_entries, kegg_filename)
+    return True
+
+
+def configure_https_verification():
+    """
+    Disables the verification of HTTPS certificates for downloads unless PYTHONHTTPSVERIFY is set.
+    """
     if (not os.environ.get('PYTHONHTTPSVERIFY', '') and
             getattr(ssl, '_create_unverified_context', None)):
         ssl._create_default_https_context = ssl._create_unverified_context
 
-    for filename in url_dictionary.keys():
-        log("Downloading " + filename)
-        url = url_dictionary[filename]
-        with closing(urllib.request.urlopen(url)) as r:
-            with open(filename, 'wb') as f:
-                shutil.copyfileobj(r, f)
 
-        log(filename + " downloaded.")
+def check_database_changes(file_entries, kegg_filename, last_manifest, force=False):
+    """
+    Checks if any database file or the KEGG release changed since the last update.\n
+    :param file_entries: dictionary of the manifest entry of each downloaded database file
+    :param kegg_filename: name of the file of the current KEGG release
+    :param last_manifest: download manifest of the last update
+    :param force: use all files even if they have not changed
+    :return: True if any database changed since the last update or force is set, False otherwise
+    """
+    changed_filenames = [filename for filename, entry in file_entries.items() if entry['changed']]
+    kegg_changed = last_manifest.get('kegg', {}).get('filename') != kegg_filename
+    if kegg_changed:
+        changed_filenames.append(kegg_filename)
+
+    if not (force or changed_filenames):
+        log("No database changes since the last update")
+        return False
+
+    log("Changed database files: " + ", ".join(os.path.basename(filename) for filename in changed_filenames))
+    return True
+
 
-    for filename, zipped_filename in url_dictionary_chebi.items():
-        with gzip_open(zipped_filename, 'rb') as file_in:
-            with open(filename, 'wb') as file_out:
-                shutil.copyfileobj(file_in, file_out)
+def set_download_manifest(file_entries, kegg_filename):
+    """
+    Sets the manifest of the downloaded database files and the KEGG release used by the build.\n
+    :param file_entries: dictionary of the manifest entry of each downloaded database file
+    :param kegg_filename: name of the file of the KEGG release
+    """
+    global kegg_metabolites_filename, download_manifest
+    kegg_metabolites_filename = files_dir + kegg_filename
+    download_manifest = {os.path.basename(filename): {key: value for key, value in entry.items() if key != 'changed'}
+                         for filename, entry in file_entries.items()}
+    download_manifest['kegg'] = {'filename': kegg_filename}
+
+    log(f"Downloaded {sum(entry['size'] for entry in file_entries.values()) / 1e6:0.1f} MB")
+
+
+def load_download_manifest():
+    if not os.path.isfile(download_manifest_filename):
+        return {}
+
+    with open(download_manifest_filename, 'r') as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_download_manifest():
+    """
+    Saves the manifest of the database files used in the last build.
+    Called once the mapping tables are saved, so an interrupted update is rebuilt next time.
+    """
+    if download_manifest:
+        with open(download_manifest_filename, 'w') as manifest_file:
+            json.dump(download_manifest, manifest_file, indent=1)
+
+
+def download_database_file(filename, url, manifest_entry=None):
+    """
+    Downloads a database file and decompresses it if it is a zipped ChEBI file.
+    If the file has a manifest entry, it is only downloaded if it changed since then.\n
+    :param filename: name of file to save
+    :param url: url of file
+    :param manifest_entry: dictionary with url, etag, last modified date, size, and sha256 of last download
+    :return: manifest entry of file, including if it changed since last download
+    """
+    log("Downloading " + filename)
+    file_stats = download_file(url, filename, get_conditional_headers(url, manifest_entry))
+    file_entry = create_file_entry(filename, url, manifest_entry, file_stats)
+    if file_entry is None:
+        return download_database_file(filename, url)
+
+    return file_entry
+
+
+def get_conditional_headers(url, manifest_entry):
+    """
+    Creates the headers requesting a database file only if it changed since its last download.\n
+    :param url: url of file
+    :param manifest_entry: dictionary with url, etag, and last modified date of last download, or None
+    :return: dictionary of conditional request headers
+    """
+    headers = {}
+    if manifest_entry and (manifest_entry.get('url') == url):
+        if manifest_entry.get('etag'):
+            headers['If-None-Match'] = manifest_entry['etag']
+        if manifest_entry.get('last_modified'):
+            headers['If-Modified-Since'] = manifest_entry['last_modified']
+
+    return headers
+
+
+def create_file_entry(filename, url, manifest_entry, file_stats):
+    """
+    Creates the manifest entry of a downloaded database file and decompresses it if it is a zipped ChEBI file.\n
+    :param filename: name of file
+    :param url: url of file
+    :param manifest_entry: dictionary with url, etag, last modified date, size, and sha256 of last download
+    :param file_stats: statistics returned by the download of the file, or None if not modified
+    :return: manifest entry of file, including if it changed since last download,
+             or None if the file was not modified but does not match its last download
+    """
+    if file_stats is None:  # not modified
+        if os.path.isfile(filename) and (os.path.getsize(filename) != manifest_entry['size']):
+            log(filename + " does not match its last download")
+            return None
+
+        log(filename + " not modified since last update")
+        file_entry = dict(manifest_entry, changed=False)
+        decompress = not all(os.path.isfile(unzipped_filename) for unzipped_filename, zipped_filename
+                             in url_dictionary_chebi.items() if zipped_filename == filename)
 
-    kegg_metabolites_filename += check_for_kegg_update()
+    else:
+        log(f"{filename} downloaded: {file_stats['size']} bytes in {file_stats['time']:0.1f} s "
+            f"({file_stats['size'] / 1e6 / max(file_stats['time'], 1e-6):0.2f} MB/s), "
+            f"{file_stats['attempts']} attempt(s), sha256 {file_stats['sha256']}")
+        file_entry = {'url': url,
+                      'etag': file_stats['etag'],
+                      'last_modified': file_stats['last_modified'],
+                      'size': file_stats['size'],
+                      'sha256': file_stats['sha256'],
+                      'changed': (not manifest_entry) or (manifest_entry.get('sha256') != file_stats['sha256'])}
+        decompress = True
+
+    if decompress and os.path.isfile(filename):
+        decompress_chebi_file(filename)
+
+    return file_entry
+
+
+def decompress_chebi_file(filename):
+    """
+    Decompresses a database file if it is a zipped ChEBI file.\n
+    :param filename: name of database file
+    """
+    for unzipped_filename, zipped_filename in url_dictionary_chebi.items():
+        if zipped_filename == filename:
+            # Decompressed to a partial file first, so that an interrupted decompression leaves no truncated file
+            with gzip_open(zipped_filename, 'rb') as file_in:
+                with open(unzipped_filename + ".part", 'wb') as file_out:
+                    shutil.copyfileobj(file_in, file_out)
+            os.replace(unzipped_filename + ".part", unzipped_filename)
+            log(unzipped_filename + " decompressed.")
+
+
+def load_source_files(source_dir, force=False):
+    """
+    Uses the database files of a local source directory instead of downloading them, so that the mapping tables
+    can be built without network access. The source directory has the database files and the KEGG release file,
+    named as in the downloads directory, and their manifest in the format of the download manifest,
+    such as a copy of the downloads directory and the download manifest of an update with delete_database_files=False.
+    Files are checked against their size and checksum in the manifest, and linked or copied into the downloads
+    directory.\n
+    :param source_dir: directory of database files
+    :param force: use all files even if they have not changed
+    :return: True if any database changed since the last update or force is set, False otherwise
+    """
+    global kegg_metabolites_filename, download_manifest
+    source_manifest_filename = os.path.join(source_dir, os.path.basename(download_manifest_filename))
+    if not os.path.isfile(source_manifest_filename):
+        raise FileNotFoundError(f"Source directory {source_dir} has no manifest {source_manifest_filename}")
+
+    with open(source_manifest_filename, 'r') as manifest_file:
+        source_manifest = json.load(manifest_file)
+
+    last_manifest = {} if force else load_download_manifest()
+
+    kegg_filename = source_manifest.get('kegg', {}).get('filename')
+    if kegg_filename is None:
+        raise ValueError(f"Manifest {source_manifest_filename} has no KEGG release file")
+
+    changed_filenames = []
+    for filename in list(url_dictionary) + [files_dir + kegg_filename]:
+        basename = os.path.basename(filename)
+        source_filename = os.path.join(source_dir, basename)
+        if not os.path.isfile(source_filename):
+            raise FileNotFoundError(f"Source directory {source_dir} has no database file {basename}")
+
+        if filename in url_dictionary:
+            entry = source_manifest.get(basename)
+            if entry is None:
+                raise ValueError(f"Manifest {source_manifest_filename} has no entry for {basename}")
+            if (entry.get('size') not in (None, os.path.getsize(source_filename))) or \
+                    (entry.get('sha256') not in (None, file_checksum(source_filename))):
+                raise ValueError(f"Database file {source_filename} does not match its manifest entry")
+
+            changed = last_manifest.get(basename, {}).get('sha256') != entry.get('sha256')
+        else:
+            changed = last_manifest.get('kegg', {}).get('filename') != kegg_filename
+
+        if changed:
+            changed_filenames.append(basename)
+
+        if not (os.path.isfile(filename) and os.path.samefile(source_filename, filename)):
+            # Replaced rather than overwritten, since the file in the downloads directory may be linked to another
+            # source directory
+            try:
+                os.link(source_filename, filename + ".part")
+            except OSError:
+                shutil.copy2(source_filename, filename + ".part")
+            os.replace(filename + ".part", filename)
+
+        if changed or not all(os.path.isfile(unzipped_filename) for unzipped_filename, zipped_filename
+                              in url_dictionary_chebi.items() if zipped_filename == filename):
+            decompress_chebi_file(filename)
+
+    if not (force or changed_filenames):
+        log("No database changes since the last update")
+        return False
+
+    log("Changed database files: " + ", ".join(changed_filenames))
+
+    kegg_metabolites_filename = files_dir + kegg_filename
+    download_manifest = {os.path.basename(filename): source_manifest[os.path.basename(filename)]
+                         for filename in url_dictionary}
+    download_manifest['kegg'] = {'filename': kegg_filename}
+
+    return True
+
+
+def download_file(url, filename, headers=None):
+    """
+    Downloads a file into a partial file that is resumed with HTTP range requests if the download fails.
+    The ETag or last modified date of the file is saved with the partial file and sent as If-Range,
+    so that a partial file is only resumed if the file has not changed.
+    Failed downloads are retried with exponential backoff.\n
+    :param url: url of file
+    :param filename: name of file to save
+    :param headers: dictionary of additional request headers (e.g., conditional request headers)
+    :return: dictionary with size, sha256 checksum, etag, last modified date, download time, and number of attempts,
+             or None if the server replies that the file was not modified
+    """
+    partial_filename = filename + ".part"
+    etag, last_modified = None, None
+    tic = perf_counter()
+    attempt = 0
+
+    while True:
+        attempt += 1
+        downloaded_size, resume_headers, validators = get_resume_headers(partial_filename)
+        request = urllib.request.Request(url, headers=resume_headers or headers or {})
+
+        try:
+            with closing(urllib.request.urlopen(request, timeout=download_timeout)) as r:
+                resumed = check_resumed_response(partial_filename, downloaded_size, r.status,
+                                                 r.headers.get('Content-Range'))
+                expected_size = r.headers.get('Content-Length')
+                if resumed:
+                    etag, last_modified = validators
+                else:
+                    etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+                    save_partial_validators(partial_filename, etag, last_modified)
+                received_size = 0
+                with open(partial_filename, 'ab' if resumed else 'wb') as f:
+                    while chunk := r.read(download_chunk_size):
+                        f.write(chunk)
+                        received_size += len(chunk)
+
+            if (expected_size is not None) and (received_size < int(expected_size)):
+                raise ConnectionError(f"received {received_size} of {expected_size} bytes")
+            break
+
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            elif e.code == 416:  # partial file cannot be resumed
+                remove_partial_file(partial_filename)
+            elif e.code < 500 and e.code != 429:
+                raise
+            error = e
+
+        except (OSError, http.client.HTTPException) as e:  # connection errors, timeouts, and incomplete reads
+            error = e
+
+        if attempt > max_download_retries:
+            raise error
+
+        delay = download_retry_delay * 2 ** (attempt - 1)
+        log(f"Download of {filename} failed ({error}). Retrying in {delay} s")
+        sleep(delay)
+
+    toc = perf_counter()
+    os.replace(partial_filename, filename)
+    remove_partial_file(partial_filename)
+
+    return {'size': os.path.getsize(filename),
+            'sha256': file_checksum(filename),
+            'etag': etag,
+            'last_modified': last_modified,
+            'time': toc - tic,
+            'attempts': attempt}
+
+
+def get_resume_headers(partial_filename):
+    """
+    Creates the headers resuming a partial file with a range request, conditional on the file being unchanged.
+    Partial files without a strong ETag or a last modified date saved with them cannot be checked, so they are removed.\n
+    :param partial_filename: name of partial file
+    :return: size of partial file, dictionary of resume headers or None, and the (etag, last modified date)
+             saved with the partial file
+    """
+    validators = load_partial_validators(partial_filename)
+    downloaded_size = os.path.getsize(partial_filename) if os.path.exists(partial_filename) else 0
+    etag, last_modified = validators if validators is not None else (None, None)
+    validator = etag if (etag and not etag.startswith('W/')) else last_modified
+    if not (downloaded_size and validator):
+        remove_partial_file(partial_filename)
+        return 0, None, None
+
+    return downloaded_size, {'Range': f"bytes={downloaded_size}-", 'If-Range': validator}, validators
+
+
+def check_resumed_response(partial_filename, downloaded_size, status, content_range):
+    """
+    Checks if a response resumes a partial file. A response with the whole file replaces the partial file,
+    and a partial response not starting at the end of the partial file is an error that removes the partial file.\n
+    :param partial_filename: name of partial file
+    :param downloaded_size: size of partial file, or 0 if the whole file was requested
+    :param status: HTTP status of the response
+    :param content_range: Content-Range header of the response
+    :return: True if the response continues the partial file, False if it has the whole file
+    """
+    if not (downloaded_size and status == 206):
+        return False
+
+    if not (content_range or '').startswith(f"bytes {downloaded_size}-"):
+        remove_partial_file(partial_filename)
+        raise ConnectionError(f"range {content_range} does not continue the {downloaded_size} bytes downloaded")
+
+    return True
+
+
+def load_partial_validators(partial_filename):
+    validators_filename = partial_filename + ".json"
+    if not os.path.isfile(validators_filename):
+        return None
+
+    try:
+        with open(validators_filename, 'r') as validators_file:
+            validators = json.load(validators_file)
+        return validators['etag'], validators['last_modified']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def save_partial_validators(partial_filename, etag, last_modified):
+    with open(partial_filename + ".json", 'w') as validators_file:
+        json.dump({'etag': etag, 'last_modified': last_modified}, validators_file)
+
+
+def remove_partial_file(partial_filename):
+    for name in (partial_filename, partial_filename + ".json"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def file_checksum(filename):
+    file_hash = sha256()
+    with open(filename, 'rb') as f:
+        while chunk := f.read(download_chunk_size):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
 
 
 def check_for_kegg_update():
@@ -139,67 +726,583 @@ def check_for_kegg_update():
     Checks for a KEGG update and creates a filename for latest version.\n
     :return: filename for latest version
     """
+    filename = get_kegg_release_filename()
+    download_kegg_release(filename)
+
+    return filename
+
+
+def get_kegg_release_filename():
+    """
+    Gets the current KEGG release and creates a filename for it.\n
+    :return: filename for latest version
+    """
     log("Checking Kegg stats. ")
-    kegg_cpd_stats_response = requests.get("http://rest.kegg.jp/info/cpd")
+    kegg_cpd_stats_response = requests.get(kegg_api_url + "/info/cpd")
     release_version = kegg_cpd_stats_response.text.split('\n')[1].split('Release ', 1)[1]
+    log("Kegg release: {}".format(release_version))
     filename = "kegg_" + \
                release_version.translate({ord(c): "-" for c in "/!@#$%^&*()[]{};:,.<>?\\|`~-=+"}).replace(" ", "-")
 
-    filename = filename.split("--", 1)[0] + ".p"
+    return filename.split("--", 1)[0] + ".p"
+
 
+def download_kegg_release(filename):
+    """
+    Downloads a KEGG release unless it was already downloaded.\n
+    :param filename: filename for KEGG release
+    """
     if not os.path.isfile(files_dir + filename):
-        log("New Kegg version found: {}".format(release_version))
+        log("New Kegg version found: {}".format(filename))
         log("Downloading new Kegg version.")
         download_kegg_compounds(filename)
 
-    return filename
-
 
 def download_kegg_compounds(filename):
     """
-    Uses API to get information on each compound from KEGG database.\n
+    Uses API to get information on each compound from KEGG database.
+    Compounds are requested in batches by a pool of rate-limited workers and progress is checkpointed,
+    so an interrupted download continues with the compounds not yet downloaded.\n
     :param filename: filename to save kegg compound information as
     """
-    kegg_compounds_request = requests.get("http://rest.kegg.jp/list/compound")
+    kegg_compounds_request = requests.get(kegg_api_url + "/list/compound")
     kegg_compounds_list = kegg_compounds_request.text.split('\n')
-    kegg_compounds_dict = {}
+    kegg_ids = []
 
     for compound in kegg_compounds_list:
         if "\t" in compound:
             split_text = compound.split('\t', 1)
             spl = (split_text[0]).split(':', 1)
-            kegg_id = spl[1] if len(spl) > 1 else split_text[0]
-            kegg_compounds_dict[kegg_id] = {'Name': [], 'mass': [], 'formula': [], 'chebi': []}
-
-            compound_info_request = requests.get("http://rest.kegg.jp/get/" + kegg_id)
-            compound_info = compound_info_request.text.split('\n')
-
-            for info_line in compound_info:
-                line = info_line.replace(" ", "")
-                if 'FORMULA' in line:
-                    kegg_compounds_dict[kegg_id]['formula'].append(line.split('FORMULA', 1)[1])
-                if 'NAME' in line:
-                    kegg_compounds_dict[kegg_id]['Name'].append(line.split('NAME', 1)[1][:-1])
-                elif 'MOL_WEIGHT' in line:
-                    kegg_compounds_dict[kegg_id]['mass'].append(line.split('MOL_WEIGHT', 1)[1])
-                elif 'EXACT_MASS' in line:
-                    kegg_compounds_dict[kegg_id]['mass'].append(line.split('EXACT_MASS', 1)[1])
-                elif 'chebi:' in line.lower():
-                    kegg_compounds_dict[kegg_id]['chebi'].append(line.lower())
+            kegg_ids.append(spl[1] if len(spl) > 1 else split_text[0])
+
+    checkpoint_filename = files_dir + filename + ".partial"
+    if os.path.isfile(checkpoint_filename):
+        with open(checkpoint_filename, 'rb') as checkpoint_file:
+            kegg_compounds_dict = load(checkpoint_file)
+        log(f"Resuming Kegg download with {len(kegg_compounds_dict)} compounds already downloaded")
+    else:
+        kegg_compounds_dict = {}
+
+    pending_ids = [kegg_id for kegg_id in kegg_ids if kegg_id not in kegg_compounds_dict]
+    batches = [pending_ids[i:i + kegg_batch_size] for i in range(0, len(pending_ids), kegg_batch_size)]
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_kegg_workers) as executor:
+            for num_batches, batch_compounds in enumerate(executor.map(download_kegg_batch, batches), 1):
+                kegg_compounds_dict.update(batch_compounds)
+                if num_batches % kegg_checkpoint_interval == 0:
+                    save_kegg_checkpoint(checkpoint_filename, kegg_compounds_dict)
+                    log(f"Kegg ids downloaded: {len(kegg_compounds_dict)} of {len(kegg_ids)}")
+    except BaseException:
+        save_kegg_checkpoint(checkpoint_filename, kegg_compounds_dict)
+        raise
+
+    kegg_compounds_dict = {kegg_id: kegg_compounds_dict[kegg_id] for kegg_id in kegg_ids}
     log(f"Kegg ids processed: {len(kegg_compounds_dict)}")
 
     with open(files_dir + filename, 'wb') as kegg_file:
         dump(kegg_compounds_dict, kegg_file)
 
+    if os.path.isfile(checkpoint_filename):
+        os.remove(checkpoint_filename)
+
+
+def save_kegg_checkpoint(checkpoint_filename, kegg_compounds_dict):
+    with open(checkpoint_filename + ".tmp", 'wb') as checkpoint_file:
+        dump(kegg_compounds_dict, checkpoint_file)
+    os.replace(checkpoint_filename + ".tmp", checkpoint_filename)
+
+
+def request_kegg(path):
+    """
+    Sends a get request to the KEGG API respecting the request rate, reusing a session per thread
+    and retrying with exponential backoff if the request fails.\n
+    :param path: path of the request
+    :return: response
+    """
+    global next_kegg_request_time
+    session = getattr(kegg_sessions, 'session', None)
+    if session is None:
+        session = kegg_sessions.session = requests.Session()
+
+    attempt = 0
+    while True:
+        attempt += 1
+        with kegg_request_lock:
+            now = perf_counter()
+            wait = next_kegg_request_time - now
+            next_kegg_request_time = max(now, next_kegg_request_time) + 1 / kegg_requests_per_second
+        if wait > 0:
+            sleep(wait)
+
+        try:
+            response = session.get(kegg_api_url + path, timeout=download_timeout)
+            if (response.status_code < 500) and (response.status_code not in {403, 429}):
+                return response
+            error = requests.HTTPError(f"{response.status_code} {response.reason}")
+        except requests.RequestException as e:
+            error = e
+
+        if attempt > max_download_retries:
+            raise error
+
+        delay = download_retry_delay * 2 ** (attempt - 1)
+        log(f"Kegg request {path} failed ({error}). Retrying in {delay} s")
+        sleep(delay)
+
+
+def download_kegg_batch(kegg_ids):
+    """
+    Gets the information of a batch of compounds from KEGG database with a single request.\n
+    :param kegg_ids: list of kegg compound ids
+    :return: dictionary mapping each kegg id to its properties
+    """
+    kegg_compounds_dict = {kegg_id: {'Name': [], 'mass': [], 'formula': [], 'chebi': []} for kegg_id in kegg_ids}
+    compound_info_request = request_kegg("/get/" + "+".join(kegg_ids))
+    if compound_info_request.status_code != 200:
+        return kegg_compounds_dict
+
+    compound_properties = None
+    for info_line in compound_info_request.text.split('\n'):
+        if info_line.startswith('ENTRY'):
+            entry = info_line.split()
+            compound_properties = kegg_compounds_dict.get(entry[1]) if len(entry) > 1 else None
+        elif info_line.startswith('///'):
+            compound_properties = None
+
+        if compound_properties is not None:
+            add_kegg_compound_info(compound_properties, info_line)
+
+    return kegg_compounds_dict
+
+
+def add_kegg_compound_info(compound_properties, info_line):
+    line = info_line.replace(" ", "")
+    if 'FORMULA' in line:
+        compound_properties['formula'].append(line.split('FORMULA', 1)[1])
+    if 'NAME' in line:
+        compound_properties['Name'].append(line.split('NAME', 1)[1][:-1])
+    elif 'MOL_WEIGHT' in line:
+        compound_properties['mass'].append(line.split('MOL_WEIGHT', 1)[1])
+    elif 'EXACT_MASS' in line:
+        compound_properties['mass'].append(line.split('EXACT_MASS', 1)[1])
+    elif 'chebi:' in line.lower():
+        compound_properties['chebi'].append(line.lower())
+
+
+def get_database_files():
+    """
+    Returns the database files in the order they are processed, as named stages of the build.
+    :return: lists of (stage name, function processing the file, filename, reader) of the metabolite and reaction files
+    """
+    metabolite_files = [
+        # Process KeGG database metabolites
+        ('kegg_compounds', process_kegg_compounds, kegg_metabolites_filename, kegg_compounds_reader),
+
+        # Process ChEBI database metabolite IDs
+        ('chebi_structures', process_met_file, chebi_compound_structure_filename, chebi_compounds_inchi_reader),
+        ('chebi_compounds', process_met_file, chebi_compounds_filename, chebi_compounds_names),
+
+        # Process MetaNetX database metabolite IDs
+        ('metanetx_chem_prop', process_met_file, mx_chem_prop_filename, metanetx_chem_prop_line_reader),
+        ('metanetx_chem_depr', process_cross_ref_info, mx_met_depr_filename, metanetx_chem_depr_reader),
+        ('metanetx_chem_xref_ids', process_met_file, mx_met_xref_filename, metanetx_chem_xref_line_reader),
+        ('metanetx_chem_xref', process_cross_ref_info, mx_met_xref_filename, metanetx_chem_xref_reader),
+
+        # Process BiGG database metabolite IDs
+        ('bigg_metabolites_ids', process_met_file, bigg_metabolites_filename, bigg_metabolites_line_reader),
+        ('bigg_metabolites_xref', process_cross_ref_info, bigg_metabolites_filename, bigg_models_xref_reader),
+
+        # Process ModelSEED database metabolite IDs
+        ('modelseed_compounds_ids', process_met_file, ms_met_filename, modelseed_metabolites_line_reader),
+        ('modelseed_compounds_xref', process_cross_ref_info, ms_met_filename, modelseed_metabolites_xref_reader),
+        ('modelseed_compound_aliases', process_cross_ref_info, ms_met_aliases_filename, modelseed_met_aliases_reader)]
+
+    # Process reaction IDs from modelSEED, MetaNetX, and BiGG
+    reaction_files = [
+        ('modelseed_reactions', process_reac_file, ms_reac_filename, modelSeed_reactions_line_reader),
+        ('modelseed_reaction_pathways', process_reac_file, ms_reac_pathways_filename,
+         modelSeed_reaction_pathways_line_reader),
+        ('metanetx_reac_prop', process_reac_file, mx_reac_prop_filename, metanetx_reaction_prop_line_reader),
+        ('metanetx_reac_xref', process_reac_file, mx_reac_xref_filename, metanetx_reaction_xref_line_reader),
+        ('bigg_reactions', process_reac_file, bigg_reactions_filename, bigg_reactions_line_reader)]
+
+    return metabolite_files, reaction_files
+
+
+def get_build_stages():
+    """
+    Returns the named stages of the build in order. Database file stages are (name, function processing the file,
+    filename, reader), and the other stages are (name, function, None, None).
+    :return: list of build stages
+    """
+    metabolite_files, reaction_files = get_database_files()
+    return (metabolite_files + [('resolve_metabolites', resolve_merged_identifiers, None, None)] +
+            reaction_files + [('resolve_reactions', partial(resolve_merged_identifiers, True), None, None),
+                              ('clean_reactions', clean_reaction_ids, None, None),
+                              ('clean_metabolites', clean_metabolite_ids, None, None)])
+
+
+def process_database_files():
+    """
+    Processes the database files in a fixed order to merge their identifiers.
+    """
+    run_build_stages([build_stage for build_stage in get_build_stages() if not build_stage[0].startswith('clean')])
+
+
+def run_build_stages(build_stages, checkpoint=False):
+    """
+    Runs stages of the build in order.
+    Files are parsed ahead in a process pool, while the parsed records are merged in order.
+    Stages in checkpoint_stages are checkpointed, and so is any stage finishing more than
+    build_checkpoint_interval seconds after the last checkpoint. Each stage is recorded in the build report,
+    and the garbage collector is paused while each stage runs.
+    The build stops before its next stage, raising CancelledError, once the stop event of the build is set.\n
+    :param build_stages: list of build stages
+    :param checkpoint: save checkpoints of the build state
+    """
+    parse_tasks = [get_parse_tasks(process_stage, file_name, file_reader) if file_name else []
+                   for _, process_stage, file_name, file_reader in build_stages]
+    task_uses = Counter((function, arguments) for stage_tasks in parse_tasks for function, arguments, _ in stage_tasks)
+    parsed_records = parse_database_files(list(task_uses))
+    shared_records = {}
+
+    def get_stage_records(stage_tasks, stage_record):
+        # Results of tasks shared by several stages are kept until their last stage
+        for function, arguments, part in stage_tasks:
+            task = (function, arguments)
+            records = shared_records[task] if task in shared_records else next(parsed_records)
+            task_uses[task] -= 1
+            if task_uses[task]:
+                shared_records[task] = records
+            else:
+                shared_records.pop(task, None)
+
+            stage_records = records if part is None else records[part]
+            stage_record['rows_read'] += len(stage_records)
+            yield stage_records
+
+    checkpoint_time = perf_counter()
+    stop_event = getattr(build_progress, 'stop_event', None)
+    for (stage_name, process_stage, file_name, file_reader), stage_tasks in zip(build_stages, parse_tasks):
+        if (stop_event is not None) and stop_event.is_set():
+            log(f"Build stopped before stage {stage_name}")
+            raise CancelledError(f"Build stopped before stage {stage_name}")
+
+        log(f"Running stage {stage_name}")
+        with report_build_stage(stage_name) as stage_record, paused_garbage_collection():
+            if file_name:
+                process_stage(file_name, file_reader, get_stage_records(stage_tasks, stage_record))
+            else:
+                process_stage()
+
+        if checkpoint and ((stage_name in checkpoint_stages) or
+                           (perf_counter() - checkpoint_time > build_checkpoint_interval)):
+            log(f"Saving checkpoint of stage {stage_name}")
+            save_build_checkpoint(stage_name)
+            checkpoint_time = perf_counter()
+
+
+@contextmanager
+def paused_garbage_collection():
+    """
+    Pauses the cyclic garbage collector while a stage of the build merges its records, since the stage creates
+    millions of objects but no reference cycles, and restores it when the stage finishes or fails.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def clean_reaction_ids():
+    global reac_univ_id_dict, reac_univ_id_prop_dict
+    log("Cleaning reaction id mapping dictionary")
+    reac_univ_id_dict, reac_univ_id_prop_dict = clean_id_mapping_dictionary(reac_univ_id_dict,
+                                                                              reac_univ_id_prop_dict,
+                                                                              for_reac=True)
+
+
+def clean_metabolite_ids():
+    global met_univ_id_dict, met_univ_id_prop_dict
+    add_repeated_ids()
+    log("Cleaning metabolite id dictionary")
+    met_univ_id_dict, met_univ_id_prop_dict = clean_id_mapping_dictionary(met_univ_id_dict,
+                                                                            met_univ_id_prop_dict)
+
+
+def get_parse_tasks(process_file, file_name, file_reader):
+    """
+    Splits the parsing of a database file into tasks.
+    Files read line by line are split into chunks of lines, other files are read by a single task.
+    Readers with a columnar reader are replaced by it, and the stages reading the same file with the same
+    columnar reader get the same tasks, which are run once.\n
+    :param process_file: function processing the file
+    :param file_name: name of database file
+    :param file_reader: reader function for database file
+    :return: list of (function, arguments, part) tasks, where part is the index of the task result used by the stage,
+    or None if the stage uses the whole result
+    """
+    if use_columnar_readers and (file_reader in columnar_readers):
+        columnar_reader, part = columnar_readers[file_reader]
+        if part is not None:
+            return [(columnar_reader, (file_name,), part)]
+        return [(columnar_reader, (file_name, start, end), None) for start, end in get_file_chunks(file_name)]
+
+    if process_file not in (process_met_file, process_reac_file):
+        return [(file_reader, (file_name,), None)]
+
+    return [(read_file_records, (file_name, file_reader, start, end), None) for start, end in get_file_chunks(file_name)]
+
+
+def get_file_chunks(file_name):
+    """
+    Splits a database file into chunks of about parse_chunk_size bytes, starting at the beginning of a line.
+    :param file_name: name of database file
+    :return: list of (start, end) positions of chunks
+    """
+    file_size = os.path.getsize(file_name)
+    chunk_starts = [0]
+    with open(file_name, "rb") as db_file:
+        while chunk_starts[-1] + parse_chunk_size < file_size:
+            db_file.seek(chunk_starts[-1] + parse_chunk_size)
+            db_file.readline()  # chunks start at the beginning of a line
+            if db_file.tell() >= file_size:
+                break
+            chunk_starts.append(db_file.tell())
+
+    return list(zip(chunk_starts, chunk_starts[1:] + [file_size]))
+
+
+def parse_database_files(parse_tasks):
+    """
+    Runs parse tasks in a process pool and yields their results in the order of the tasks.
+    Only a few tasks are run ahead of the result being processed, to bound memory use.\n
+    :param parse_tasks: list of (function, arguments) tasks
+    :return: generator of task results
+    """
+    if max_parse_workers <= 1:
+        for function, arguments in parse_tasks:
+            yield function(*arguments)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_parse_workers) as executor:
+        pending_tasks = iter(parse_tasks)
+        parse_futures = deque(executor.submit(function, *arguments)
+                              for function, arguments in islice(pending_tasks, 2 * max_parse_workers))
+        while parse_futures:
+            records = parse_futures.popleft().result()
+            for function, arguments in islice(pending_tasks, 1):
+                parse_futures.append(executor.submit(function, *arguments))
+            yield records
+
+
+def read_file_records(file_name, file_line_reader, start=0, end=None):
+    """
+    Uses reader function to read the lines of a database file, or of a chunk of it.\n
+    :param file_name: name of database file
+    :param file_line_reader: reader function for lines of database file
+    :param start: position of first line of chunk
+    :param end: position after last line of chunk, or None to read until the end of the file
+    :return: list of properties read from lines
+    """
+    with open(file_name, "rb") as db_file:
+        db_file.seek(start)
+        chunk = db_file.read() if end is None else db_file.read(end - start)
+
+    lines = io.TextIOWrapper(io.BytesIO(chunk))
+    if start == 0:
+        next(lines)  # skip header
+
+    return read_line_records(file_name, file_line_reader, lines)
+
+
+def read_line_records(file_name, file_line_reader, lines):
+    """
+    Uses reader function to read lines of a database file.\n
+    :param file_name: name of database file
+    :param file_line_reader: reader function for lines of database file
+    :param lines: lines of database file
+    :return: list of properties read from lines
+    """
+    separator = ',' if ".csv" in file_name else '\t'
+    records = []
+    for line in lines:
+        properties = file_line_reader(line.strip().split(separator))
+        if properties is not None:
+            records.append(properties)
+
+    return records
+
+
+def read_file_row_batches(file_name, start=0, end=None):
+    """
+    Reads the rows of a tab-separated database file, or of a chunk of it, in batches of row_batch_size rows.\n
+    :param file_name: name of database file
+    :param start: position of first line of chunk
+    :param end: position after last line of chunk, or None to read until the end of the file
+    :return: generator of lists of rows, each a list of fields
+    """
+    with open(file_name, "rb") as db_file:
+        db_file.seek(start)
+        lines = io.TextIOWrapper(db_file if end is None else io.BytesIO(db_file.read(end - start)))
+        if start == 0:
+            next(lines)  # skip header
+
+        for line_batch in iter(lambda: list(islice(lines, row_batch_size)), []):
+            yield [line.strip().split('\t') for line in line_batch]
+
+
+def get_build_state():
+    """
+    Returns the variables of the build state, which processing the database files changes.
+    """
+    return {variable: globals()[variable] for variable in build_state_variables}
+
+
+def set_build_state(build_state):
+    globals().update(build_state)
+
+
+def reset_build_state():
+    set_build_state({'met_univ_id_dict': {}, 'met_univ_id_prop_dict': {},
+                     'reac_univ_id_dict': {}, 'reac_univ_id_prop_dict': {},
+                     'met_last_univ_id': 0, 'reac_last_univ_id': 0,
+                     'met_univ_id_parents': [0], 'reac_univ_id_parents': [0],
+                     'met_univ_id_sizes': [0], 'reac_univ_id_sizes': [0],
+                     'met_univ_id_labels': [0], 'reac_univ_id_labels': [0],
+                     'met_univ_id_merges': {}, 'reac_univ_id_merges': {},
+                     'met_repeated_ids': {}, 'met_univ_id_databases': {}})
+
+
+def save_build_checkpoint(stage_name):
+    """
+    Saves the build state after a build stage, and adds the stage to the checkpoints of the build.
+    :param stage_name: name of the last stage run
+    """
+    with open(checkpoints_dir + stage_name + ".p.part", 'wb') as checkpoint_file:
+        dump(get_build_state(), checkpoint_file)
+    os.replace(checkpoints_dir + stage_name + ".p.part", checkpoints_dir + stage_name + ".p")
+
+    build_checkpoints = load_build_checkpoints()
+    build_checkpoints['stages'].append(stage_name)
+    save_build_checkpoints(build_checkpoints)
+
+
+def load_build_checkpoint(stage_name):
+    with open(checkpoints_dir + stage_name + ".p", 'rb') as checkpoint_file:
+        set_build_state(load(checkpoint_file))
+
+
+def start_build_checkpoints():
+    """
+    Removes the checkpoints of the last build and starts the checkpoints of a new one,
+    recording the downloaded files and the options that define its stages.
+    """
+    shutil.rmtree(checkpoints_dir, ignore_errors=True)
+    os.makedirs(checkpoints_dir)
+    save_build_checkpoints({'download_manifest': download_manifest,
+                            'kegg_filename': os.path.basename(kegg_metabolites_filename),
+                            'stages': [],
+                            'completed': False})
+
+
+def load_build_checkpoints():
+    """
+    Loads the checkpoints of the last build.
+    :return: dictionary with the downloaded files, the options, the checkpointed stages and if the build completed,
+    or None if there are no checkpoints
+    """
+    if not os.path.isfile(checkpoints_dir + build_checkpoints_filename):
+        return None
+
+    with open(checkpoints_dir + build_checkpoints_filename, 'r') as checkpoints_file:
+        return json.load(checkpoints_file)
+
 
-def process_reac_file(file_name, file_line_reader):
+def save_build_checkpoints(build_checkpoints):
+    with open(checkpoints_dir + build_checkpoints_filename + ".part", 'w') as checkpoints_file:
+        json.dump(build_checkpoints, checkpoints_file, indent=1)
+    os.replace(checkpoints_dir + build_checkpoints_filename + ".part", checkpoints_dir + build_checkpoints_filename)
+
+
+def complete_build():
+    """
+    Marks the last build as completed once its mapping dictionaries are saved, so that it is no longer resumed.
+    """
+    build_checkpoints = load_build_checkpoints()
+    if build_checkpoints is not None:
+        build_checkpoints['completed'] = True
+        save_build_checkpoints(build_checkpoints)
+
+
+def delete_downloaded_files():
+    """
+    Deletes the downloaded database files. The build checkpoints are kept,
+    since the stages after the last checkpoint do not read the database files, so the update can still be resumed
+    if saving its mapping dictionaries fails.
+    """
+    for filename in list(url_dictionary) + list(url_dictionary_chebi) + [kegg_metabolites_filename]:
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+def resume_build(build_checkpoints, rerun_stage=None, file_reader=None):
+    """
+    Runs the stages of a build after its last checkpoint, without downloading the database files again.\n
+    :param build_checkpoints: checkpoints of the build
+    :param rerun_stage: name of a stage to run again, resuming from the last checkpoint before it
+    :param file_reader: reader function replacing the reader of the database file of the stage run again
+    """
+    global download_manifest, kegg_metabolites_filename
+    download_manifest = build_checkpoints['download_manifest']
+    kegg_metabolites_filename = files_dir + build_checkpoints['kegg_filename']
+
+    build_stages = get_build_stages()
+    stage_names = [stage_name for stage_name, _, _, _ in build_stages]
+    checkpointed_stages = build_checkpoints['stages']
+    if rerun_stage is not None:
+        if rerun_stage not in stage_names:
+            raise ValueError(f"Stage {rerun_stage} is not a stage of the last build: {', '.join(stage_names)}")
+
+        rerun_index = stage_names.index(rerun_stage)
+        if file_reader is not None:
+            stage_name, process_stage, file_name, _ = build_stages[rerun_index]
+            build_stages[rerun_index] = (stage_name, process_stage, file_name, file_reader)
+        checkpointed_stages = [stage_name for stage_name in checkpointed_stages
+                               if stage_names.index(stage_name) < rerun_index]
+
+    reset_build_state()
+    resumed_stages = 0
+    if checkpointed_stages:
+        log("Resuming build after stage " + checkpointed_stages[-1])
+        load_build_checkpoint(checkpointed_stages[-1])
+        resumed_stages = stage_names.index(checkpointed_stages[-1]) + 1
+
+    build_checkpoints['stages'] = checkpointed_stages
+    build_checkpoints['completed'] = False
+    save_build_checkpoints(build_checkpoints)
+
+    run_build_stages(build_stages[resumed_stages:], checkpoint=True)
+
+
+def process_reac_file(file_name, file_line_reader, record_batches=None):
+    """
+    Uses reader function to read lines of file and append information to reaction properties dictionary.\n
+    :param file_name: name of database file
+    :param file_line_reader: reader function for database file
+    :param record_batches: properties read from the file in batches, read here if not given
+    """
     log("Processing file " + file_name)
-    with open(file_name, "r") as file:
-        next(file)  # skip header
-        for line in file:
-            reac_properties = file_line_reader(line.strip().split('\t'))
-            if reac_properties is not None:
-                append_reac_properties(reac_properties)
+    if record_batches is None:
+        record_batches = [read_file_records(file_name, file_line_reader)]
+
+    for reac_records in record_batches:
+        for reac_properties in reac_records:
+            append_reac_properties(reac_properties)
 
     log("Done processing file " + file_name)
     log(f"Number of reaction ids: {len(reac_univ_id_dict)}")
@@ -207,27 +1310,20 @@ def process_reac_file(file_name, file_line_reader):
     log("")
 
 
-def process_met_file(file_name, file_line_reader):
+def process_met_file(file_name, file_line_reader, record_batches=None):
     """
     Uses reader function to read lines of file and append informaiton to met properties dictionary.\n
     :param file_name: name of database file
     :param file_line_reader: reader function for database file
+    :param record_batches: properties read from the file in batches, read here if not given
     """
     log("Processing file " + file_name)
-    if ".csv" in file_name:
-        with open(file_name, "r") as db_file:
-            next(db_file)  # skip header
-            for line in db_file:
-                met_properties = file_line_reader(line.strip().split(','))
-                if met_properties is not None:
-                    append_met_properties(met_properties)
-    else:
-        with open(file_name, "r") as db_file:
-            next(db_file)  # skip header
-            for line in db_file:
-                met_properties = file_line_reader(line.strip().split('\t'))
-                if met_properties is not None:
-                    append_met_properties(met_properties)
+    if record_batches is None:
+        record_batches = [read_file_records(file_name, file_line_reader)]
+
+    for met_records in record_batches:
+        for met_properties in met_records:
+            append_met_properties(met_properties)
 
     log("Done processing file " + file_name)
     log(f"Number of metabolite ids: {len(met_univ_id_dict)}")
@@ -236,29 +1332,31 @@ def process_met_file(file_name, file_line_reader):
     log("")
 
 
-def process_cross_ref_info(file_name, xref_line_reader):
+def process_cross_ref_info(file_name, xref_line_reader, xref_batches=None):
     """
     Read cross-reference information from file and maps database identifiers
     :param file_name: name of database file containing cross-reference information
     :param xref_line_reader: reader function for database file
+    :param xref_batches: cross-reference dictionaries read from the file, read here if not given
     """
     log("Processing file " + file_name)
 
     global met_univ_id_dict, met_univ_id_prop_dict
-    xref_dict = xref_line_reader(file_name)
-
-    for source_id, xref_list in xref_dict.items():
-        for other_id in xref_list:
-            source_univ_id = met_univ_id_dict[source_id]
-            if other_id not in met_univ_id_dict:
-                met_univ_id_dict[other_id] = source_univ_id
-                met_univ_id_prop_dict[source_univ_id]['ids'] += [other_id]
-            else:
-                other_prop = met_univ_id_prop_dict[met_univ_id_dict[other_id]]
-                source_db = source_id.rsplit(':', 1)[0]
-                existing_db_mappings = [db_id.rsplit(':', 1)[0] for db_id in other_prop['ids']]
-                if source_db not in existing_db_mappings:
-                    merge_identifiers(source_id, other_id)
+    if xref_batches is None:
+        xref_batches = [xref_line_reader(file_name)]
+
+    for xref_dict in xref_batches:
+        for source_id, xref_list in xref_dict.items():
+            for other_id in xref_list:
+                source_univ_id = get_univ_id(source_id)
+                if other_id not in met_univ_id_dict:
+                    met_univ_id_dict[other_id] = source_univ_id
+                    met_univ_id_prop_dict[source_univ_id]['ids'] += [other_id]
+                    met_univ_id_databases[source_univ_id].add(other_id.rsplit(':', 1)[0])
+                else:
+                    source_db = source_id.rsplit(':', 1)[0]
+                    if source_db not in met_univ_id_databases[get_univ_id(other_id)]:
+                        merge_identifiers(source_id, other_id)
 
     log("Done processing file " + file_name)
     log(f"Number of metabolite ids: {len(met_univ_id_dict)}")
@@ -268,42 +1366,43 @@ def process_cross_ref_info(file_name, xref_line_reader):
 
 def append_met_properties(met_properties):
     global list_primary_ids, met_univ_id_dict, met_univ_id_prop_dict
-    univ_id = met_univ_id_dict.get(met_properties['ids'][0], maxsize)
+    univ_id = get_univ_id(met_properties['ids'][0], default=maxsize)
 
     if univ_id == maxsize:
-        global met_last_univ_id
-        met_last_univ_id = met_last_univ_id + 1
-        univ_id = met_last_univ_id
-
-        met_univ_id_prop_dict[univ_id] = {'Name': [], 'ids': [], 'formula': [],
-                                                 'mass': [], 'inchikey': [], 'xref_links': []}
+        univ_id = add_univ_id()
+        # Properties are kept as insertion-ordered sets (dictionary keys) except for IDs, whose order does not matter
+        met_univ_id_prop_dict[univ_id] = {'Name': {}, 'ids': [], 'formula': {},
+                                                 'mass': {}, 'inchikey': {}, 'xref_links': {}}
+        met_univ_id_dict[met_properties['ids'][0]] = univ_id
+        met_univ_id_prop_dict[univ_id]['ids'] += [met_properties['ids'][0]]
+        met_univ_id_databases[univ_id] = {met_properties['ids'][0].rsplit(':', 1)[0]}
+    else:
+        # ID is listed twice, which remove_conflicting_ids takes into account
+        met_repeated_ids.setdefault(univ_id, set()).add(met_properties['ids'][0])
 
-    met_univ_id_dict[met_properties['ids'][0]] = univ_id
     univ_met_properties = met_univ_id_prop_dict[univ_id]
     list_primary_ids |= {db_id for db_id in met_properties['ids']}
-    univ_met_properties['ids'] += [met_properties['ids'][0]]
 
     for key, value in met_properties.items():
-        if (key == 'ids') and (len(value) > 1):
+        if key == 'ids':
             for met_id in value:
                 if met_id not in met_univ_id_dict:
                     met_univ_id_dict[met_id] = univ_id
                     univ_met_properties[key] += [met_id]
+                    met_univ_id_databases[univ_id].add(met_id.rsplit(':', 1)[0])
         else:
-            add_values_to_property_list(univ_met_properties[key], value)
+            add_values_to_property_set(univ_met_properties[key], value)
 
 
 def append_reac_properties(reac_properties):
     global reac_univ_id_dict, reac_univ_id_prop_dict
-    univ_id = min(fl_id for fl_id in (reac_univ_id_dict.get(reac_id, maxsize)
+    univ_id = min(fl_id for fl_id in (get_univ_id(reac_id, True, maxsize)
                                       for reac_id in reac_properties['ids']))
 
     if univ_id == maxsize:
-        global reac_last_univ_id
-        reac_last_univ_id = reac_last_univ_id + 1
-        univ_id = reac_last_univ_id
-        reac_univ_id_prop_dict[univ_id] = {'ids': [], 'Name': [],
-                                                  'EC_num': [], 'Pathways': [], 'xref_links': []}
+        univ_id = add_univ_id(True)
+        reac_univ_id_prop_dict[univ_id] = {'ids': [], 'Name': {},
+                                                  'EC_num': {}, 'Pathways': {}, 'xref_links': {}}
     unadded_db_ids = []
     for key, value in reac_properties.items():
         if key == 'ids':
@@ -315,19 +1414,24 @@ def append_reac_properties(reac_properties):
                 else:
                     unadded_db_ids.append(other_id)
         else:
-            add_values_to_property_list(reac_univ_id_prop_dict[univ_id][key], value)
+            add_values_to_property_set(reac_univ_id_prop_dict[univ_id][key], value)
 
     for db_id in unadded_db_ids:
         other_univ_id = reac_univ_id_dict.get(db_id)
         merge_identifiers(univ_id, other_univ_id, True)
 
 
-def process_kegg_compounds(filename):
-    log(f"Processing file {filename}")
+def kegg_compounds_reader(filename):
+    """
+    Reader function for KEGG release file.\n
+    :param filename: name of KEGG release file
+    :return: list of properties of KEGG compounds
+    """
     kegg_file = open(filename, "rb")
     kegg_compounds_dictionary = load(kegg_file)
     kegg_file.close()
 
+    kegg_records = []
     for kegg_id, properties in kegg_compounds_dictionary.items():
         ids = ["kegg:" + kegg_id]
 
@@ -339,7 +1443,25 @@ def process_kegg_compounds(filename):
                          'formula': properties['formula'],
                          'mass': properties['mass'],
                          }
-        append_met_properties(property_dict)
+        kegg_records.append(property_dict)
+
+    return kegg_records
+
+
+def process_kegg_compounds(filename, kegg_reader=kegg_compounds_reader, record_batches=None):
+    """
+    Appends the KEGG compounds of a KEGG release to met properties dictionary.\n
+    :param filename: name of KEGG release file
+    :param kegg_reader: reader function for KEGG release file
+    :param record_batches: properties read from the file in batches, read here if not given
+    """
+    log(f"Processing file {filename}")
+    if record_batches is None:
+        record_batches = [kegg_reader(filename)]
+
+    for met_records in record_batches:
+        for met_properties in met_records:
+            append_met_properties(met_properties)
 
     log(f"Done processing file {filename}")
     log(f"Number of metabolite ids: {len(met_univ_id_dict)}")
@@ -517,8 +1639,7 @@ def metanetx_chem_xref_reader(file_name):
                 other_db = other_db.split(".")[0]
                 other_id = other_db + ":" + other_db_id
 
-            elif other_db not in {"keggC", "envipathM", "envipath", "seedM", "CHEBI", "biggM", "keggD", "SLM", "keggE",
-                                  "keggG", "reactomeM", "sabiorkM", "rheaP", "rheaG", "lipidmapsM", "metacycM"}:
+            elif other_db not in metanetx_chem_xref_skipped_dbs:
                 other_id = other_db + ":" + other_db_id
 
             if other_id is not None:
@@ -530,6 +1651,44 @@ def metanetx_chem_xref_reader(file_name):
     return xref_dict
 
 
+def metanetx_chem_xref_columns_reader(file_name):
+    """
+        Columnar reader function for metanetx cross reference file, which reads the file once for both of its stages.
+        Rows are read in batches, and each batch is filtered and mapped by columns. \n
+        :param file_name: name of database file
+        :return: list of properties as read by metanetx_chem_xref_line_reader,
+        and dictionary of cross references as read by metanetx_chem_xref_reader
+    """
+    met_records = []
+    xref_dict = {}
+    other_db_names = {}
+    for rows in read_file_row_batches(file_name):
+        rows = [row for row in rows if row and row[0][0] != "#"]
+        met_records += [{'ids': ["metanetx:" + row[1]]} for row in rows if 'obsolete' not in row[2]]
+
+        descriptions = [row[2].lower() for row in rows]
+        xref_rows = [row for row, description in zip(rows, descriptions)
+                     if not ((row[0][0:3] == "MNX") or (row[0][0:3] == "mnx") or (row[1] == "MNXM0") or
+                             (":" not in row[0]) or ("unknown" in description) or ("no description" in description) or
+                             ("obsolete" in description) or ("molecular entity" in description))]
+
+        for row in xref_rows:
+            other_db, other_db_id = row[0].split(":", 1)
+            if other_db not in other_db_names:
+                if "." in other_db:
+                    other_db_names[other_db] = other_db.split(".")[0]
+                elif other_db not in metanetx_chem_xref_skipped_dbs:
+                    other_db_names[other_db] = other_db
+                else:
+                    other_db_names[other_db] = None
+
+            other_db_name = other_db_names[other_db]
+            if other_db_name is not None:
+                xref_dict.setdefault("metanetx:" + row[1], []).append(other_db_name + ":" + other_db_id)
+
+    return met_records, xref_dict
+
+
 def modelseed_metabolites_line_reader(line):
     """
     Line reader function for modelseed metabolites. \n
@@ -797,6 +1956,42 @@ def metanetx_reaction_xref_line_reader(line):
     return {'ids': ids}
 
 
+def metanetx_reaction_xref_columns_reader(file_name, start=0, end=None):
+    """
+    Columnar reader function for metanetx reaction cross reference file, or for a chunk of it.
+    Rows are read in batches, and each batch is filtered and mapped by columns. \n
+    :param file_name: name of database file
+    :param start: position of first line of chunk
+    :param end: position after last line of chunk, or None to read until the end of the file
+    :return: list of properties as read by metanetx_reaction_xref_line_reader
+    """
+    reac_records = []
+    other_db_names = {}
+    for rows in read_file_row_batches(file_name, start, end):
+        rows = [row for row in rows if row and not ((row[0][0] == "#") or (row[0][0:3] == "MNX") or
+                                                    (row[0][0:3] == "mnx") or (row[1] == "EMPTY"))]
+
+        for row in rows:
+            [other_db, other_db_id] = row[0].split(":")
+            if other_db not in other_db_names:
+                if "." in other_db:
+                    other_db_names[other_db] = other_db.split(".")[0].lower()
+                elif other_db[-1] == "R":
+                    other_db_names[other_db] = other_db[:-1].lower()
+                else:
+                    other_db_names[other_db] = other_db
+
+            reac_records.append({'ids': ["metanetx:" + row[1], other_db_names[other_db] + ":" + other_db_id]})
+
+    return reac_records
+
+
+# Columnar readers replacing reader functions, with the part of their result read by the replaced function
+columnar_readers = {metanetx_chem_xref_line_reader: (metanetx_chem_xref_columns_reader, 0),
+                    metanetx_chem_xref_reader: (metanetx_chem_xref_columns_reader, 1),
+                    metanetx_reaction_xref_line_reader: (metanetx_reaction_xref_columns_reader, None)}
+
+
 def bigg_reactions_line_reader(line):
     """
     Line reader for reactions from BiGG database.\n
@@ -846,184 +2041,378 @@ def bigg_reactions_line_reader(line):
         return None
 
 
-def add_values_to_property_list(property_list, prop_value, for_name=False):
-    invalid_values_list = ['\'\'', '\"\"', 'null', '-', '']
-    for value in prop_value:
-        if not for_name:
-            if (value not in invalid_values_list) and (value not in property_list):
-                property_list.append(value)
-        else:
-            property_list_lower = [prop.lower() for prop in property_list]
-            if (value not in invalid_values_list) and (value.lower() not in property_list_lower):
-                property_list.append(value)
+def add_values_to_property_set(property_set, prop_value):
+    """
+    Adds the valid values of a property to an insertion-ordered set of values.
+    :param property_set: dictionary whose keys are the property values
+    :param prop_value: list of property values
+    """
+    property_set.update(dict.fromkeys(value for value in prop_value if value not in invalid_property_values))
+
+
+def add_univ_id(for_reac=False):
+    """
+    Creates a new univ ID as a single-element set of the disjoint-set forest.
+    :param for_reac: create a reaction univ ID instead of a metabolite univ ID
+    :return: new univ ID
+    """
+    global met_last_univ_id, reac_last_univ_id
+    if for_reac:
+        reac_last_univ_id = reac_last_univ_id + 1
+        univ_id = reac_last_univ_id
+    else:
+        met_last_univ_id = met_last_univ_id + 1
+        univ_id = met_last_univ_id
+
+    parents, sizes, labels = get_univ_id_forest(for_reac)
+    parents.append(univ_id)
+    sizes.append(1)
+    labels.append(univ_id)
+
+    return univ_id
+
+
+def get_univ_id_forest(for_reac=False):
+    if for_reac:
+        return reac_univ_id_parents, reac_univ_id_sizes, reac_univ_id_labels
+    else:
+        return met_univ_id_parents, met_univ_id_sizes, met_univ_id_labels
+
+
+def find_root(parents, univ_id):
+    """
+    Finds the root of the set containing a univ ID, pointing every univ ID on the way directly to the root.
+    :param parents: parent of each univ ID in the disjoint-set forest
+    :param univ_id: univ ID to look up
+    :return: root univ ID of the set
+    """
+    root = univ_id
+    while parents[root] != root:
+        root = parents[root]
+
+    while parents[univ_id] != root:
+        parents[univ_id], univ_id = root, parents[univ_id]
+
+    return root
+
+
+def find_univ_id(univ_id, for_reac=False):
+    """
+    Returns the univ ID that a univ ID has been merged into, which is the lowest univ ID of its set.
+    """
+    if for_reac:
+        parents, labels = reac_univ_id_parents, reac_univ_id_labels
+    else:
+        parents, labels = met_univ_id_parents, met_univ_id_labels
+
+    root = parents[univ_id]
+    if root != univ_id:
+        root = find_root(parents, univ_id)
+
+    return labels[root]
+
+
+def get_univ_id(db_id, for_reac=False, default=None):
+    """
+    Returns the current univ ID of a database ID.
+    :param db_id: database ID
+    :param for_reac: look up a reaction ID instead of a metabolite ID
+    :param default: value returned if the database ID has not been mapped yet
+    :return: univ ID of database ID
+    """
+    univ_id = (reac_univ_id_dict if for_reac else met_univ_id_dict).get(db_id)
+    if univ_id is None:
+        return default
+
+    return find_univ_id(univ_id, for_reac)
 
 
 def merge_identifiers(source_id, other_id, for_reac=False):
     """
     Merges the two met IDs into lowest univ ID.
-    :param source_id: primary metabolite ID from database being processed
-    :param other_id: cross referenced metabolite ID to be mapped to primary met ID
+    IDs are merged right away, while the other properties of the higher univ ID are recorded
+    and replayed by resolve_merged_identifiers once all database files are processed.
+    :param source_id: primary metabolite ID from database being processed, or univ ID of reaction
+    :param other_id: cross referenced metabolite ID to be mapped to primary met ID, or univ ID of other reaction
+    :param for_reac: merge reaction univ IDs instead of metabolite IDs
     """
-    global met_univ_id_prop_dict, met_univ_id_dict, \
-        reac_univ_id_prop_dict, reac_univ_id_dict
+    if for_reac:
+        source_univ_id = find_univ_id(source_id, True)
+        other_univ_id = find_univ_id(other_id, True)
+        prop_mapper = reac_univ_id_prop_dict
+        merges = reac_univ_id_merges
+
+    else:
+        source_univ_id = get_univ_id(source_id)
+        other_univ_id = get_univ_id(other_id)
+        prop_mapper = met_univ_id_prop_dict
+        merges = met_univ_id_merges
 
+    if other_univ_id != source_univ_id:
+        univ_id, merged_univ_id = min(source_univ_id, other_univ_id), max(source_univ_id, other_univ_id)
+
+        parents, sizes, labels = get_univ_id_forest(for_reac)
+        root, other_root = find_root(parents, univ_id), find_root(parents, merged_univ_id)
+        if sizes[root] < sizes[other_root]:
+            root, other_root = other_root, root
+        parents[other_root] = root
+        sizes[root] += sizes[other_root]
+        labels[root] = univ_id
+
+        properties = prop_mapper[univ_id]
+        merged_properties = prop_mapper.pop(merged_univ_id)
+
+        # The order of IDs does not matter, so the shorter list is appended to the longer one
+        ids, merged_ids = properties['ids'], merged_properties.pop('ids')
+        if len(ids) < len(merged_ids):
+            ids, merged_ids = merged_ids, ids
+            properties['ids'] = ids
+        ids += merged_ids
+        if not for_reac:
+            met_repeated_ids.pop(merged_univ_id, None)
+            met_univ_id_databases[univ_id] |= met_univ_id_databases.pop(merged_univ_id)
+
+        property_sizes = {key: len(value) for key, value in properties.items() if key != 'ids'}
+        merges.setdefault(univ_id, []).append((property_sizes, merged_properties,
+                                               merges.pop(merged_univ_id, [])))
+
+
+def resolve_merged_identifiers(for_reac=False):
+    """
+    Maps every database ID to the lowest univ ID of its set and replays the properties of merged univ IDs.
+    :param for_reac: resolve reaction IDs instead of metabolite IDs
+    """
     if for_reac:
-        source_univ_id = source_id
-        other_univ_id = other_id
         id_mapper = reac_univ_id_dict
         prop_mapper = reac_univ_id_prop_dict
-
+        merges = reac_univ_id_merges
     else:
-        source_univ_id = met_univ_id_dict.get(source_id)
-        other_univ_id = met_univ_id_dict.get(other_id)
         id_mapper = met_univ_id_dict
         prop_mapper = met_univ_id_prop_dict
+        merges = met_univ_id_merges
 
-    source_id_properties = prop_mapper[source_univ_id]
-    other_properties = prop_mapper[other_univ_id]
+    for db_id, univ_id in id_mapper.items():
+        id_mapper[db_id] = find_univ_id(univ_id, for_reac)
 
-    if other_univ_id != source_univ_id:
-        if source_univ_id < other_univ_id:
-            for xref_id in other_properties['ids']:
-                id_mapper[xref_id] = source_univ_id
-            for key, value in other_properties.items():
-                if key == 'Name':
-                    add_values_to_property_list(source_id_properties[key], value, True)
-                else:
-                    add_values_to_property_list(source_id_properties[key], value)
+    for univ_id, properties in prop_mapper.items():
+        replay_merged_properties(properties, merges.pop(univ_id, []))
 
-            del prop_mapper[other_univ_id]
 
-        else:
-            for xref_id in source_id_properties['ids']:
-                id_mapper[xref_id] = other_univ_id
-            for key, value in source_id_properties.items():
-                if key == 'Name':
-                    add_values_to_property_list(other_properties[key], value, True)
-                else:
-                    add_values_to_property_list(other_properties[key], value)
+def add_repeated_ids():
+    """
+    Adds the metabolite IDs listed more than once again to the IDs of their univ IDs before cleaning,
+    which remove_conflicting_ids takes into account.
+    """
+    for univ_id, repeated_ids in met_repeated_ids.items():
+        met_univ_id_prop_dict[univ_id]['ids'].extend(repeated_ids)
+    met_repeated_ids.clear()
 
-            del prop_mapper[source_univ_id]
+
+def replay_merged_properties(properties, merges):
+    """
+    Adds the properties of merged univ IDs to the property sets of a univ ID
+    in the same order as if they had been copied when the univ IDs were merged.
+    Values of nested merges are added straight to the final sets, since a value skipped
+    when merging into an intermediate univ ID would also be skipped by the final univ ID.
+    :param properties: properties of univ ID
+    :param merges: list of (property set sizes at merge time, merged properties, merges of merged univ ID)
+    """
+    if not merges:
+        return
+
+    for key, value in properties.items():
+        if key == 'ids':
+            continue
+
+        # Names of merged univ IDs are compared ignoring case, using a case-folded shadow set
+        merged_values = {}
+        merged_names_lower = set()
+        pending_values = [(value, merges, False)]
+        while pending_values:
+            values, values_merges, merged = pending_values.pop()
+            if values_merges is None:
+                for prop_value in values:
+                    if key != 'Name':
+                        merged_values.setdefault(prop_value)
+                    elif (prop_value.lower() not in merged_names_lower) if merged else (prop_value not in merged_values):
+                        merged_values[prop_value] = None
+                        merged_names_lower.add(prop_value.lower())
+                continue
+
+            # Values are split around each merge and pushed in reverse, so that they are popped in order
+            values = list(values)
+            start = 0
+            values_in_order = []
+            for property_sizes, merged_properties, merged_univ_id_merges in values_merges:
+                values_in_order.append((values[start:property_sizes[key]], None, merged))
+                values_in_order.append((merged_properties[key], merged_univ_id_merges, True))
+                start = property_sizes[key]
+            values_in_order.append((values[start:], None, merged))
+            pending_values += reversed(values_in_order)
+
+        properties[key] = merged_values
 
 
 def clean_id_mapping_dictionary(id_dictionary, info_dictionary, for_reac=False):
-    dict_copy_id_converter = {}
-    dict_copy_info = {}
-    db_name_dict = {}
+    """
+    Maps the database IDs without their database prefix to univ IDs and copies the properties of the mapped univ IDs.
+    IDs of different databases with the same key are mapped to the univ ID of the preferred database,
+    compared with the database of the first ID with the key, and the key is removed from the IDs of the other univ ID.\n
+    :param id_dictionary: dictionary mapping database IDs to univ IDs
+    :param info_dictionary: dictionary mapping univ IDs to properties
+    :param for_reac: clean reaction dictionaries instead of metabolite dictionaries
+    :return: dictionary mapping database IDs without prefix to univ IDs, and dictionary mapping univ IDs to properties
+    """
     if for_reac:
         db_preference = {'metanetx': 0, 'seed': 1, 'bigg': 2, 'kegg': 3, 'sabiork': 4, 'metacyc': 5}
     else:
         db_preference = {'kegg': 0, 'chebi': 1, 'metanetx': 2, 'bigg': 3, 'seed': 4, 'sabiork': 5}
 
+    clean_id_dict = {}
+    key_preferences = {}  # preference of the database of the first ID with each key
+    conflicting_keys = {}  # keys to remove from the IDs of each univ ID, in order
     for db_id, fl_id in id_dictionary.items():
-        [db_name, new_key] = db_id.split(":", 1)
-        conflict_fl_id = dict_copy_id_converter.get(new_key)
-        if conflict_fl_id:
-            if db_preference.get(db_name, maxsize) > db_preference.get(db_name_dict[new_key], maxsize):
-                remove_conflicting_id(new_key, fl_id, info_dictionary)
-                fl_id = conflict_fl_id
-            else:
-                remove_conflicting_id(new_key, conflict_fl_id, info_dictionary)
+        db_name, new_key = db_id.split(":", 1)
+        conflict_fl_id = clean_id_dict.get(new_key)
+        if conflict_fl_id is None:
+            key_preferences[new_key] = db_preference.get(db_name, maxsize)
+        elif db_preference.get(db_name, maxsize) > key_preferences[new_key]:
+            conflicting_keys.setdefault(fl_id, []).append(new_key)
+            continue
+        else:
+            conflicting_keys.setdefault(conflict_fl_id, []).append(new_key)
 
-        dict_copy_id_converter[new_key] = fl_id
-        if new_key not in db_name_dict:
-            db_name_dict[new_key] = db_name
+        clean_id_dict[new_key] = fl_id
 
-    for univ_id in dict_copy_id_converter.values():
-        copied_info = info_dictionary[univ_id].copy()
-        copied_info['ids'] = list(set(copied_info['ids']))
-        dict_copy_info[univ_id] = copied_info
+    clean_info_dict = {}
+    for univ_id in clean_id_dict.values():
+        if univ_id in clean_info_dict:
+            continue
 
-    log(f"Number of database ids: {len(dict_copy_id_converter)}")
-    log(f"Number of univ ids: {len(dict_copy_info)}")
+        properties = info_dictionary[univ_id]
+        ids = properties['ids']
+        if univ_id in conflicting_keys:
+            ids = remove_conflicting_ids(ids, conflicting_keys[univ_id])
+        ids = list(dict.fromkeys(ids))
+        clean_info_dict[univ_id] = {key: ids if key == 'ids' else list(value) for key, value in properties.items()}
+
+    log(f"Number of database ids: {len(clean_id_dict)}")
+    log(f"Number of univ ids: {len(clean_info_dict)}")
     log("")
 
-    return dict_copy_id_converter, dict_copy_info
+    return clean_id_dict, clean_info_dict
 
 
-def remove_conflicting_id(db_id, fl_id_to_update, info_dict):
-    other_db_id = []
-    if len(info_dict[fl_id_to_update]['ids']) > 1:
-        for other_id in info_dict[fl_id_to_update]['ids']:
-            if db_id == other_id.split(":", 1)[1]:
-                other_db_id.append(other_id)
-        for d_id in other_db_id:
-            info_dict[fl_id_to_update]['ids'].remove(d_id)
+def remove_conflicting_ids(ids, conflicting_keys):
+    """
+    Removes the IDs with conflicting keys from the IDs of a univ ID.
+    Keys are removed in order, and only while more than one ID is left, so the last IDs of a univ ID are kept.\n
+    :param ids: IDs of univ ID
+    :param conflicting_keys: keys to remove, in order
+    :return: list of the IDs left
+    """
+    key_counts = Counter(db_id.split(":", 1)[1] for db_id in ids)
+    ids_left = len(ids)
+    removed_keys = set()
+    for key in conflicting_keys:
+        if ids_left > 1:
+            ids_left -= key_counts.pop(key, 0)
+            removed_keys.add(key)
 
-    if len(info_dict[fl_id_to_update]['ids']) == 0:
-        del info_dict[fl_id_to_update]
+    return [db_id for db_id in ids if db_id.split(":", 1)[1] not in removed_keys]
 
 
 # Main program
-def build_id_mapping(delete_database_files):
+def build_id_mapping(delete_database_files, force=False, resume=False,
+                     rerun_stage=None, file_reader=None, source_dir=None, download_files=None,
+                     build_stage_callback=None, stop_event=None):
     """
     Main function that downloads database files and processes them to merge identifiers into a mapping dictionary.
-    Mapping dictionary is serialized and saved.
+    Mapping dictionary is serialized and saved, and then the build is marked as completed with complete_build.
+    :param delete_database_files: delete the downloaded database files after processing them, keeping the checkpoints
+    :param force: rebuild the mapping dictionaries even if no database changed since the last update
+    :param resume: continue the last build from its last checkpoint if it did not complete
+    :param rerun_stage: name of a stage of the last build to run again with its following stages
+    :param file_reader: reader function replacing the reader of the database file of the stage run again
+    :param source_dir: directory of database files used instead of downloading them, as described in load_source_files
+    :param download_files: function downloading the database files instead of download_database_files
+    :param build_stage_callback: function called with the record of each stage of the build when it finishes
+    :param stop_event: threading.Event that stops the build before its next stage, raising CancelledError, when set
+    :return: metabolite and reaction mapping dictionaries, or None if no database changed
     """
-    global met_univ_id_dict, met_univ_id_prop_dict, \
-        reac_univ_id_dict, reac_univ_id_prop_dict
+    with report_build_progress(build_stage_callback, stop_event):
+        return create_id_mapping(delete_database_files, force, resume, rerun_stage, file_reader,
+                                 source_dir, download_files)
 
+
+def create_id_mapping(delete_database_files, force, resume, rerun_stage, file_reader, source_dir,
+                      download_files):
+    """
+    Downloads or loads the database files and processes them, as described in build_id_mapping.
+    """
+    global build_report
     print("Creating directories")
     create_directories()
+    build_report = []
 
-    log("Downloading files (this can take several hours)")
-    tic = perf_counter()
-
-    download_database_files()
-
-    toc = perf_counter()
-    log("")
-    log(f"All files downloaded in {(toc - tic) / 60:0.3f} min")
-
-    log("Processing metabolites")
-    tic = perf_counter()
+    build_checkpoints = load_build_checkpoints() if (resume or rerun_stage) else None
+    if rerun_stage is not None and build_checkpoints is None:
+        raise ValueError("The last build has no checkpoints to rerun a stage from")
 
-    # Process KeGG database metabolites
-    process_kegg_compounds(kegg_metabolites_filename)
+    if (build_checkpoints is not None) and ((rerun_stage is not None) or not build_checkpoints['completed']):
+        log("Resuming the last build with its downloaded files")
+        build_stages = None
 
-    # Process ChEBI database metabolite IDs
-    process_met_file(chebi_compound_structure_filename, chebi_compounds_inchi_reader)
-    process_met_file(chebi_compounds_filename, chebi_compounds_names)
+    else:
+        if source_dir is not None:
+            log(f"Using the database files of {source_dir}")
+            with report_build_stage('load_source_files'):
+                databases_changed = load_source_files(source_dir, force)
 
-    # Process MetaNetX database metabolite IDs
-    process_met_file(mx_chem_prop_filename, metanetx_chem_prop_line_reader)
-    process_cross_ref_info(mx_met_depr_filename, metanetx_chem_depr_reader)
-    process_met_file(mx_met_xref_filename, metanetx_chem_xref_line_reader)
-    process_cross_ref_info(mx_met_xref_filename, metanetx_chem_xref_reader)
+        else:
+            log("Downloading files (this can take several hours)")
+            tic = perf_counter()
 
-    # Process BiGG database metabolite IDs
-    process_met_file(bigg_metabolites_filename, bigg_metabolites_line_reader)
-    process_cross_ref_info(bigg_metabolites_filename, bigg_models_xref_reader)
+            with report_build_stage('download_database_files'):
+                databases_changed = (download_files or download_database_files)(force)
 
-    # Process ModelSEED database metabolite IDs
-    process_met_file(ms_met_filename, modelseed_metabolites_line_reader)
-    process_cross_ref_info(ms_met_filename, modelseed_metabolites_xref_reader)
-    process_cross_ref_info(ms_met_aliases_filename, modelseed_met_aliases_reader)
+            toc = perf_counter()
+            log("")
+            log(f"All files downloaded in {(toc - tic) / 60:0.3f} min")
 
-    # Process reaction IDs from modelSEED, MetaNetX, and BiGG
-    process_reac_file(ms_reac_filename, modelSeed_reactions_line_reader)
-    process_reac_file(ms_reac_pathways_filename, modelSeed_reaction_pathways_line_reader)
-    process_reac_file(mx_reac_prop_filename, metanetx_reaction_prop_line_reader)
-    process_reac_file(mx_reac_xref_filename, metanetx_reaction_xref_line_reader)
-    process_reac_file(bigg_reactions_filename, bigg_reactions_line_reader)
+        if not databases_changed:
+            flush_log()
+            print("ID mapping tables are up to date.")
+            return None
 
-    log("Cleaning reaction id mapping dictionary")
-    reac_univ_id_dict, reac_univ_id_prop_dict = clean_id_mapping_dictionary(reac_univ_id_dict,
-                                                                              reac_univ_id_prop_dict,
-                                                                              for_reac=True)
+        build_stages = get_build_stages()
+        start_build_checkpoints()
 
-    log("Cleaning metabolite id dictionary")
-    met_univ_id_dict, met_univ_id_prop_dict = clean_id_mapping_dictionary(met_univ_id_dict,
-                                                                            met_univ_id_prop_dict)
+    log("Processing metabolites")
+    tic = perf_counter()
 
-    if(delete_database_files):
+    if trace_build_memory:
+        tracemalloc.start()
+    try:
+        if build_stages is None:
+            resume_build(build_checkpoints, rerun_stage, file_reader)
+        else:
+            reset_build_state()
+            run_build_stages(build_stages, checkpoint=True)
+    finally:
+        if trace_build_memory:
+            tracemalloc.stop()
+        flush_log()
+
+    if delete_database_files:
         log("Deleting downloads")
-        shutil.rmtree(files_dir)
+        delete_downloaded_files()
 
     toc = perf_counter()
     log("")
     log(f"All database identifiers processed in {(toc - tic) / 60:0.3f} min")
     log("")
+    flush_log()
     print(f"New ID mapping tables created.")
 
-    return met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict
\ No newline at end of file
+    return met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict
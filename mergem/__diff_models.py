@@ -0,0 +1,126 @@
+"""
+    Compares two versions of a model using mergem dictionaries, reporting the metabolites and reactions
+    added, removed, renamed, or with changed stoichiometry, without building a merged model.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from . import __model_handling
+from .__merge_models import map_metabolite_to_mergem_id
+import pandas as pd
+
+diff_changes = ['removed', 'added', 'renamed', 'stoichiometry']
+
+
+def diff(old_model, new_model, exact_sto=False, use_prot=False):
+    """
+    Takes two versions of a model, as cobra models or file names, and reports their differences. Metabolites are
+    compared by their mergem id, or their id if not mapped, and reactions by their reaction key as when merging.
+    Entities with the same id in both versions are kept, entities with a new id but the same mergem id or reaction
+    key are renamed, and reactions with the same id but different metabolites or stoichiometric coefficients
+    have changed stoichiometry.\n
+    :param old_model: cobra model or file name of the old version
+    :param new_model: cobra model or file name of the new version
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used to find renamed reactions
+    :param use_prot: Boolean to consider hydrogen and proton when finding renamed reactions
+    :return: pandas data frame with a row for each difference, with columns type ('metabolite' or 'reaction'),
+            change ('removed', 'added', 'renamed', or 'stoichiometry'), old_id, and new_id.
+    """
+    __model_handling.load_met_univ_id_dict()
+
+    models = [__model_handling.load_model(model) if isinstance(model, str) else model
+              for model in (old_model, new_model)]
+    met_keys = [{metabolite.id: map_metabolite_to_mergem_id(metabolite) or metabolite.id
+                 for metabolite in model.metabolites} for model in models]
+
+    rows = []
+    for change, old_id, new_id in diff_entities(*met_keys):
+        if change is not None:
+            rows.append(('metabolite', change, old_id, new_id))
+
+    reac_keys, rev_reac_keys, reac_stoichiometries = [], [], []
+    for model, model_met_keys in zip(models, met_keys):
+        model_reac_keys, model_rev_reac_keys, model_reac_stoichiometries = {}, {}, {}
+        for reaction in model.reactions:
+            model_reac_keys[reaction.id], model_rev_reac_keys[reaction.id] = \
+                create_diff_reaction_key(reaction, model_met_keys, exact_sto, use_prot)
+            model_reac_stoichiometries[reaction.id] = frozenset(
+                (model_met_keys[metabolite.id], coefficient) for metabolite, coefficient in reaction.metabolites.items())
+        reac_keys.append(model_reac_keys)
+        rev_reac_keys.append(model_rev_reac_keys)
+        reac_stoichiometries.append(model_reac_stoichiometries)
+
+    old_reac_stoichiometries, new_reac_stoichiometries = reac_stoichiometries
+    for change, old_id, new_id in diff_entities(*reac_keys, rev_reac_keys[1]):
+        if change is None:
+            if old_reac_stoichiometries[old_id] != new_reac_stoichiometries[new_id]:
+                rows.append(('reaction', 'stoichiometry', old_id, new_id))
+        else:
+            rows.append(('reaction', change, old_id, new_id))
+
+    differences = pd.DataFrame(rows, columns=['type', 'change', 'old_id', 'new_id'])
+    differences['type'] = pd.Categorical(differences['type'], categories=['metabolite', 'reaction'])
+    differences['change'] = pd.Categorical(differences['change'], categories=diff_changes)
+
+    return differences.sort_values(['type', 'change'], kind='stable', ignore_index=True)
+
+
+def diff_entities(old_keys, new_keys, rev_new_keys=None):
+    """
+    Pairs the metabolites or reactions of two versions of a model by their id, and then the rest by their key.\n
+    :param old_keys: dictionary of the key of each id of the old version
+    :param new_keys: dictionary of the key of each id of the new version
+    :param rev_new_keys: dictionary of the reverse key of each id of the new version, for reactions
+    :return: list of (change, old_id, new_id), with change None for ids in both versions
+    """
+    differences = []
+    new_ids_by_key = {}
+    for new_id, new_key in new_keys.items():
+        if new_id not in old_keys:
+            new_ids_by_key.setdefault(new_key, []).append(new_id)
+            if rev_new_keys is not None:
+                new_ids_by_key.setdefault(rev_new_keys[new_id], []).append(new_id)
+
+    renamed_new_ids = set()
+    for old_id, old_key in old_keys.items():
+        if old_id in new_keys:
+            differences.append((None, old_id, old_id))
+            continue
+
+        # First new id with the same key not yet paired with another old id
+        new_id = next((new_id for new_id in new_ids_by_key.get(old_key, []) if new_id not in renamed_new_ids), None)
+        if new_id is None:
+            differences.append(('removed', old_id, None))
+        else:
+            renamed_new_ids.add(new_id)
+            differences.append(('renamed', old_id, new_id))
+
+    for new_id in new_keys:
+        if new_id not in old_keys and new_id not in renamed_new_ids:
+            differences.append(('added', None, new_id))
+
+    return differences
+
+
+def create_diff_reaction_key(reaction, met_keys, exact_sto, use_prot):
+    """
+    Creates the key of a reaction as when merging, from the keys of its metabolites in the model.\n
+    :param reaction: Cobra reaction object
+    :param met_keys: dictionary of the mergem id, or id if not mapped, of each metabolite of the model
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used
+    :param use_prot: Boolean to consider hydrogen and proton
+    :return: frozen sets of pairs of metabolite keys and stoichiometric coefficients of the reaction and its reverse
+    """
+    reac_metabolite_set = set()
+    reac_rev_met_set = set()
+    for metabolite, coefficient in reaction.metabolites.items():
+        met_key = met_keys[metabolite.id]
+        if (not use_prot) and (met_key.startswith(__model_handling.proton_mergem_id) or metabolite.name == "PMF"):
+            continue
+
+        elif metabolite.id[-1] != 'b':
+            stoc = coefficient if exact_sto else (1 if coefficient > 0 else -1)
+            reac_metabolite_set.add((met_key, stoc))
+            reac_rev_met_set.add((met_key, -stoc))
+
+    return frozenset(reac_metabolite_set), frozenset(reac_rev_met_set)
@@ -1,9 +1,13 @@
 from .__version import _version
 from .__merge_models import merge, translate
+from .__cluster_models import cluster_models
+from .__diff_models import diff
+from .__merge_subsets import merge_subsets
+from .__async_api import merge_async, translate_async, load_model_async, save_model_async, update_id_mapper_async
 from .__model_handling import load_model, save_model, map_localization, map_metabolite_univ_id, map_reaction_univ_id, \
-    get_metabolite_properties, get_reaction_properties, update_id_mapper, save_mapping_tables
+    get_metabolite_properties, get_reaction_properties, update_id_mapper, rerun_mapper_stage, save_mapping_tables
 
-all__ = ["merge", "translate", "load_model", "save_model", "map_localization", "map_metabolite_univ_id", "map_reaction_univ_id", \
-         "get_metabolite_properties", "get_reaction_properties", "update_id_mapper", "save_mapping_tables"]
+all__ = ["merge", "translate", "cluster_models", "diff", "merge_subsets", "merge_async", "translate_async", "load_model_async", "save_model_async", "update_id_mapper_async", "load_model", "save_model", "map_localization", "map_metabolite_univ_id", "map_reaction_univ_id", \
+         "get_metabolite_properties", "get_reaction_properties", "update_id_mapper", "rerun_mapper_stage", "save_mapping_tables"]
 version__ = _version
 
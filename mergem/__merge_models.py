@@ -10,7 +10,17 @@
 from . import __model_handling
 from . import __version
 import cobra
+import numpy as np
+import pandas as pd
 from collections import defaultdict
+from pickle import dump, load
+import hashlib
+import os
+
+user_cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+preprocessing_cache_dir = os.path.join(user_cache_dir, 'mergem', 'preprocessing')  # per-user cache of model files
+use_preprocessing_cache = False  # cache the mergem ids and reaction keys of model files, by their content hash
+numbered_duplicate_reac_ids = False  # name duplicate reaction ids ACALD~, ACALD~2, ... instead of ACALD~, ACALD~~, ...
 
 # translate all metabolite and reaction IDs to a target namespace
 def translate(input_model, trans_to_db=None):
@@ -25,7 +35,8 @@ def translate(input_model, trans_to_db=None):
 
 # merges models in a list to the template/first model
 # set_objective can be an integer for model obj or 'merge'
-def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False, extend_annot=False, trans_to_db=None, community_model=False):
+def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False, extend_annot=False, trans_to_db=None, community_model=False,
+          sources_table=False, near_duplicates=0):
     """
     Takes a list of cobra models or file names as input and merges them into a single model with the chosen objective. \n
     :param input_models: list of cobr+a models or file names
@@ -35,28 +46,34 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
     :param add_annot: Boolean to add additional metabolite and reaction annotations from mergem dictionaries
     :param trans_to_db: target database to be translated to
     :param community_model: Boolean to consider community metabolites when merging
+    :param sources_table: Boolean to return met & reac sources as tables with their presence matrices
+            instead of dictionaries
+    :param near_duplicates: maximum number of metabolites by which reactions of different models can differ to be
+            reported as near-duplicates (default 0, no report)
     :return: a dictionary of the merged model, met & reac jaccard distances, num of mets and reacs merged,
             and met & reac sources.
     """
     __model_handling.load_met_univ_id_dict()
-    models = []
+    models, model_files = [], []
 
     for input_model in input_models:
         if isinstance(input_model, str):
             try:
-                input_model = __model_handling.load_model(input_model)
-                models.append(input_model)
+                models.append(__model_handling.load_model(input_model))
+                model_files.append(input_model)
 
             except Exception as e:
                 print("Error loading model: ", e)
 
         else:
             models.append(input_model)
+            model_files.append(None)
 
     objective_reactions = []
     met_model_id_dict, met_sources_dict, merged_model_reactions_dict = {}, {}, {}
     met_sources_dict = defaultdict(lambda:defaultdict(list))
     reac_sources_dict = defaultdict(lambda:defaultdict(list))
+    indexed_reactions, reaction_index = [], defaultdict(list)  # merged reactions by metabolite for near-duplicates
 
     merged_model_id = 'mergem'
     merged_model_name = 'Mergem of '
@@ -65,6 +82,10 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
 
     if community_model:
         compartmentalize(models)
+        model_files = [None] * len(models)  # models no longer match their files
+
+    preprocessed_models = [preprocess_model(model, model_file, exact_sto, use_prot)
+                           for model, model_file in zip(models, model_files)]
 
     # Add first model
     model = models[0]
@@ -73,15 +94,19 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
     model_objectives = []
 
     dict_met_annot, dict_reac_annot, dict_gprs = {}, {}, {}
+    duplicate_reac_id_counts = {}
 
 
 
     merged_compartments = model.compartments
+    preprocessed_model = preprocessed_models[0]
+    mergem_ids = preprocessed_model['mergem_ids']
+    metabolite_ids = {}
 
     for metabolite in model.metabolites:
         merged_model_metabolites.append(metabolite)
         old_met_id = metabolite.id
-        new_met_id = map_metabolite_to_mergem_id(metabolite)
+        new_met_id = mergem_ids[old_met_id]
 
         if (new_met_id is None) or (new_met_id in met_sources_dict):
             met_sources_dict[old_met_id][0].append(old_met_id)
@@ -93,21 +118,27 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
                 met_model_id_dict[new_met_id].append(old_met_id)
             else:
                 met_model_id_dict[new_met_id] = [old_met_id]
-            metabolite.id = new_met_id
+            metabolite_ids[metabolite] = new_met_id
+
+    kept_metabolites = {met for met in model.metabolites if mergem_ids[met.id] and met not in metabolite_ids}
+    rename_metabolites(model, metabolite_ids)
 
     for reaction in model.reactions:
         reac_id = reaction.id
-        if reac_id in str(model.objective):  # processing objective reactions
+        if reac_id in preprocessed_model['objective_ids']:  # processing objective reactions
             model_objectives.append(reaction)
         else:
             merged_model_reactions.append(reaction)
             reac_sources_dict[reac_id][0].append(reac_id)
-            reaction_key, rev_reaction_key = create_reaction_key(reaction, exact_sto, use_prot)
+            reaction_key, rev_reaction_key = get_reaction_key(reaction, preprocessed_model, kept_metabolites,
+                                                              exact_sto, use_prot)
+            if near_duplicates:
+                index_reaction(reaction, reaction_key, rev_reaction_key, indexed_reactions, reaction_index)
             if not reaction_key in merged_model_reactions_dict:
                 merged_model_reactions_dict[reaction_key] = reac_id
 
             dict_reac_annot[reac_id] = reaction.annotation
-            dict_gprs[reac_id] = reaction.gpr
+            dict_gprs[reac_id] = __model_handling.gpr_clauses(reaction.gpr)
     objective_reactions.append(model_objectives)
 
     # Merge rest of models
@@ -117,12 +148,16 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
         merged_model_name += '; ' + (model.name if model.name else model.id)
 
         merged_compartments = model.compartments | merged_compartments
+        preprocessed_model = preprocessed_models[model_index]
+        mergem_ids = preprocessed_model['mergem_ids']
         model_objectives = []
         model_metabolite_ids = {m.id for m in model.metabolites}
+        metabolite_ids, renamed_metabolites = {}, {}  # metabolites renamed once the model is processed
+        reaction_ids = {}
 
         for metabolite in model.metabolites:
             old_met_id = metabolite.id
-            new_met_id = map_metabolite_to_mergem_id(metabolite)
+            new_met_id = mergem_ids[old_met_id]
 
             if new_met_id is None:
                 if old_met_id in met_sources_dict:
@@ -139,14 +174,14 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
 
             elif new_met_id in met_sources_dict:  # new metabolite id previously found
                 old_met_ids = met_model_id_dict[new_met_id]
-                if (old_met_id not in old_met_ids) and any(id in old_met_ids for id in model_metabolite_ids):  # model has a better match
+                if (old_met_id not in old_met_ids) and not model_metabolite_ids.isdisjoint(old_met_ids):  # model has a better match
                     met_sources_dict[old_met_id][model_index].append(old_met_id)
                     merged_model_metabolites.append(metabolite)
                     dict_met_annot[old_met_id] = metabolite.annotation
 
                 elif model_index in met_sources_dict[new_met_id]:  # model already had a metabolite for this mergem id
                     for reaction in metabolite.reactions:  # replace id in its reactions
-                        if new_met_id in [met.id for met in reaction.metabolites]: # new metabolite id conflict, keep it
+                        if new_met_id in [metabolite_ids.get(met, met.id) for met in reaction.metabolites]: # new metabolite id conflict, keep it
                             if old_met_id not in met_sources_dict:  # first reaction with conflict
                                 met_sources_dict[old_met_id][model_index].append(old_met_id)
                                 merged_model_metabolites.append(metabolite)
@@ -154,14 +189,16 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
 
                         else:  # substitute metabolite in reaction
                             st_coeff = reaction.metabolites[metabolite]
-                            reaction.add_metabolites({old_met_id: -st_coeff})
-                            reaction.add_metabolites({new_met_id: st_coeff})
+                            reaction.add_metabolites({metabolite: -st_coeff})
+                            reaction.add_metabolites({renamed_metabolites.get(new_met_id, new_met_id): st_coeff})
                 else:
                     met_sources_dict[new_met_id][model_index].append(old_met_id)
-                    metabolite.id = new_met_id
+                    metabolite_ids[metabolite] = new_met_id
+                    renamed_metabolites[new_met_id] = metabolite
                     __model_handling.add_annotations(new_met_id, dict_met_annot, metabolite)
             else:
-                metabolite.id = new_met_id
+                metabolite_ids[metabolite] = new_met_id
+                renamed_metabolites[new_met_id] = metabolite
                 met_sources_dict[new_met_id][model_index].append(old_met_id)
                 merged_model_metabolites.append(metabolite)
                 dict_met_annot[new_met_id] = metabolite.annotation
@@ -170,12 +207,16 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
                 else:
                     met_model_id_dict[new_met_id] = [old_met_id]
 
+        kept_metabolites = {met for met in model.metabolites if mergem_ids[met.id] and met not in metabolite_ids}
+        rename_metabolites(model, metabolite_ids)
+
         for reaction in model.reactions:
             reac_id = reaction.id
-            if reac_id in str(model.objective):  # processing objective reactions
+            if reac_id in preprocessed_model['objective_ids']:  # processing objective reactions
                 model_objectives.append(reaction)
             else:
-                reaction_key, rev_reaction_key = create_reaction_key(reaction, exact_sto, use_prot)
+                reaction_key, rev_reaction_key = get_reaction_key(reaction, preprocessed_model, kept_metabolites,
+                                                                  exact_sto, use_prot)
                 if reaction_key in merged_model_reactions_dict:
                     existing_reac_id = merged_model_reactions_dict[reaction_key]
                     reac_sources_dict[existing_reac_id][model_index].append(reac_id)
@@ -200,17 +241,22 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
                 else:
                     orig_reac_id = reac_id
                     if reac_id in reac_sources_dict:
-                        reac_id += '~'
-                        while reac_id in reac_sources_dict:
-                            reac_id += '~'
-                        reaction.id = reac_id
+                        # Search from the last duplicate of this id, since ids are never removed
+                        duplicates = duplicate_reac_id_counts.get(orig_reac_id, 1)
+                        while (reac_id := get_duplicate_reac_id(orig_reac_id, duplicates)) in reac_sources_dict:
+                            duplicates += 1
+                        duplicate_reac_id_counts[orig_reac_id] = duplicates
+                        reaction_ids[reaction] = reac_id
 
                     merged_model_reactions.append(reaction)
                     merged_model_reactions_dict[reaction_key] = reac_id
+                    if near_duplicates:
+                        index_reaction(reaction, reaction_key, rev_reaction_key, indexed_reactions, reaction_index)
                     reac_sources_dict[reac_id][model_index].append(orig_reac_id)
                     dict_reac_annot[reac_id] = reaction.annotation
-                    dict_gprs[reac_id] = reaction.gpr
+                    dict_gprs[reac_id] = __model_handling.gpr_clauses(reaction.gpr)
 
+        rename_reactions(model, reaction_ids)
         objective_reactions.append(model_objectives)
 
     if exact_sto:
@@ -257,8 +303,10 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
         trans_to_db += ':'
 
     # Post-processing metabolites
+    merged_met_ids = {metabolite.id for metabolite in merged_model.metabolites}
+    metabolite_ids = {}
     for metabolite in merged_model.metabolites:
-        metabolite.annotation = dict_met_annot.get(metabolite.id, {})
+        metabolite.annotation = __model_handling.finalize_annotations(dict_met_annot.get(metabolite.id, {}))
         old_met_id = None
         if trans_to_db or extend_annot:
             met_id_array = metabolite.id.split("_")
@@ -268,7 +316,7 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
                 met_props = __model_handling.get_metabolite_properties(met_univ_id)
 
                 if extend_annot:
-                    __model_handling.extend_metabolite_annotations(metabolite, met_props)
+                    __model_handling.extend_metabolite_annotations(metabolite, met_univ_id, met_props)
 
                 if trans_to_db:
                     trans_met_id = next(
@@ -282,28 +330,34 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
             old_met_id = met_model_id_dict.get(metabolite.id, [metabolite.id])[0]
 
         if old_met_id != metabolite.id:
-            if old_met_id in merged_model.metabolites:
+            if old_met_id in merged_met_ids:
                 alt_old_met_id = old_met_id
-                while alt_old_met_id in merged_model.metabolites:
+                while alt_old_met_id in merged_met_ids:
                     if (idx := alt_old_met_id.rfind('@')) > 0 or (idx := alt_old_met_id.rfind('_')) > 0:
                         alt_old_met_id = alt_old_met_id[:idx] + '~' + alt_old_met_id[idx:]
                     else:
                         alt_old_met_id += '~'
                 met_sources_dict[alt_old_met_id] = met_sources_dict[old_met_id]
                 old_met_id = alt_old_met_id
-            metabolite.id = old_met_id
+            merged_met_ids.remove(metabolite.id)
+            merged_met_ids.add(old_met_id)
+            metabolite_ids[metabolite] = old_met_id
+
+    rename_metabolites(merged_model, metabolite_ids)
 
     # Post-processing reactions
+    merged_reac_ids = {reaction.id for reaction in merged_model.reactions}
+    reaction_ids = {}
     for reaction in merged_model.reactions:
-        reaction.annotation = dict_reac_annot.get(reaction.id, {})
-        if reaction.id in dict_gprs: reaction.gpr = dict_gprs[reaction.id]
+        reaction.annotation = __model_handling.finalize_annotations(dict_reac_annot.get(reaction.id, {}))
+        if gpr_clauses := dict_gprs.get(reaction.id): __model_handling.build_gpr(reaction, gpr_clauses)
 
         if trans_to_db or extend_annot:
             if reac_mergem_id := __model_handling.map_reaction_univ_id(reaction.id):
                 reac_props = __model_handling.get_reaction_properties(reac_mergem_id)
 
                 if extend_annot:
-                    __model_handling.extend_reaction_annotations(reaction, reac_props)
+                    __model_handling.extend_reaction_annotations(reaction, reac_mergem_id, reac_props)
 
                 if trans_to_db:
                     new_reac_id = next(
@@ -311,11 +365,13 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
                         None)
 
                     if new_reac_id:
-                        while new_reac_id in merged_model.reactions:
+                        while new_reac_id in merged_reac_ids:
                             new_reac_id += '~'
 
                         reac_sources_dict[new_reac_id] = reac_sources_dict[reaction.id]
-                        reaction.id = new_reac_id
+                        merged_reac_ids.remove(reaction.id)
+                        merged_reac_ids.add(new_reac_id)
+                        reaction_ids[reaction] = new_reac_id
             elif trans_to_db: # Translate reactions with a metabolite id (e.g., exchange reactions)
                 reac_id_array = reaction.id.split('_')
                 met_univ_id = None if len(reac_id_array) < 2 else __model_handling.map_metabolite_univ_id('_'.join(reac_id_array[1:]))
@@ -325,11 +381,15 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
                         ((reac_id_array[0] + '_' + s[len(trans_to_db):] + (('_' + reac_id_array[-1]) if len(reac_id_array) > 2 else '')) for s in met_props['ids'] if s.startswith(trans_to_db)), 
                         None)
                     if new_reac_id:
-                        while new_reac_id in merged_model.reactions:
+                        while new_reac_id in merged_reac_ids:
                             new_reac_id += '~'
 
                         reac_sources_dict[new_reac_id] = reac_sources_dict[reaction.id]
-                        reaction.id = new_reac_id
+                        merged_reac_ids.remove(reaction.id)
+                        merged_reac_ids.add(new_reac_id)
+                        reaction_ids[reaction] = new_reac_id
+
+    rename_reactions(merged_model, reaction_ids)
 
     # Post-processing genes
     if extend_annot:
@@ -338,15 +398,25 @@ def merge(input_models, set_objective='merge', exact_sto=False, use_prot=False,
 
     merged_model.repair()
     
-    # Clean source dicts
-    met_sources_dict = {m.id: {model_index:(ids if len(ids) > 1 else ids[0]) 
-                               for model_index,ids in met_sources_dict[m.id].items()}
-                               for m in merged_model.metabolites}
-    reac_sources_dict = {r.id: {model_index:(ids if len(ids) > 1 else ids[0]) 
-                                for model_index,ids in reac_sources_dict[r.id].items()} 
-                                for r in merged_model.reactions}
-
     results = {}
+    if near_duplicates:
+        results['near_duplicate_reactions'] = find_near_duplicate_reactions(
+            indexed_reactions, reaction_index, reac_sources_dict, near_duplicates)
+
+    if sources_table:
+        met_sources_dict, results['met_presence'] = create_sources_table(
+            met_sources_dict, [m.id for m in merged_model.metabolites], len(models), 'met_id')
+        reac_sources_dict, results['reac_presence'] = create_sources_table(
+            reac_sources_dict, [r.id for r in merged_model.reactions], len(models), 'reac_id')
+
+    else:  # Clean source dicts
+        met_sources_dict = {m.id: {model_index:(ids if len(ids) > 1 else ids[0]) 
+                                   for model_index,ids in met_sources_dict[m.id].items()}
+                                   for m in merged_model.metabolites}
+        reac_sources_dict = {r.id: {model_index:(ids if len(ids) > 1 else ids[0]) 
+                                    for model_index,ids in reac_sources_dict[r.id].items()} 
+                                    for r in merged_model.reactions}
+
     results['merged_model'] = merged_model
     results['jacc_matrix'] = jacc_matrix
     results['num_met_merged'] = num_mets_merged
@@ -466,15 +536,21 @@ def find_bracket(metabolite_id_components):
 
 
 def compartmentalize(models):
+    """
+    Assigns the metabolites of each model to their own numbered compartments, except for the extracellular and
+    boundary metabolites shared by all models. The metabolites of each model are renamed at once.\n
+    :param models: list of cobra models
+    """
     num_compartments_used = 0
     for model in models:
         compartments_dict = {}
+        metabolite_ids, metabolite_compartments = {}, {}
         for metabolite in model.metabolites:
             met_id, loc, comp = split_metabolite_id(metabolite.id)
 
             if loc == 'e' or loc == 'b':
-                metabolite.id = met_id + '_' + loc
-                metabolite.compartment = loc
+                metabolite_ids[metabolite] = met_id + '_' + loc
+                metabolite_compartments[metabolite] = loc
             else:
                 if loc is None:
                     loc = 'c'
@@ -486,8 +562,83 @@ def compartmentalize(models):
                     compartments_dict[comp] = num_compartments_used
                     comp = num_compartments_used
 
-                metabolite.id = met_id + '_' + str(loc) + str(comp)
-                metabolite.compartment = str(loc) + str(comp)
+                metabolite_ids[metabolite] = met_id + '_' + str(loc) + str(comp)
+                metabolite_compartments[metabolite] = str(loc) + str(comp)
+
+        rename_metabolites(model, metabolite_ids)
+        for metabolite, compartment in metabolite_compartments.items():
+            metabolite.compartment = compartment
+
+
+def rename_metabolites(model, metabolite_ids):
+    """
+    Renames metabolites of a model, in order, as if their ids were set one at a time.
+    The metabolites are taken out of the model metabolite list while they are renamed and added back at once,
+    since setting the id of a metabolite in the list rebuilds its whole index.\n
+    :param model: cobra model of the metabolites
+    :param metabolite_ids: dictionary of metabolites and their new ids
+    """
+    if not metabolite_ids:
+        return
+
+    model_met_ids = {metabolite.id for metabolite in model.metabolites}
+    metabolites = list(model.metabolites)
+    del model.metabolites[:]
+    try:
+        for metabolite, new_met_id in metabolite_ids.items():
+            if new_met_id == metabolite.id:
+                continue
+            if new_met_id in model_met_ids:
+                raise ValueError(f"The model already contains a metabolite with the id: {new_met_id}")
+
+            model_met_ids.remove(metabolite.id)
+            model_met_ids.add(new_met_id)
+            metabolite.id = new_met_id
+    finally:
+        model.metabolites.extend(metabolites)
+
+
+def rename_reactions(model, reaction_ids):
+    """
+    Renames reactions of a model, in order, as if their ids were set one at a time.
+    The reactions are taken out of the model reaction list while they are renamed and added back at once,
+    since setting the id of a reaction in the list rebuilds its whole index.\n
+    :param model: cobra model of the reactions
+    :param reaction_ids: dictionary of reactions and their new ids
+    """
+    if not reaction_ids:
+        return
+
+    model_reac_ids = {reaction.id for reaction in model.reactions}
+    reactions = list(model.reactions)
+    del model.reactions[:]
+    try:
+        for reaction, new_reac_id in reaction_ids.items():
+            if new_reac_id == reaction.id:
+                continue
+            if new_reac_id in model_reac_ids:
+                raise ValueError(f"The model already contains a reaction with the id: {new_reac_id}")
+
+            model_reac_ids.remove(reaction.id)
+            model_reac_ids.add(new_reac_id)
+            reaction.id = new_reac_id
+    finally:
+        model.reactions.extend(reactions)
+
+
+def get_duplicate_reac_id(reac_id, duplicates):
+    """
+    Returns the id of a duplicate of a reaction id, followed by a '~' for each duplicate.
+    If numbered_duplicate_reac_ids is set, the id is followed by a '~' and the number of the duplicate
+    from the second one, so that the ids of community models with many members stay within the name length of solvers.\n
+    :param reac_id: reaction id
+    :param duplicates: number of the duplicate
+    :return: id of the duplicate
+    """
+    if numbered_duplicate_reac_ids and duplicates > 1:
+        return reac_id + '~' + str(duplicates)
+
+    return reac_id + '~' * duplicates
 
 
 # returns a metabolite id in mergem namespace with cellular localization
@@ -532,23 +683,29 @@ def map_metabolite_to_mergem_id(metabolite):
 
 
 # reaction key is a frozenset of tuples of participating mets with their stoichiometric coeffs
-def create_reaction_key(reaction, exact_sto, use_prot):
+def create_reaction_key(reaction, exact_sto, use_prot, mergem_ids=None):
     """
     Takes a reaction object as input and creates a key(frozen set) of all pairs of metabolite ID and stoichiometric
     coefficients. \n
     :param reaction: Cobra reaction object
     :param exact_sto: Reaction stoichiometric coefficient
     :param use_prot: Inclue hydrogen and protons
+    :param mergem_ids: dictionary of the mergem id of each metabolite id of the model before merging, to create the key
+            of the reaction once its mapped metabolites are renamed to their mergem ids
     :return: frozen set of pairs of IDs of participating metabolite and their stoichiometric coefficients
     """
     reac_metabolite_set = set()
     reac_rev_met_set = set()
     for reactant in reaction.reactants:
-        if (not use_prot) and (reactant.id.startswith(__model_handling.proton_mergem_id) or reactant.name == "PMF"):
+        reactant_id = reactant.id if mergem_ids is None else (mergem_ids[reactant.id] or reactant.id)
+        if (not use_prot) and (reactant_id.startswith(__model_handling.proton_mergem_id) or reactant.name == "PMF"):
             continue
 
-        elif reactant.id[-1] != 'b':
-            id = reactant.id if reactant.id.startswith('mergem_') else map_metabolite_to_mergem_id(reactant)
+        elif reactant_id[-1] != 'b':
+            if reactant_id.startswith('mergem_'):
+                id = reactant_id
+            else:
+                id = map_metabolite_to_mergem_id(reactant) if mergem_ids is None else None
             stoc = reaction.metabolites[reactant] if exact_sto else 1
             metabolite_set = (id, -stoc)
             rev_met_set = (id, stoc)
@@ -556,10 +713,14 @@ def create_reaction_key(reaction, exact_sto, use_prot):
             reac_rev_met_set.add(rev_met_set)
 
     for product in reaction.products:
-        if (not use_prot) and (product.id.startswith(__model_handling.proton_mergem_id) or product.name == "PMF"):
+        product_id = product.id if mergem_ids is None else (mergem_ids[product.id] or product.id)
+        if (not use_prot) and (product_id.startswith(__model_handling.proton_mergem_id) or product.name == "PMF"):
             continue
-        elif product.id[-1] != 'b':
-            id = product.id if product.id.startswith('mergem_') else map_metabolite_to_mergem_id(product)
+        elif product_id[-1] != 'b':
+            if product_id.startswith('mergem_'):
+                id = product_id
+            else:
+                id = map_metabolite_to_mergem_id(product) if mergem_ids is None else None
             stoc = reaction.metabolites[product] if exact_sto else 1
             metabolite_set = (id, stoc)
             rev_met_set = (id, -stoc)
@@ -572,6 +733,134 @@ def create_reaction_key(reaction, exact_sto, use_prot):
     return reac_metabolite_set, reac_rev_met_set
 
 
+def preprocess_model(model, model_file, exact_sto, use_prot):
+    """
+    Returns the mergem id of each metabolite of a model, the keys of its reactions once its metabolites are renamed
+    to their mergem ids, and the ids of its objective reactions. The preprocessing of a model file is cached in
+    preprocessing_cache_dir, and reused while the file content, the reaction key flags, and the metabolite mapping
+    tables are the same, if use_preprocessing_cache is set.\n
+    :param model: cobra model before merging
+    :param model_file: file name the model was loaded from, or None to not cache its preprocessing
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used
+    :param use_prot: Boolean to consider hydrogen and proton
+    :return: dictionary of the mergem ids, reaction keys, and objective ids of the model
+    """
+    cache_file = None
+    if model_file is not None and use_preprocessing_cache:
+        file_hash = hashlib.sha256()
+        with open(model_file, 'rb') as file:
+            while chunk := file.read(1 << 20):
+                file_hash.update(chunk)
+        cache_file = os.path.join(preprocessing_cache_dir,
+                                  f"{file_hash.hexdigest()}_{int(exact_sto)}{int(use_prot)}_"
+                                  f"{get_mapping_tables_hash()}_{__version._version}.p")
+        if os.path.exists(cache_file):
+            with open(cache_file, 'rb') as file:
+                return load(file)
+
+    objective_expression = str(model.objective)
+    mergem_ids = {metabolite.id: map_metabolite_to_mergem_id(metabolite) for metabolite in model.metabolites}
+    objective_ids = {reaction.id for reaction in model.reactions if reaction.id in objective_expression}
+    reaction_keys = {reaction.id: create_reaction_key(reaction, exact_sto, use_prot, mergem_ids)
+                     for reaction in model.reactions if reaction.id not in objective_ids}
+    preprocessed_model = {'mergem_ids': mergem_ids, 'reaction_keys': reaction_keys, 'objective_ids': objective_ids}
+
+    if cache_file is not None:
+        try:  # the cache is skipped if its directory is not writable
+            os.makedirs(preprocessing_cache_dir, exist_ok=True)
+            with open(cache_file + '.tmp', 'wb') as file:
+                dump(preprocessed_model, file)
+            os.replace(cache_file + '.tmp', cache_file)
+        except OSError:
+            pass
+
+    return preprocessed_model
+
+
+def get_mapping_tables_hash():
+    """
+    Returns a hash of the size and modification time of the metabolite mapping tables, which change with every
+    update of the tables, to key the preprocessing cache.
+    """
+    tables_hash = hashlib.sha256()
+    for table_file in (__model_handling.met_univ_id_dict_file, __model_handling.met_univ_id_compact_dict_file):
+        if os.path.exists(table_file):
+            table_stat = os.stat(table_file)
+            tables_hash.update(f"{table_file}:{table_stat.st_size}:{table_stat.st_mtime_ns};".encode())
+
+    return tables_hash.hexdigest()[:16]
+
+
+def get_reaction_key(reaction, preprocessed_model, kept_metabolites, exact_sto, use_prot):
+    """
+    Returns the keys of a reaction being merged, from its preprocessed keys unless it has a metabolite that was
+    mapped but kept its id, which are created again.\n
+    :param reaction: Cobra reaction object
+    :param preprocessed_model: preprocessing of the model of the reaction
+    :param kept_metabolites: set of metabolites of the model with a mergem id that were not renamed
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used
+    :param use_prot: Boolean to consider hydrogen and proton
+    :return: keys of the reaction and its reverse
+    """
+    if kept_metabolites.isdisjoint(reaction.metabolites):
+        return preprocessed_model['reaction_keys'][reaction.id]
+
+    return create_reaction_key(reaction, exact_sto, use_prot)
+
+
+def index_reaction(reaction, reaction_key, rev_reaction_key, indexed_reactions, reaction_index):
+    """
+    Adds a reaction of the merged model to the inverted index from the mergem IDs of its metabolites to the reactions
+    they participate in.\n
+    :param reaction: Cobra reaction object
+    :param reaction_key: key of the reaction
+    :param rev_reaction_key: key of the reverse reaction
+    :param indexed_reactions: list of indexed reactions with their keys, extended with the reaction
+    :param reaction_index: dictionary of the positions in indexed_reactions of the reactions of each metabolite
+    """
+    position = len(indexed_reactions)
+    indexed_reactions.append((reaction, reaction_key, rev_reaction_key))
+    for met_id, _ in reaction_key:
+        if met_id is not None:  # metabolites without mergem id
+            reaction_index[met_id].append(position)
+
+
+def find_near_duplicate_reactions(indexed_reactions, reaction_index, reac_sources_dict, max_difference):
+    """
+    Finds pairs of reactions from different models whose keys share metabolites and differ by at most a number of
+    metabolites, in either direction. A reaction differing by at most max_difference metabolites from another shares
+    one of any max_difference + 1 of its metabolites, so the candidates of each reaction are only the reactions of its
+    least frequent metabolites in the inverted index, instead of all reactions.\n
+    :param indexed_reactions: list of reactions of the merged model with their keys
+    :param reaction_index: dictionary of the positions in indexed_reactions of the reactions of each metabolite
+    :param reac_sources_dict: dictionary with source of each reaction
+    :param max_difference: maximum number of metabolites by which the reactions differ
+    :return: list of near-duplicate pairs of reaction IDs with the number of metabolites by which they differ,
+            sorted by the number of metabolites
+    """
+    near_duplicate_reactions = []
+    for position, (reaction, reaction_key, _) in enumerate(indexed_reactions):
+        met_ids = sorted({met_id for met_id, _ in reaction_key if met_id is not None},
+                         key=lambda met_id: len(reaction_index[met_id]))
+        candidates = {candidate for met_id in met_ids[:max_difference + 1] for candidate in reaction_index[met_id]
+                      if candidate > position}
+
+        reaction_models = reac_sources_dict[reaction.id].keys()
+        for candidate in sorted(candidates):
+            candidate_reaction, candidate_key, rev_candidate_key = indexed_reactions[candidate]
+            if not reaction_models.isdisjoint(reac_sources_dict[candidate_reaction.id]):  # both in a model
+                continue
+
+            difference = min(max(len(reaction_key - key), len(key - reaction_key))
+                             for key in (candidate_key, rev_candidate_key))
+            if difference <= max_difference:
+                near_duplicate_reactions.append((reaction.id, candidate_reaction.id, difference))
+
+    near_duplicate_reactions.sort(key=lambda near_duplicate: near_duplicate[2])
+
+    return near_duplicate_reactions
+
+
 # sets the objective for merged model
 def set_objective_expression(merged_model, reac_sources_dict, models, objective_reactions, set_objective):
     """
@@ -623,10 +912,8 @@ def create_merged_objective(merged_model, reac_sources_dict, objective_reactions
 
     if len(st_dict):
         merged_obj_reaction = cobra.Reaction(merged_obj_reaction_id, merged_obj_reaction_name)
-
-        for metabolite_id, met_stoichiometries in st_dict.items():
-            avg_stoichiometry = sum(met_stoichiometries)/len(met_stoichiometries)
-            merged_obj_reaction.add_metabolites({metabolite_dict[metabolite_id]: avg_stoichiometry})
+        merged_obj_reaction.add_metabolites({metabolite_dict[metabolite_id]: sum(met_stoichiometries)/len(met_stoichiometries)
+                                             for metabolite_id, met_stoichiometries in st_dict.items()})
 
         merged_model.add_reactions([merged_obj_reaction])
         merged_model.objective = merged_obj_reaction_id
@@ -634,6 +921,44 @@ def create_merged_objective(merged_model, reac_sources_dict, objective_reactions
     return merged_model, reac_sources_dict
 
 
+def create_sources_table(sources_dict, ids, num_models, id_column):
+    """
+    Creates a long table of the sources of each metabolite or reaction in merged model, with a row for each
+    original id in each input model, and a sparse presence matrix of the metabolites or reactions in each input model.
+    Ids in the table are categorical, with the merged ids in the order of the rows of the presence matrix.\n
+    :param sources_dict: dictionary with source of each metabolite or reaction
+    :param ids: ids of the metabolites or reactions in merged model
+    :param num_models: number of input models
+    :param id_column: name of the id column of the table
+    :return: data frame with id, model_index, and original_id columns, and data frame with a row for each id,
+            a sparse column for each input model, and 1 if the id has a source in the model or 0 otherwise
+    """
+    id_codes, model_indexes, original_ids = [], [], []
+    for id_code, merged_id in enumerate(ids):
+        for model_index, source_ids in sources_dict[merged_id].items():
+            id_codes += [id_code] * len(source_ids)
+            model_indexes += [model_index] * len(source_ids)
+            original_ids += source_ids
+
+    id_codes = np.array(id_codes, dtype=np.int32)
+    model_indexes = np.array(model_indexes, dtype=np.int32)
+    sources_table = pd.DataFrame({id_column: pd.Categorical.from_codes(id_codes, categories=ids),
+                                  'model_index': model_indexes,
+                                  'original_id': pd.Categorical(original_ids)})
+
+    # Sources sorted by model, to fill the column of each model from its slice
+    model_order = np.argsort(model_indexes, kind='stable')
+    model_starts = np.searchsorted(model_indexes[model_order], np.arange(num_models + 1))
+    presence_columns = {}
+    for model_index in range(num_models):
+        presence = np.zeros(len(ids), dtype=np.int32)
+        presence[id_codes[model_order[model_starts[model_index]:model_starts[model_index + 1]]]] = 1
+        presence_columns[model_index] = pd.arrays.SparseArray(presence, fill_value=0)
+    presence_matrix = pd.DataFrame(presence_columns, index=pd.Index(ids, name=id_column))
+
+    return sources_table, presence_matrix
+
+
 def compute_jaccard_matrix(num_models, met_source_dict, reac_source_dict):
     """
     Creates Jaccard distances matrix using dictionaries with source of each metabolite
@@ -0,0 +1,347 @@
+"""
+    Merges many subsets of a panel of models, such as every pair or every leave-one-out subset, preprocessing
+    each model once. The statistics of the subsets are computed by reconciling the metabolites and reactions of
+    the preprocessed models as when merging, without building merged models, and subsets starting with the same
+    models share the reconciliation of those models.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from . import __model_handling
+from .__merge_models import merge, preprocess_model, get_duplicate_reac_id, compute_jaccard_matrix
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+
+max_subset_workers = min(4, os.cpu_count() or 1)  # processes merging subsets, or 1 to merge them in this process
+
+panel_models = None  # models or preprocessed models of the panel in each subset process
+
+
+def merge_subsets(input_models, subsets, set_objective='merge', exact_sto=False, use_prot=False, return_models=False):
+    """
+    Takes a list of cobra models or file names as input and merges each of a list of subsets of them. Each model is
+    loaded and preprocessed once, and the subsets are merged in a pool of max_subset_workers processes.\n
+    :param input_models: list of cobra models or file names
+    :param subsets: list of subsets, each a list of indexes of input models in merging order
+    :param set_objective: objective reaction from one of the models or merge (default) all model objectives
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used during merging
+    :param use_prot: Boolean to consider hydrogen and proton when merging reactions
+    :param return_models: Boolean to merge the models of each subset and return the results of merge, instead of
+            only the statistics of each subset
+    :return: list of the results of each subset: a dictionary of the met & reac jaccard distances and num of mets
+            and reacs merged, or the results of merge if return_models
+    """
+    __model_handling.load_met_univ_id_dict()
+
+    models = []
+    for input_model in input_models:
+        if isinstance(input_model, str):
+            model = __model_handling.load_model(input_model)
+            models.append((model, input_model))
+        else:
+            models.append((input_model, None))
+
+    indexed_subsets = [(subset_index, list(subset)) for subset_index, subset in enumerate(subsets)]
+    if return_models:
+        # merge renames the metabolites and reactions of its models, so each subset merges copies
+        panel = [model for model, _ in models]
+        tasks = [[indexed_subset] for indexed_subset in indexed_subsets]
+        task_function = partial(merge_subset_models, set_objective=set_objective, exact_sto=exact_sto,
+                                use_prot=use_prot)
+    else:
+        panel = [get_model_structure(model, preprocess_model(model, model_file, exact_sto, use_prot))
+                 for model, model_file in models]
+        tasks = group_subsets_by_first_model(indexed_subsets)
+        task_function = partial(merge_subset_statistics, set_objective=set_objective, exact_sto=exact_sto,
+                                use_prot=use_prot)
+
+    if max_subset_workers <= 1:
+        set_panel_models(panel)
+        task_results = [task_function(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_subset_workers, initializer=set_panel_models,
+                                 initargs=(panel,)) as executor:
+            task_results = list(executor.map(task_function, tasks))
+
+    results = [None] * len(indexed_subsets)
+    for task, task_result in zip(tasks, task_results):
+        for (subset_index, _), subset_result in zip(task, task_result):
+            results[subset_index] = subset_result
+
+    return results
+
+
+def set_panel_models(panel):
+    """
+    Sets the models or preprocessed models of the panel in a subset process.\n
+    :param panel: list of cobra models or model structures
+    """
+    global panel_models
+    panel_models = panel
+
+
+def group_subsets_by_first_model(indexed_subsets):
+    """
+    Groups the subsets starting with the same model, which share the reconciliation of their first models.\n
+    :param indexed_subsets: list of (subset index, subset)
+    :return: list of groups, each a list of (subset index, subset)
+    """
+    groups = {}
+    for subset_index, subset in indexed_subsets:
+        groups.setdefault(subset[0] if subset else None, []).append((subset_index, subset))
+
+    return list(groups.values())
+
+
+def merge_subset_models(task, set_objective, exact_sto, use_prot):
+    """
+    Merges copies of the models of a subset.\n
+    :param task: list with a (subset index, subset)
+    :param set_objective: objective reaction from one of the models or merge all model objectives
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used during merging
+    :param use_prot: Boolean to consider hydrogen and proton when merging reactions
+    :return: list with the results of merge
+    """
+    (_, subset), = task
+    return [merge([panel_models[model_index].copy() for model_index in subset], set_objective=set_objective,
+                  exact_sto=exact_sto, use_prot=use_prot)]
+
+
+def get_model_structure(model, preprocessed_model):
+    """
+    Returns the metabolites and reactions of a model needed to reconcile it with other models, as plain
+    dictionaries that can be sent to subset processes.\n
+    :param model: cobra model
+    :param preprocessed_model: preprocessing of the model
+    :return: dictionary of the preprocessing, metabolite ids in order, reactions of each metabolite, metabolites
+            and coefficients of each reaction, reaction ids in order, and names of PMF metabolites
+    """
+    return {'preprocessed_model': preprocessed_model,
+            'met_ids': [metabolite.id for metabolite in model.metabolites],
+            'met_reactions': {metabolite.id: [reaction.id for reaction in metabolite.reactions]
+                              for metabolite in model.metabolites},
+            'reactions': {reaction.id: {metabolite.id: coefficient
+                                        for metabolite, coefficient in reaction.metabolites.items()}
+                          for reaction in model.reactions},
+            'reac_ids': [reaction.id for reaction in model.reactions],
+            'pmf_met_ids': {metabolite.id for metabolite in model.metabolites if metabolite.name == "PMF"}}
+
+
+def merge_subset_statistics(task, set_objective, exact_sto, use_prot):
+    """
+    Computes the statistics of merging a group of subsets, reconciling the models of each subset in order and
+    copying the reconciliation of the models shared with the next subset, which are the first models of both.\n
+    :param task: group of (subset index, subset)
+    :param set_objective: objective reaction from one of the models or merge all model objectives
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used during merging
+    :param use_prot: Boolean to consider hydrogen and proton when merging reactions
+    :return: list of the statistics of each subset
+    """
+    task_results = []
+    reconciliations = []  # reconciliation after each model of the previous subset
+    previous_subset = []
+    for _, subset in sorted(task, key=lambda subset_task: subset_task[1]):
+        num_shared = 0
+        while (num_shared < min(len(subset), len(previous_subset))
+               and subset[num_shared] == previous_subset[num_shared]):
+            num_shared += 1
+
+        del reconciliations[num_shared:]
+        for model_index in range(num_shared, len(subset)):
+            reconciliation = copy_reconciliation(reconciliations[-1]) if reconciliations else create_reconciliation()
+            reconcile_model(reconciliation, panel_models[subset[model_index]], model_index, exact_sto, use_prot)
+            reconciliations.append(reconciliation)
+
+        task_results.append(get_subset_statistics(reconciliations[-1] if subset else create_reconciliation(),
+                                                  len(subset), set_objective))
+        previous_subset = subset
+
+    # Results in the order of the task
+    order = sorted(range(len(task)), key=lambda position: task[position][1])
+    results = [None] * len(task)
+    for position, task_result in zip(order, task_results):
+        results[position] = task_result
+
+    return results
+
+
+def create_reconciliation():
+    """
+    Creates the reconciliation of no models.\n
+    :return: dictionary of the met & reac sources, the original ids of each mergem id, the reaction of each key,
+            the duplicates of each reaction id, and the numbers of metabolites, reactions, and objective reactions
+    """
+    return {'met_sources': {}, 'met_model_ids': {}, 'reac_sources': {}, 'reaction_keys': {},
+            'duplicate_reac_id_counts': {}, 'num_metabolites': 0, 'num_reactions': 0, 'num_objective_reactions': 0}
+
+
+def copy_reconciliation(reconciliation):
+    """
+    Copies a reconciliation, so that more models can be reconciled without changing it.\n
+    :param reconciliation: reconciliation to copy
+    :return: copy of the reconciliation
+    """
+    reconciliation = dict(reconciliation)
+    reconciliation['met_sources'] = {met_id: set(sources) for met_id, sources in reconciliation['met_sources'].items()}
+    reconciliation['met_model_ids'] = {met_id: list(old_met_ids)
+                                       for met_id, old_met_ids in reconciliation['met_model_ids'].items()}
+    reconciliation['reac_sources'] = {reac_id: set(sources)
+                                      for reac_id, sources in reconciliation['reac_sources'].items()}
+    reconciliation['reaction_keys'] = dict(reconciliation['reaction_keys'])
+    reconciliation['duplicate_reac_id_counts'] = dict(reconciliation['duplicate_reac_id_counts'])
+
+    return reconciliation
+
+
+def reconcile_model(reconciliation, model_structure, model_index, exact_sto, use_prot):
+    """
+    Reconciles the metabolites and reactions of a model with those of the models before it, as when merging.\n
+    :param reconciliation: reconciliation of the models before it, extended with the model
+    :param model_structure: metabolites and reactions of the model
+    :param model_index: index of the model in the subset
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used during merging
+    :param use_prot: Boolean to consider hydrogen and proton when merging reactions
+    """
+    met_sources, met_model_ids = reconciliation['met_sources'], reconciliation['met_model_ids']
+    reac_sources, reaction_keys = reconciliation['reac_sources'], reconciliation['reaction_keys']
+    preprocessed_model = model_structure['preprocessed_model']
+    mergem_ids = preprocessed_model['mergem_ids']
+    model_met_ids = set(model_structure['met_ids'])
+    reactions = model_structure['reactions']
+    metabolite_ids, renamed_metabolites = {}, {}
+    changed_reactions = {}  # reactions with substituted metabolites
+
+    for old_met_id in model_structure['met_ids']:
+        new_met_id = mergem_ids[old_met_id]
+
+        if model_index == 0:
+            if (new_met_id is None) or (new_met_id in met_sources):
+                met_sources.setdefault(old_met_id, set()).add(0)
+            else:
+                met_sources.setdefault(new_met_id, set()).add(0)
+                met_model_ids.setdefault(new_met_id, []).append(old_met_id)
+                metabolite_ids[old_met_id] = new_met_id
+
+        elif (new_met_id is None) or (old_met_id in met_sources):
+            met_sources.setdefault(old_met_id, set()).add(model_index)
+
+        elif new_met_id in met_sources:
+            old_met_ids = met_model_ids[new_met_id]
+            if (old_met_id not in old_met_ids) and not model_met_ids.isdisjoint(old_met_ids):  # model has a better match
+                met_sources.setdefault(old_met_id, set()).add(model_index)
+
+            elif model_index in met_sources[new_met_id]:  # model already had a metabolite for this mergem id
+                for reac_id in model_structure['met_reactions'][old_met_id]:
+                    reaction = changed_reactions.get(reac_id, reactions[reac_id])
+                    if any(metabolite_ids.get(met_id, met_id) == new_met_id for met_id in reaction):  # conflict
+                        met_sources.setdefault(old_met_id, set()).add(model_index)
+                    else:  # substitute metabolite in reaction
+                        reaction = changed_reactions[reac_id] = dict(reaction)
+                        st_coeff = reaction.pop(old_met_id)
+                        renamed_met_id = renamed_metabolites[new_met_id]
+                        reaction[renamed_met_id] = reaction.get(renamed_met_id, 0) + st_coeff
+            else:
+                met_sources[new_met_id].add(model_index)
+                metabolite_ids[old_met_id] = new_met_id
+                renamed_metabolites[new_met_id] = old_met_id
+        else:
+            metabolite_ids[old_met_id] = new_met_id
+            renamed_metabolites[new_met_id] = old_met_id
+            met_sources.setdefault(new_met_id, set()).add(model_index)
+            met_model_ids.setdefault(new_met_id, []).append(old_met_id)
+
+    kept_met_ids = {met_id for met_id in model_structure['met_ids']
+                    if mergem_ids[met_id] and met_id not in metabolite_ids}
+
+    for reac_id in model_structure['reac_ids']:
+        if reac_id in preprocessed_model['objective_ids']:
+            reconciliation['num_objective_reactions'] += 1
+            continue
+
+        reaction = changed_reactions.get(reac_id, reactions[reac_id])
+        if kept_met_ids.isdisjoint(reaction):
+            reaction_key, rev_reaction_key = preprocessed_model['reaction_keys'][reac_id]
+        else:
+            reaction_key, rev_reaction_key = create_structure_reaction_key(
+                reaction, metabolite_ids, mergem_ids, model_structure['pmf_met_ids'], exact_sto, use_prot)
+
+        if model_index == 0:
+            reac_sources.setdefault(reac_id, set()).add(0)
+            reaction_keys.setdefault(reaction_key, reac_id)
+
+        elif reaction_key in reaction_keys or rev_reaction_key in reaction_keys:
+            existing_reac_id = reaction_keys.get(reaction_key) or reaction_keys[rev_reaction_key]
+            reac_sources[existing_reac_id].add(model_index)
+            if reac_id in reac_sources:
+                reac_sources[reac_id].add(model_index)
+
+        else:
+            if reac_id in reac_sources:
+                orig_reac_id = reac_id
+                duplicates = reconciliation['duplicate_reac_id_counts'].get(orig_reac_id, 1)
+                while (reac_id := get_duplicate_reac_id(orig_reac_id, duplicates)) in reac_sources:
+                    duplicates += 1
+                reconciliation['duplicate_reac_id_counts'][orig_reac_id] = duplicates
+
+            reaction_keys[reaction_key] = reac_id
+            reac_sources[reac_id] = {model_index}
+
+    reconciliation['num_metabolites'] += len(model_structure['met_ids'])
+    reconciliation['num_reactions'] += len(model_structure['reac_ids'])
+
+
+def create_structure_reaction_key(reaction, metabolite_ids, mergem_ids, pmf_met_ids, exact_sto, use_prot):
+    """
+    Creates the keys of a reaction of a model structure as create_reaction_key, once the metabolites of the model
+    are renamed.\n
+    :param reaction: dictionary of the coefficient of each metabolite id of the reaction
+    :param metabolite_ids: dictionary of the new id of each renamed metabolite id
+    :param mergem_ids: dictionary of the mergem id of each metabolite id
+    :param pmf_met_ids: set of ids of PMF metabolites
+    :param exact_sto: Boolean which determines whether exact stoichiometry of metabolites is used
+    :param use_prot: Boolean to consider hydrogen and proton
+    :return: keys of the reaction and its reverse
+    """
+    reac_metabolite_set = set()
+    reac_rev_met_set = set()
+    for met_id, coefficient in reaction.items():
+        current_met_id = metabolite_ids.get(met_id, met_id)
+        if (not use_prot) and (current_met_id.startswith(__model_handling.proton_mergem_id) or met_id in pmf_met_ids):
+            continue
+
+        elif current_met_id[-1] != 'b':
+            id = current_met_id if current_met_id.startswith('mergem_') else mergem_ids[met_id]
+            stoc = coefficient if exact_sto else 1
+            if coefficient < 0:
+                reac_metabolite_set.add((id, -stoc))
+                reac_rev_met_set.add((id, stoc))
+            else:
+                reac_metabolite_set.add((id, stoc))
+                reac_rev_met_set.add((id, -stoc))
+
+    return frozenset(reac_metabolite_set), frozenset(reac_rev_met_set)
+
+
+def get_subset_statistics(reconciliation, num_models, set_objective):
+    """
+    Returns the statistics of merging the models of a subset from their reconciliation, as computed by merge.\n
+    :param reconciliation: reconciliation of the models of the subset
+    :param num_models: number of models of the subset
+    :param set_objective: objective reaction from one of the models or merge all model objectives
+    :return: dictionary of the met & reac jaccard distances and num of mets and reacs merged
+    """
+    num_mets_merged = reconciliation['num_metabolites'] - len(reconciliation['met_sources'])
+    num_reacs_merged = reconciliation['num_reactions'] - len(reconciliation['reac_sources'])
+    if reconciliation['num_objective_reactions']:
+        num_reacs_merged -= reconciliation['num_objective_reactions']
+        if set_objective == 'merge':
+            num_reacs_merged += 1
+
+    results = {}
+    results['jacc_matrix'] = compute_jaccard_matrix(num_models, reconciliation['met_sources'],
+                                                    reconciliation['reac_sources'])
+    results['num_met_merged'] = num_mets_merged
+    results['num_reac_merged'] = num_reacs_merged
+
+    return results
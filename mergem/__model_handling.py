@@ -6,7 +6,9 @@
     Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
 """
 
-from .__database_processing import build_id_mapping
+from .__compact_tables import CompactIdMapper, CompactPropertyTable
+from .__database_processing import build_id_mapping, complete_build, report_build_progress, report_build_stage, \
+    save_download_manifest
 import cobra
 # This hack solves the problem of cobrapy replacements introducing control ASCII characters in ids,
 # which breaks the glpk solver and crashes the Python kernel
@@ -17,11 +19,14 @@ def _number_to_chr_safe(numberStr: Match) -> str:
     return numberStr.group(1) if (ascii <= 31 or ascii == 127) else chr(ascii)
 cobra.io.sbml._number_to_chr = _number_to_chr_safe
 
+from datetime import datetime
 from pickle import dump, load
 import os
 import csv
+import json
 
 met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict = {}, {}, {}, {}
+met_univ_id_annot_dict, reac_univ_id_annot_dict = None, None
 
 curr_dir = os.path.dirname(__file__)
 data_dir = os.path.join(curr_dir, 'data')
@@ -32,6 +37,14 @@ met_univ_id_dict_file = os.path.join(data_dir, 'metaboliteIdMapper.p')
 met_univ_id_prop_dict_file = os.path.join(data_dir, 'metaboliteInfo.p')
 reac_univ_id_dict_file = os.path.join(data_dir, 'reactionIdMapper.p')
 reac_univ_id_prop_dict_file = os.path.join(data_dir, 'reactionInfo.p')
+met_univ_id_annot_dict_file = os.path.join(data_dir, 'metaboliteAnnotations.p')
+reac_univ_id_annot_dict_file = os.path.join(data_dir, 'reactionAnnotations.p')
+met_univ_id_compact_dict_file = os.path.join(data_dir, 'metaboliteIdMapperCompact.p')
+met_univ_id_prop_compact_dict_file = os.path.join(data_dir, 'metaboliteInfoCompact.p')
+reac_univ_id_compact_dict_file = os.path.join(data_dir, 'reactionIdMapperCompact.p')
+reac_univ_id_prop_compact_dict_file = os.path.join(data_dir, 'reactionInfoCompact.p')
+use_compact_tables = False  # load the compact mapping tables saved with the mapping tables, which use less memory
+mapper_changelog_dir = os.path.join(data_dir, 'mapperChangelogs')
 
 localization_dict = {'p': 'p', 'p0': 'p', 'periplasm': 'p', 'periplasm_0': 'p', 'mnxc19': 'p',
                      'c': 'c', 'c0': 'c', 'cytosol': 'c', 'cytosol_0': 'c', 'cytoplasm': 'c', 'mnxc3': 'c',
@@ -47,6 +60,14 @@ localization_dict = {'p': 'p', 'p0': 'p', 'periplasm': 'p', 'periplasm_0': 'p',
 
 proton_mergem_id = ''
 
+# annotation keys for database names of universal ids (checked in order)
+met_annotation_keys = [('bigg', 'bigg.metabolite', ''), ('chebi', 'chebi', 'CHEBI:'),
+                       ('metanetx', 'metanetx.chemical', ''), ('seed', 'seed.compound', ''),
+                       ('kegg', 'kegg.compound', ''), ('reactome', 'reactome.compound', '')]
+reac_annotation_keys = [('bigg', 'bigg.reaction', ''), ('metanetx', 'metanetx.reaction', ''),
+                        ('seed', 'seed.reaction', '')]
+met_db_annotation_keys, reac_db_annotation_keys = {}, {}
+
 
 # loads and returns cobra model based on file format
 def load_model(filename):
@@ -94,12 +115,15 @@ def save_model(cobra_model, file_name):
         raise IOError('Unable to save merged model. Check file format {}'.format(file_name))
 
 
-def load_dict(dict, file):
+def load_dict(dict, file, compact_file=None):
     if not dict:
         if not os.path.exists(file):
             print("Dictionary not found. Updating mapping dictionaries...")
             update_id_mapper()
 
+        if use_compact_tables and compact_file and os.path.exists(compact_file):
+            file = compact_file
+
         f = open(file, "rb")
         dict = load(f)
         f.close()
@@ -109,46 +133,210 @@ def load_dict(dict, file):
 
 def load_met_univ_id_dict():
     global met_univ_id_dict, proton_mergem_id
-    met_univ_id_dict = load_dict(met_univ_id_dict, met_univ_id_dict_file)
+    met_univ_id_dict = load_dict(met_univ_id_dict, met_univ_id_dict_file, met_univ_id_compact_dict_file)
     proton_mergem_id = 'mergem_' + str(met_univ_id_dict['C00080']) + '_'
 
 
 def load_met_univ_id_prop_dict():
     global met_univ_id_prop_dict
-    met_univ_id_prop_dict = load_dict(met_univ_id_prop_dict, met_univ_id_prop_dict_file)
+    met_univ_id_prop_dict = load_dict(met_univ_id_prop_dict, met_univ_id_prop_dict_file,
+                                      met_univ_id_prop_compact_dict_file)
 
 
 def load_reac_univ_id_dict():
     global reac_univ_id_dict
-    reac_univ_id_dict = load_dict(reac_univ_id_dict, reac_univ_id_dict_file)
+    reac_univ_id_dict = load_dict(reac_univ_id_dict, reac_univ_id_dict_file, reac_univ_id_compact_dict_file)
 
 
 def load_reac_univ_id_prop_dict():
     global reac_univ_id_prop_dict
-    reac_univ_id_prop_dict = load_dict(reac_univ_id_prop_dict, reac_univ_id_prop_dict_file)
+    reac_univ_id_prop_dict = load_dict(reac_univ_id_prop_dict, reac_univ_id_prop_dict_file,
+                                       reac_univ_id_prop_compact_dict_file)
+
+
+def load_met_univ_id_annot_dict():
+    global met_univ_id_annot_dict
+    met_univ_id_annot_dict = load_annot_dict(met_univ_id_annot_dict_file)
+
+
+def load_reac_univ_id_annot_dict():
+    global reac_univ_id_annot_dict
+    reac_univ_id_annot_dict = load_annot_dict(reac_univ_id_annot_dict_file)
+
 
+def load_annot_dict(file):
+    if not os.path.exists(file):
+        return {}
 
-def update_id_mapper(delete_database_files = True):
+    with open(file, "rb") as f:
+        return load(f)
+
+
+def update_id_mapper(delete_database_files = True, save_annotations = True, force = False, resume = False,
+                     source_dir = None):
     """
     Downloads the latest database files,
     merges the database identifiers based on common properties and saves the mapping tables as pickles.
+    The mapping tables are only rebuilt if a database changed since the last update,
+    and each new version of the mapping tables is saved with a changelog of the universal ids it changed.
+    :param delete_database_files: delete the downloaded database files after processing them
+    :param save_annotations: precompute and save the annotations of each universal id used to extend annotations
+    :param force: rebuild the mapping tables even if no database changed
+    :param resume: continue an interrupted update from its last checkpoint, without downloading the database files again
+    :param source_dir: build the mapping tables without network access from a directory of database files,
+    with their manifest and the KEGG release file, instead of downloading them
     """
-    global met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict
+    force = force or not mapping_tables_exist()
+
+    id_mapping = build_id_mapping(delete_database_files, force, resume, source_dir=source_dir)
+    if id_mapping is None:
+        return
+
+    save_id_mapping(id_mapping, save_annotations)
+
+
+def mapping_tables_exist():
+    mapping_files = [met_univ_id_dict_file, met_univ_id_prop_dict_file,
+                     reac_univ_id_dict_file, reac_univ_id_prop_dict_file]
+    return all(os.path.exists(file) for file in mapping_files)
+
+
+def rerun_mapper_stage(stage_name, file_reader = None, save_annotations = True):
+    """
+    Runs a stage of the last update again, followed by the stages after it, and saves the new mapping tables.
+    The update resumes from its last checkpoint before the stage, so its database files must have been kept.
+    :param stage_name: name of the stage, such as 'metanetx_chem_xref' or 'clean_metabolites'
+    :param file_reader: reader function replacing the reader of the database file of the stage,
+    defined at module level so that it can run in the processes parsing the files
+    :param save_annotations: precompute and save the annotations of each universal id used to extend annotations
+    """
+    id_mapping = build_id_mapping(False, rerun_stage=stage_name, file_reader=file_reader)
+    save_id_mapping(id_mapping, save_annotations)
+
+
+def save_id_mapping(id_mapping, save_annotations, build_stage_callback=None):
+    """
+    Saves a new version of the mapping tables, with its changelog and the manifest of the database files used.
+    :param id_mapping: metabolite and reaction mapping tables
+    :param save_annotations: precompute and save the annotations of each universal id used to extend annotations
+    :param build_stage_callback: function called with the record of each saving stage when it finishes
+    """
+    with report_build_progress(build_stage_callback):
+        write_id_mapping(id_mapping, save_annotations)
+
+
+def write_id_mapping(id_mapping, save_annotations):
+    """
+    Writes the mapping tables, as described in save_id_mapping.
+    """
+    global met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict, \
+        met_univ_id_annot_dict, reac_univ_id_annot_dict
+
+    met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict = id_mapping
+    with report_build_stage('save_mapper_changelog'):
+        save_mapper_changelog()
+
+    with report_build_stage('save_mapping_tables'):
+        with open(met_univ_id_dict_file, 'wb') as file:
+            dump(met_univ_id_dict, file)
 
-    met_univ_id_dict, met_univ_id_prop_dict, reac_univ_id_dict, reac_univ_id_prop_dict = \
-        build_id_mapping(delete_database_files)
+        with open(met_univ_id_prop_dict_file, 'wb') as file:
+            dump(met_univ_id_prop_dict, file)
 
-    with open(met_univ_id_dict_file, 'wb') as file:
-        dump(met_univ_id_dict, file)
+        with open(reac_univ_id_dict_file, 'wb') as file:
+            dump(reac_univ_id_dict, file)
 
-    with open(met_univ_id_prop_dict_file, 'wb') as file:
-        dump(met_univ_id_prop_dict, file)
+        with open(reac_univ_id_prop_dict_file, 'wb') as file:
+            dump(reac_univ_id_prop_dict, file)
 
-    with open(reac_univ_id_dict_file, 'wb') as file:
-        dump(reac_univ_id_dict, file)
+    with report_build_stage('save_compact_tables'):
+        save_compact_tables()
+
+    if save_annotations:
+        with report_build_stage('save_annotations'):
+            met_univ_id_annot_dict = {univ_id: create_metabolite_annotations(props)
+                                      for univ_id, props in met_univ_id_prop_dict.items()}
+            reac_univ_id_annot_dict = {univ_id: create_reaction_annotations(props)
+                                       for univ_id, props in reac_univ_id_prop_dict.items()}
+
+            with open(met_univ_id_annot_dict_file, 'wb') as file:
+                dump(met_univ_id_annot_dict, file)
+
+            with open(reac_univ_id_annot_dict_file, 'wb') as file:
+                dump(reac_univ_id_annot_dict, file)
+
+    else:
+        met_univ_id_annot_dict, reac_univ_id_annot_dict = {}, {}
+        for file in [met_univ_id_annot_dict_file, reac_univ_id_annot_dict_file]:
+            if os.path.exists(file):
+                os.remove(file)
+
+    save_download_manifest()
+    complete_build()
+
+
+def save_compact_tables():
+    """
+    Saves the compact representation of the mapping tables, loaded instead of the tables if use_compact_tables is set.
+    """
+    compact_tables = {met_univ_id_compact_dict_file: CompactIdMapper(met_univ_id_dict),
+                      met_univ_id_prop_compact_dict_file: CompactPropertyTable(met_univ_id_prop_dict),
+                      reac_univ_id_compact_dict_file: CompactIdMapper(reac_univ_id_dict),
+                      reac_univ_id_prop_compact_dict_file: CompactPropertyTable(reac_univ_id_prop_dict)}
+
+    for filename, compact_table in compact_tables.items():
+        with open(filename, 'wb') as file:
+            dump(compact_table, file)
+
+
+def save_mapper_changelog():
+    """
+    Saves the changelog of a new version of the mapping tables, comparing their universal ids with the saved tables.
+    """
+    version = get_mapper_version() + 1
+    changelog = {'version': version,
+                 'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 'metabolites': get_changed_univ_ids(load_annot_dict(met_univ_id_prop_dict_file),
+                                                     met_univ_id_prop_dict),
+                 'reactions': get_changed_univ_ids(load_annot_dict(reac_univ_id_prop_dict_file),
+                                                   reac_univ_id_prop_dict)}
+
+    if not os.path.exists(mapper_changelog_dir):
+        os.makedirs(mapper_changelog_dir)
+
+    with open(os.path.join(mapper_changelog_dir, f'mapperChangelog{version}.json'), 'w') as file:
+        json.dump(changelog, file, indent=1)
+
+
+def get_mapper_version():
+    """
+    Returns the version of the mapping tables, which is the number of the last changelog saved.
+    """
+    if not os.path.exists(mapper_changelog_dir):
+        return 0
+
+    return max((int(filename[len('mapperChangelog'):-len('.json')]) for filename in os.listdir(mapper_changelog_dir)
+                if filename.startswith('mapperChangelog') and filename.endswith('.json')), default=0)
+
+
+def get_changed_univ_ids(previous_prop_dict, prop_dict):
+    """
+    Compares the properties of the universal ids of two versions of a mapping table.
+    :param previous_prop_dict: properties of each universal id in the previous version
+    :param prop_dict: properties of each universal id in the new version
+    :return: dictionary of sorted lists of added, removed, and changed universal ids
+    """
+    changed_univ_ids = []
+    for univ_id in previous_prop_dict.keys() & prop_dict.keys():
+        previous_props, props = previous_prop_dict[univ_id], prop_dict[univ_id]
+        # IDs are saved in no particular order
+        if (set(previous_props['ids']) != set(props['ids']) or
+                any(value != previous_props.get(key) for key, value in props.items() if key != 'ids')):
+            changed_univ_ids.append(univ_id)
 
-    with open(reac_univ_id_prop_dict_file, 'wb') as file:
-        dump(reac_univ_id_prop_dict, file)
+    return {'added': sorted(prop_dict.keys() - previous_prop_dict.keys()),
+            'removed': sorted(previous_prop_dict.keys() - prop_dict.keys()),
+            'changed': sorted(changed_univ_ids)}
 
 
 # convert cellular localization to single namespace
@@ -215,6 +403,36 @@ def get_reaction_properties(reac_univ_id):
     return reac_univ_id_prop_dict.get(reac_univ_id)
 
 
+def get_metabolite_annotations(met_univ_id):
+    """
+    Retrieves the annotations of a metabolite universal id, creating them from its properties if not cached
+    """
+    if met_univ_id_annot_dict is None:
+        load_met_univ_id_annot_dict()
+
+    annotations = met_univ_id_annot_dict.get(met_univ_id)
+    if annotations is None:
+        annotations = create_metabolite_annotations(get_metabolite_properties(met_univ_id))
+        met_univ_id_annot_dict[met_univ_id] = annotations
+
+    return annotations
+
+
+def get_reaction_annotations(reac_univ_id):
+    """
+    Retrieves the annotations of a reaction universal id, creating them from its properties if not cached
+    """
+    if reac_univ_id_annot_dict is None:
+        load_reac_univ_id_annot_dict()
+
+    annotations = reac_univ_id_annot_dict.get(reac_univ_id)
+    if annotations is None:
+        annotations = create_reaction_annotations(get_reaction_properties(reac_univ_id))
+        reac_univ_id_annot_dict[reac_univ_id] = annotations
+
+    return annotations
+
+
 def remove_localization(id):
     if '@' in id:
         return id.rsplit('@', 1)[0]
@@ -259,7 +477,8 @@ def merge_unique(a,b):
     
     if type(a) != list: a = [a]
     if type(b) != list: b = [b]
-    a += [x for x in b if x not in a]
+    a_values = set(a)
+    a += [x for x in b if x not in a_values]
     if len(a) == 1:
         return a[0]
     else:
@@ -268,7 +487,8 @@ def merge_unique(a,b):
 
 def add_annotations(id, dict_annot, source):
     '''
-    Add annotations from a metabolite or reaction without duplicates
+    Add annotations from a metabolite or reaction without duplicates.
+    Merged values are kept as ordered sets (dictionaries) until finalize_annotations is called.
     :param id: id of metabolite or reaction to add annotations
     :param dict_annot: dictionary with all annotations
     :param source: reaction or metabolite source
@@ -277,36 +497,77 @@ def add_annotations(id, dict_annot, source):
     for source_anot_key, source_anot_value in source.annotation.items():
         if anot_value := annotations.get(source_anot_key):
             if anot_value != source_anot_value:
-                annotations[source_anot_key] = merge_unique(anot_value, source_anot_value)
+                if type(anot_value) != dict:
+                    anot_value = annotations[source_anot_key] = dict.fromkeys(anot_value if type(anot_value) == list
+                                                                               else [anot_value])
+                anot_value.update(dict.fromkeys(source_anot_value if type(source_anot_value) == list
+                                                else [source_anot_value]))
         else:
             annotations[source_anot_key] = source_anot_value
 
 
-def extend_metabolite_annotations(metabolite, props):
-    annotation = metabolite.annotation
+def finalize_annotations(annotations):
+    '''
+    Converts the annotation values merged by add_annotations to strings or lists of strings
+    :param annotations: dictionary of annotations of a metabolite or reaction
+    :return: the same dictionary with cobra annotation values
+    '''
+    for anot_key, anot_value in annotations.items():
+        if type(anot_value) == dict:
+            annotations[anot_key] = next(iter(anot_value)) if len(anot_value) == 1 else list(anot_value)
+
+    return annotations
+
+
+def create_annotations(props, annotation_keys, db_annotation_keys):
+    '''
+    Creates the annotations of the database ids of a universal id
+    :param props: properties of the universal id
+    :param annotation_keys: list of database names with their annotation key and id prefix
+    :param db_annotation_keys: dictionary caching the annotation key and id prefix of each database name
+    :return: dictionary of annotations
+    '''
+    annotations = {}
     for db_ids in props.get('ids', []):
         db_name, db_id = db_ids.split(':', 1)
 
-        if 'bigg' in db_name:
-            annotation['bigg.metabolite'] = merge_unique(annotation.get('bigg.metabolite'), db_id)
+        if (db_annotation_key := db_annotation_keys.get(db_name)) is None:
+            db_annotation_key = next(((anot_key, prefix) for name, anot_key, prefix in annotation_keys
+                                      if name in db_name), (db_name, ''))
+            db_annotation_keys[db_name] = db_annotation_key
 
-        elif 'chebi' in db_name:
-            annotation['chebi'] = merge_unique(annotation.get('chebi'), 'CHEBI:' + db_id)
+        anot_key, prefix = db_annotation_key
+        if anot_key in annotations:
+            annotations[anot_key][prefix + db_id] = None
+        else:
+            annotations[anot_key] = {prefix + db_id: None}
 
-        elif 'metanetx' in db_name:
-            annotation['metanetx.chemical'] = merge_unique(annotation.get('metanetx.chemical'), db_id)
+    return finalize_annotations(annotations)
 
-        elif 'seed' in db_name:
-            annotation['seed.compound'] = merge_unique(annotation.get('seed.compound'), db_id)
-        
-        elif 'kegg' in db_name:
-            annotation['kegg.compound'] = merge_unique(annotation.get('kegg.compound'), db_id)
 
-        elif 'reactome' in db_name:
-            annotation['reactome.compound'] = merge_unique(annotation.get('reactome.compound'), db_id)
+def create_metabolite_annotations(props):
+    return create_annotations(props, met_annotation_keys, met_db_annotation_keys)
 
-        else:
-            annotation[db_name] = merge_unique(annotation.get(db_name), db_id)
+
+def create_reaction_annotations(props):
+    return create_annotations(props, reac_annotation_keys, reac_db_annotation_keys)
+
+
+def add_annotation_values(annotation, new_annotation):
+    '''
+    Adds the values of a dictionary of annotations without duplicates
+    :param annotation: annotations of a metabolite or reaction
+    :param new_annotation: annotations to add
+    '''
+    for anot_key, anot_value in new_annotation.items():
+        if type(anot_value) == list:
+            anot_value = anot_value.copy()
+        annotation[anot_key] = merge_unique(annotation.get(anot_key), anot_value)
+
+
+def extend_metabolite_annotations(metabolite, met_univ_id, props):
+    annotation = metabolite.annotation
+    add_annotation_values(annotation, get_metabolite_annotations(met_univ_id))
 
     if (not annotation.get('inchikey')) and (not annotation.get('inchi_key')) and props.get('inchikey'):
         annotation['inchikey'] = props['inchikey']
@@ -318,39 +579,93 @@ def extend_metabolite_annotations(metabolite, props):
         metabolite.formula = props['formula'][0]
 
 
-def extend_reaction_annotations(reaction, props):
+def extend_reaction_annotations(reaction, reac_univ_id, props):
     annotation = reaction.annotation
-    for db_ids in props.get('ids', []):
-        db_name, db_id = db_ids.split(':', 1)
-
-        if 'bigg' in db_name:
-            annotation['bigg.reaction'] = merge_unique(annotation.get('bigg.reaction'), db_id)
+    add_annotation_values(annotation, get_reaction_annotations(reac_univ_id))
 
-        elif 'metanetx' in db_name:
-            annotation['metanetx.reaction'] = merge_unique(annotation.get('metanetx.reaction'), db_id)
+    if not annotation.get('ec-code') and props.get('EC_num'):
+        annotation['ec-code'] = props['EC_num']
 
-        elif 'seed' in db_name:
-            annotation['seed.reaction'] = merge_unique(annotation.get('seed.reaction'), db_id)
 
+def split_gpr_clauses(gpr_str):
+    '''
+    Splits a gpr string into its alternative (or) clauses, flattening nested alternatives
+    :param gpr_str: gpr string as written by cobra
+    :return: list of clause strings without enclosing parentheses
+    '''
+    clauses = []
+    depth, start = 0, 0
+    for i, char in enumerate(gpr_str):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and gpr_str.startswith(' or ', i):
+            clauses.append(gpr_str[start:i])
+            start = i + 4
+    clauses.append(gpr_str[start:])
+
+    result = []
+    for clause in clauses:
+        if is_enclosed(clause):
+            result += split_gpr_clauses(clause[1:-1])
         else:
-            annotation[db_name] = merge_unique(annotation.get(db_name), db_id)
+            result.append(clause)
+    return result
 
-    if not annotation.get('ec-code') and props.get('EC_num'):
-        annotation['ec-code'] = props['EC_num']
+
+def is_enclosed(gpr_str):
+    '''
+    Checks if a gpr string is fully enclosed by a pair of parentheses
+    '''
+    if not gpr_str.startswith('('):
+        return False
+
+    depth = 0
+    for i, char in enumerate(gpr_str):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i == len(gpr_str) - 1
+    return False
+
+
+def gpr_clauses(gpr):
+    '''
+    Normalizes a gpr into an ordered set of alternative clauses
+    :param gpr: cobra GPR of a reaction
+    :return: dictionary with the gpr clauses as keys (ordered set)
+    '''
+    if gpr_str := cobra.core.gene.GPR.to_string(gpr):
+        return dict.fromkeys(split_gpr_clauses(gpr_str))
+    return {}
 
 
 def add_gpr(id, dict_gprs, source):
     '''
+    Adds the gpr clauses of a reaction without duplicates
     :param id: id of reaction for which gpr is being updated
-    :param dict_gprs: dictionary with all reaction gprs
+    :param dict_gprs: dictionary with the gpr clauses of all reactions
     :param source: reaction with gpr to add to dict_gprs
     '''
-    if source_gpr_str := cobra.core.gene.GPR.to_string(source.gpr):
-        if gpr := dict_gprs.get(id):
-            if gpr_str := cobra.core.gene.GPR.to_string(gpr):
-                if source_gpr_str not in gpr_str:
-                    dict_gprs[id] = cobra.core.gene.GPR.from_string(gpr_str + ' or ' + source_gpr_str)
-            else:
-                dict_gprs[id] = source.gpr
+    if source_clauses := gpr_clauses(source.gpr):
+        if clauses := dict_gprs.get(id):
+            clauses.update(source_clauses)
         else:
-            dict_gprs[id] = source.gpr
\ No newline at end of file
+            dict_gprs[id] = source_clauses
+
+
+def build_gpr(reaction, clauses):
+    '''
+    Sets the gpr of a reaction from its merged clauses, parsing it only if it changed
+    :param reaction: reaction in merged model
+    :param clauses: ordered set of gpr clauses collected during merging
+    '''
+    if len(clauses) == 1:
+        gpr_str = next(iter(clauses))
+    else:
+        gpr_str = ' or '.join(('(' + clause + ')') if ' ' in clause else clause for clause in clauses)
+    if gpr_str != cobra.core.gene.GPR.to_string(reaction.gpr):
+        reaction.gpr = cobra.core.gene.GPR.from_string(gpr_str)
@@ -23,14 +23,17 @@ _allowed_file_formats = ["sbml", "xml", "mat", "m", "matlab", "json", "yaml"]
 @click.option('-o', nargs=1, help='Save model as (filename with format .xml, .sbml, etc.)')
 @click.option('-v', help='Print merging statistics', is_flag=True)
 @click.option('-up', help='Update ID mapping table', is_flag=True)
+@click.option('-src', type=click.Path(exists=True, file_okay=False), help='Update ID mapping table offline from a directory of database files with their manifest, instead of downloading them')
 @click.option('-s', help='Save ID mapping table as CSV', is_flag=True)
 @click.option('-e', help='Uses exact stoichiometry when merging reactions', is_flag=True)
 @click.option('-p', help='Consider protonation when merging reactions', is_flag=True)
 @click.option('-a', help='Extend annotations with mergem database of metabolites and reactions', is_flag=True)
 @click.option('-t', help='Translate all metabolite and reaction IDs to a target namespace (chebi, metacyc, kegg, reactome, metanetx, hmdb, biocyc, bigg, seed, sabiork, rhea)')
 @click.option('-c', help='output as a community model', is_flag=True)
+@click.option('-cl', type=int, help='Cluster the models into a number of clusters by the Jaccard distances of their reactions and save the clusters in the suggested merge order as CSV, instead of merging them')
+@click.option('-d', help='Compare two versions of a model and save the metabolites and reactions added, removed, renamed, or with changed stoichiometry as CSV, instead of merging them', is_flag=True)
 @click.version_option(_version + "\nLobo Lab (https://lobolab.umbc.edu)")
-def main(input_filenames, obj, o=None, v=False, up=False, s=False, e=False, p=False, a=False, t=None, c=False):
+def main(input_filenames, obj, o=None, v=False, up=False, src=None, s=False, e=False, p=False, a=False, t=None, c=False, cl=None, d=False):
     """
     mergem takes genome-scale metabolic models as input, merges them into a single model
     and saves the merged model as .xml. Users can optionally select the objective, provide
@@ -51,9 +54,9 @@ def main(input_filenames, obj, o=None, v=False, up=False, s=False, e=False, p=Fa
 
     click.secho(f"mergem, v{_version}")
 
-    if up:
+    if up or src:
         click.secho('Updating ID mapper. This process may take a few hours.. ')
-        mergem.update_id_mapper()
+        mergem.update_id_mapper(source_dir=src)
         click.secho('ID mapper updated. ', fg='green')
         if len(model_filenames) == 0:
             sys.exit()
@@ -73,6 +76,44 @@ def main(input_filenames, obj, o=None, v=False, up=False, s=False, e=False, p=Fa
         click.secho('Error: Invalid objective selected for merged model.', fg='red')
         sys.exit()
 
+    if d:
+        if len(model_filenames) != 2:
+            click.secho('Error: Enter the old and new versions of a model to compare.', fg='red')
+            sys.exit()
+        if output_filename is None:
+            output_filename = "mergem_diff.csv"
+        elif not output_filename.lower().endswith(".csv"):
+            click.secho('Error: Invalid output file format, differences are saved as .csv', fg='red')
+            sys.exit()
+
+        differences = mergem.diff(model_filenames[0], model_filenames[1], exact_sto=e, use_prot=p)
+        differences.to_csv(output_filename, index=False)
+
+        click.secho(f"\nComparing models complete. Differences saved as {output_filename}", fg="green")
+        if print_stats:
+            for (entity_type, change), count in differences.groupby(['type', 'change'], observed=True).size().items():
+                click.echo(f"{entity_type.capitalize()}s {change}: {count}")
+        sys.exit()
+
+    if cl is not None:
+        if output_filename is None:
+            output_filename = "mergem_clusters.csv"
+        elif not output_filename.lower().endswith(".csv"):
+            click.secho('Error: Invalid output file format, clusters are saved as .csv', fg='red')
+            sys.exit()
+
+        cluster_results = mergem.cluster_models(list(model_filenames), num_clusters=cl, exact_sto=e, use_prot=p)
+        with open(output_filename, 'w') as file:
+            file.write("order,model,cluster\n")
+            for order, model_index in enumerate(cluster_results['merge_order']):
+                file.write(f"{order + 1},{cluster_results['model_ids'][model_index]},"
+                           f"{cluster_results['clusters'][model_index]}\n")
+
+        click.secho(f"\nClustering models complete. Clusters saved as {output_filename}", fg="green")
+        if print_stats:
+            click.echo("Jaccard distance matrix: {}".format(cluster_results['jacc_distances'].tolist()))
+        sys.exit()
+
     if output_filename is not None:
         file_format = os.path.splitext(output_filename)[1][1:].strip().lower()
         if file_format not in _allowed_file_formats:
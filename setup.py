@@ -31,6 +31,7 @@ setup(name='mergem',
             "Topic :: Scientific/Engineering",
             "Topic :: Scientific/Engineering :: Bio-Informatics"
       ],
-      install_requires=['cobra >= 0.15.4', 'click>=8.0.3', 'requests'],
+      install_requires=['cobra >= 0.15.4', 'click>=8.0.3', 'requests', 'numpy', 'pandas>=1.0.0'],
+      extras_require={'async': ['httpx']},
       include_package_data=True,
       zip_safe=False)
@@ -0,0 +1,123 @@
+"""
+    Local stand-in HTTP server for the download tests, serving files with ETags, range and conditional requests,
+    scripted failures, and custom routes, and a small metabolite mapping table of the cobra textbook model for the
+    merge tests.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import cobra
+import pytest
+
+from mergem import __database_processing as database_processing
+from mergem import __model_handling as model_handling
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        failures = server.failures[self.path]
+        failure = failures.popleft() if failures else None
+
+        if isinstance(failure, int):
+            self.send_reply(failure, b"failure")
+        elif failure == 'truncate':  # sends half the file and closes the connection
+            content = server.files[self.path]['content']
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(content)))
+            self.send_header('ETag', server.files[self.path]['etag'])
+            self.send_header('Last-Modified', server.files[self.path]['last_modified'])
+            self.end_headers()
+            self.wfile.write(content[:len(content) // 2])
+            self.close_connection = True
+        elif failure == 'truncate_chunked':  # sends half the file in a chunk and closes the connection
+            content = server.files[self.path]['content'][:len(server.files[self.path]['content']) // 2]
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('ETag', server.files[self.path]['etag'])
+            self.send_header('Last-Modified', server.files[self.path]['last_modified'])
+            self.end_headers()
+            self.wfile.write(f"{len(content):x}\r\n".encode() + content + b"\r\n")
+            self.close_connection = True
+        elif self.path in server.routes:
+            self.send_reply(*server.routes[self.path](self.path, self.headers))
+        elif self.path.split('/')[1] in server.prefix_routes:
+            self.send_reply(*server.prefix_routes[self.path.split('/')[1]](self.path, self.headers))
+        elif self.path in server.files:
+            self.send_file(server.files[self.path])
+        else:
+            self.send_reply(404, b"not found")
+
+    def send_file(self, file):
+        content, etag, last_modified = file['content'], file['etag'], file['last_modified']
+        if self.headers.get('If-None-Match') == etag:
+            self.send_reply(304, b"", {'ETag': etag})
+            return
+
+        range_header, if_range = self.headers.get('Range'), self.headers.get('If-Range')
+        if range_header and (if_range is None or if_range in (etag, last_modified)):
+            start = int(range_header.split('=', 1)[1].split('-', 1)[0])
+            if start >= len(content):
+                self.send_reply(416, b"", {'Content-Range': f"bytes */{len(content)}"})
+            else:
+                self.send_reply(206, content[start:], {'ETag': etag, 'Last-Modified': last_modified,
+                                                       'Content-Range': f"bytes {start}-{len(content) - 1}/{len(content)}"})
+            return
+
+        self.send_reply(200, content, {'ETag': etag, 'Last-Modified': last_modified})
+
+    def send_reply(self, status, body, headers=None):
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.files, server.routes, server.prefix_routes = {}, {}, {}
+    server.failures, server.requests = defaultdict(deque), []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def download_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_processing, 'log_dir', str(tmp_path) + "/")
+    monkeypatch.setattr(database_processing, 'download_retry_delay', 0)
+    monkeypatch.setattr(database_processing, 'download_timeout', 10)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def textbook():
+    return cobra.io.load_model("textbook")
+
+
+@pytest.fixture
+def mapping_tables(textbook, monkeypatch):
+    met_ids = sorted({metabolite.id.rsplit('_', 1)[0] for metabolite in textbook.metabolites})
+    met_univ_id_dict = {met_id: univ_id for univ_id, met_id in enumerate(met_ids, 1)}
+    met_univ_id_dict['C00080'] = met_univ_id_dict['h']
+    monkeypatch.setattr(model_handling, 'met_univ_id_dict', met_univ_id_dict)
+    return met_univ_id_dict
@@ -0,0 +1,80 @@
+"""
+    Tests of download_file_async against the local stand-in HTTP server: resuming partial files only if the file
+    has not changed, keeping the validators of resumed files, and retrying truncated downloads.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import asyncio
+
+import pytest
+
+from mergem import __async_api as async_api
+from test_download_file import check_download, content, last_modified, serve_file, write_partial_file
+
+httpx = pytest.importorskip("httpx")
+
+
+def download(url, filename, headers=None):
+    async def download_file():
+        async with httpx.AsyncClient() as client:
+            return await async_api.download_file_async(client, url, filename, headers)
+
+    return asyncio.run(download_file())
+
+
+def test_download(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    file_stats = download(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+    assert not (download_settings / "file.part").exists()
+    assert not (download_settings / "file.part.json").exists()
+
+
+def test_resume_unchanged_file(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    write_partial_file(filename, content[:1000], etag='"v2"', last_modified=last_modified)
+    file_stats = download(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+    path, headers = stub_server.requests[-1]
+    assert headers['Range'] == "bytes=1000-"
+    assert headers['If-Range'] == '"v2"'
+
+
+def test_resume_changed_file(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    write_partial_file(filename, b"OLD-" * 250, etag='"v1"')
+    file_stats = download(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+
+
+def test_partial_file_without_validators(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    write_partial_file(filename, b"OLD-" * 250)
+    file_stats = download(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+    assert 'Range' not in stub_server.requests[-1][1]
+
+
+def test_resume_after_truncated_download(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    url = serve_file(stub_server)
+    stub_server.failures["/file"].append('truncate')
+    file_stats = download(url, filename)
+
+    check_download(filename, file_stats)
+    assert file_stats['attempts'] == 2
+    assert stub_server.requests[-1][1]['Range'] == f"bytes={len(content) // 2}-"
+    assert stub_server.requests[-1][1]['If-Range'] == '"v2"'
+
+
+def test_not_modified(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    file_stats = download(serve_file(stub_server), filename, {'If-None-Match': '"v2"'})
+
+    assert file_stats is None
+    assert not (download_settings / "file").exists()
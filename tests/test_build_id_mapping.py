@@ -0,0 +1,299 @@
+"""
+    Tests of the build of the mapping dictionaries from small synthetic database files: the directory of the database
+    files, resuming builds from their checkpoints, and stopping builds, also by cancelling asynchronous updates.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from concurrent.futures import CancelledError
+from gzip import open as gzip_open
+from hashlib import sha256
+from pickle import dump
+import asyncio
+import json
+import os
+import random
+import threading
+
+import pytest
+
+from mergem import __async_api as async_api
+from mergem import __database_processing as database_processing
+
+compound_count = 150
+reaction_count = 150
+
+
+def write_database_files(source_dir, seed=0):
+    """
+    Writes database files of synthetic compounds and reactions, with their IDs in several databases
+    and some IDs shared between compounds so that they are merged, in the formats of the database readers.
+    """
+    rnd = random.Random(seed)
+    os.makedirs(source_dir)
+    compounds = [{'mnx': f"MNXM{index}", 'name': f"compound {index}", 'mass': f"{index * 1.5:.2f}",
+                  'formula': f"C{index % 7 + 1}H{index % 5}O", 'inchikey': f"KEY{index:06d}",
+                  'kegg': f"C{index:05d}" if rnd.random() < 0.7 else None,
+                  'chebi': str(10000 + index) if rnd.random() < 0.8 else None,
+                  'bigg': f"met{index}" if rnd.random() < 0.6 else None,
+                  'seed': f"cpd{index:05d}" if rnd.random() < 0.8 else None}
+                 for index in range(1, compound_count + 1)]
+    for _ in range(compound_count // 10):
+        compound, other_compound = rnd.sample(compounds, 2)
+        compound['generic_mnx'] = other_compound['mnx']
+
+    kegg_compounds = {compound['kegg']: {'Name': [compound['name']], 'mass': [compound['mass']],
+                                         'formula': [compound['formula']],
+                                         'chebi': ["chebi:" + compound['chebi']] if compound['chebi'] else []}
+                      for compound in compounds if compound['kegg']}
+    with open(os.path.join(source_dir, "kegg_synthetic.p"), 'wb') as kegg_file:
+        dump(kegg_compounds, kegg_file)
+
+    chebi_compounds = [compound for compound in compounds if compound['chebi']]
+    write_file(source_dir, "chebi_structures.csv.gz",
+               "ID,COMPOUND_ID,STRUCTURE,TYPE,DIMENSION,DEFAULT_STRUCTURE,AUTOGEN_STRUCTURE",
+               [f"{index},{compound['chebi']},{compound['inchikey']},InChIKey,1D,N,N"
+                for index, compound in enumerate(chebi_compounds)])
+    write_file(source_dir, "chebi_compounds.tsv.gz",
+               "ID\tSTATUS\tCHEBI_ACCESSION\tSOURCE\tPARENT_ID\tNAME\tDEFINITION\tMODIFIED_ON\tCREATED_BY\tSTAR",
+               [f"{index}\tC\tCHEBI:{compound['chebi']}\tChEBI\tnull\t{compound['name'].title()}\tdef\t2020\tx\t3"
+                for index, compound in enumerate(chebi_compounds)])
+
+    write_file(source_dir, "metanetx_chem_prop.tsv",
+               "#ID\tname\treference\tformula\tcharge\tmass\tInChI\tInChIKey\tSMILES",
+               [f"{compound['mnx']}\t{compound['name']}\t"
+                f"{'chebi:' + compound['chebi'] if compound['chebi'] else 'mnx:' + compound['mnx']}\t"
+                f"{compound['formula']}\t0\t{compound['mass']}\tInChI=1S\tInChIKey={compound['inchikey']}\tO"
+                for compound in compounds])
+    write_file(source_dir, "metanetx_chem_depr.tsv", "#deprecated_ID\tID\tversion",
+               [f"{compound['mnx']}old\t{compound['mnx']}\t4.4" for compound in compounds if rnd.random() < 0.1])
+    xref_lines = []
+    for compound in compounds:
+        mnx, name = compound['mnx'], compound['name']
+        xref_lines.append(f"mnx:{mnx}\t{mnx}\t{name}")
+        for database, key in [('kegg.compound', 'kegg'), ('chebi', 'chebi'), ('bigg.metabolite', 'bigg'),
+                              ('seed.compound', 'seed')]:
+            if compound[key]:
+                xref_lines.append(f"{database}:{compound[key]}\t{mnx}\t{name}")
+        if 'generic_mnx' in compound and compound['seed']:
+            xref_lines.append(f"seed.compound:{compound['seed']}\t{compound['generic_mnx']}\t{name}")
+    write_file(source_dir, "metanetx_chem_xref.tsv", "#source\tID\tdescription", xref_lines)
+
+    bigg_lines = []
+    for compound in compounds:
+        if compound['bigg']:
+            links = [f"MetaNetX (MNX) Chemical: http://identifiers.org/metanetx.chemical/{compound['mnx']}"]
+            if compound['kegg']:
+                links.append(f"KEGG Compound: http://identifiers.org/kegg.compound/{compound['kegg']}")
+            if compound['seed'] and rnd.random() < 0.7:
+                links.append(f"SEED Compound: http://identifiers.org/seed.compound/{compound['seed']}")
+            bigg_lines += [f"{compound['bigg']}_{compartment}\t{compound['bigg']}\t{compound['name']}\tiML1515\t"
+                           f"{'; '.join(links)}\t{compound['bigg']}_{compartment}" for compartment in ('c', 'e')]
+    write_file(source_dir, "bigg_models_metabolites.txt",
+               "bigg_id\tuniversal_bigg_id\tname\tmodel_list\tdatabase_links\told_bigg_ids", bigg_lines)
+
+    seed_compounds = [compound for compound in compounds if compound['seed']]
+    write_file(source_dir, "modelSeed_compounds.tsv",
+               "id\tabbreviation\tname\tformula\tmass\tsource\tinchikey\tcharge\tis_core\tis_obsolete\t"
+               "linked_compound\tx",
+               [f"{compound['seed']}\tabbr\t{compound['name']}\t{compound['formula']}\t{compound['mass']}\tPrimary\t"
+                f"{compound['inchikey']}\t0\t1\t0\tnull\tx" for compound in seed_compounds])
+    write_file(source_dir, "modelseed_compound_aliases.txt", "ModelSEED ID\tExternal ID\tSource",
+               [f"{compound['seed']}\t{compound['kegg']}\tKEGG" for compound in seed_compounds if compound['kegg']] +
+               [f"{compound['seed']}\t{compound['mnx']}\tMetaNetX.chemical" for compound in seed_compounds])
+
+    reactions = [{'mnx': f"MNXR{index}", 'name': f"reaction {index}", 'ec': f"1.1.1.{index}",
+                  'seed': f"rxn{index:05d}" if rnd.random() < 0.8 else None,
+                  'bigg': f"RXN{index}" if rnd.random() < 0.6 else None,
+                  'kegg': f"R{index:05d}" if rnd.random() < 0.7 else None}
+                 for index in range(1, reaction_count + 1)]
+    seed_reactions = [reaction for reaction in reactions if reaction['seed']]
+    write_file(source_dir, "modelSeed_reactions.tsv", "\t".join(f"column{index}" for index in range(22)),
+               ["\t".join([reaction['seed'], "x", reaction['name']] + ["x"] * 10 + [reaction['ec']] + ["x"] * 5 +
+                          [f"{rnd.choice(seed_reactions)['seed']}" if rnd.random() < 0.1 else "null", "x", "x"])
+                for reaction in seed_reactions])
+    write_file(source_dir, "modelSeed_reaction_aliases.txt", "ModelSEED ID\tExternal ID\tSource",
+               [f"{reaction['seed']}\t{reaction['kegg']}\tKEGG" for reaction in seed_reactions if reaction['kegg']])
+    write_file(source_dir, "modelSeed_reaction_pathways.txt", "ModelSEED ID\tExternal ID\tSource",
+               [f"{reaction['seed']}\tpathway {rnd.randint(1, 20)}\tKEGG" for reaction in seed_reactions])
+    write_file(source_dir, "metaNetX_reac_prop.tsv", "#ID\tmnx_equation\treference\tclassifs\tis_balanced",
+               [f"{reaction['mnx']}\teq\tmnx:{reaction['mnx']}\t{reaction['ec']}\tB" for reaction in reactions])
+    reaction_xref_lines = []
+    for reaction in reactions:
+        reaction_xref_lines.append(f"mnx:{reaction['mnx']}\t{reaction['mnx']}\t")
+        for database, key in [('kegg.reaction', 'kegg'), ('seed.reaction', 'seed'), ('bigg.reaction', 'bigg')]:
+            if reaction[key]:
+                reaction_xref_lines.append(f"{database}:{reaction[key]}\t{reaction['mnx']}\t")
+        if rnd.random() < 0.1:
+            reaction_xref_lines.append(f"seed.reaction:{rnd.choice(seed_reactions)['seed']}\t{reaction['mnx']}\t")
+    write_file(source_dir, "metaNetX_reac_xref.tsv", "#source\tID\tdescription", reaction_xref_lines)
+    write_file(source_dir, "bigg_models_reactions.txt",
+               "bigg_id\tname\treaction_string\tmodel_list\tdatabase_links\told_bigg_ids",
+               [f"{reaction['bigg']}\t{reaction['name']}\ta <=> b\tiML1515\t"
+                f"MetaNetX (MNX) Equation: http://identifiers.org/metanetx.reaction/{reaction['mnx']}\t{reaction['bigg']}_old"
+                for reaction in reactions if reaction['bigg']])
+
+    write_manifest(source_dir)
+
+
+def write_file(source_dir, filename, header, lines):
+    file_open = gzip_open if filename.endswith(".gz") else open
+    with file_open(os.path.join(source_dir, filename), 'wt') as database_file:
+        database_file.write("\n".join([header] + lines) + "\n")
+
+
+def write_manifest(source_dir):
+    manifest = {'kegg': {'filename': "kegg_synthetic.p"}}
+    for filename in database_processing.url_dictionary:
+        basename = os.path.basename(filename)
+        with open(os.path.join(source_dir, basename), 'rb') as database_file:
+            content = database_file.read()
+        manifest[basename] = {'url': "", 'size': len(content), 'sha256': sha256(content).hexdigest()}
+
+    with open(os.path.join(source_dir, "downloadManifest.json"), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+@pytest.fixture
+def build_settings(tmp_path, monkeypatch):
+    # Module variables changed by builds in other directories are restored after each test
+    for name, value in list(vars(database_processing).items()):
+        if isinstance(value, (str, dict)) and not name.startswith('__'):
+            monkeypatch.setattr(database_processing, name, value)
+    monkeypatch.setattr(database_processing, 'log_dir', str(tmp_path) + "/")
+    monkeypatch.setattr(database_processing, 'max_parse_workers', 1)
+    monkeypatch.setattr(database_processing, 'log', lambda message: None)
+    monkeypatch.setattr(database_processing, 'build_report', [])
+    return tmp_path
+
+
+def build(source_dir, files_dir):
+    database_processing.set_files_dir(str(files_dir))
+    database_processing.build_id_mapping(False, source_dir=str(source_dir))
+    return (dict(database_processing.met_univ_id_dict), dict(database_processing.met_univ_id_prop_dict),
+            dict(database_processing.reac_univ_id_dict), dict(database_processing.reac_univ_id_prop_dict))
+
+
+def get_univ_id_contents(id_mapping):
+    """
+    Replaces each univ ID of the mapping dictionaries by its sorted IDs, so that builds numbering univ IDs
+    differently can be compared.
+    """
+    univ_id_contents = []
+    for id_dict, info_dict in [id_mapping[:2], id_mapping[2:]]:
+        univ_id_ids = {univ_id: tuple(sorted(properties['ids'])) for univ_id, properties in info_dict.items()}
+        univ_id_contents.append({db_id: univ_id_ids[univ_id] for db_id, univ_id in id_dict.items()})
+        univ_id_contents.append({univ_id_ids[univ_id]: {key: sorted(value) if key == 'ids' else value
+                                                        for key, value in properties.items()}
+                                 for univ_id, properties in info_dict.items()})
+    return univ_id_contents
+
+
+def test_set_files_dir(build_settings):
+    database_processing.set_files_dir(str(build_settings / "files"))
+
+    files_dir = str(build_settings / "files") + "/"
+    assert database_processing.files_dir == files_dir
+    for name in database_processing.files_dir_variables:
+        assert getattr(database_processing, name).startswith(files_dir)
+    assert all(filename.startswith(files_dir) for filename in database_processing.url_dictionary)
+    assert database_processing.url_dictionary_chebi[files_dir + "chebi_compounds.tsv"] == \
+           files_dir + "chebi_compounds.tsv.gz"
+
+
+def test_resume_after_deleting_database_files(build_settings):
+    # An update whose mapping dictionaries were not saved resumes from its checkpoints without its database files
+    source_dir = build_settings / "source"
+    write_database_files(source_dir)
+    database_processing.set_files_dir(str(build_settings / "files"))
+    id_mapping = database_processing.build_id_mapping(True, source_dir=str(source_dir))
+    id_mapping = tuple(dict(mapping) for mapping in id_mapping)
+
+    assert not (build_settings / "files" / "metanetx_chem_xref.tsv").exists()
+    assert not database_processing.load_build_checkpoints()['completed']
+
+    resumed_id_mapping = database_processing.build_id_mapping(True, resume=True)
+    assert resumed_id_mapping == id_mapping
+    assert database_processing.build_report[0]['stage'] == 'clean_reactions'
+
+    database_processing.complete_build()
+    assert database_processing.load_build_checkpoints()['completed']
+
+
+def test_stop_build(build_settings):
+    source_dir = build_settings / "source"
+    write_database_files(source_dir)
+    database_processing.set_files_dir(str(build_settings / "files"))
+    id_mapping = build(source_dir, build_settings / "full_files")
+
+    # The build reports each stage to its callback, and stops before the stage after the stop event is set
+    database_processing.set_files_dir(str(build_settings / "files"))
+    stop_event = threading.Event()
+    stage_names = []
+
+    def stop_after_stage(stage_record):
+        stage_names.append(stage_record['stage'])
+        if stage_record['stage'] == 'resolve_metabolites':
+            stop_event.set()
+
+    with pytest.raises(CancelledError):
+        database_processing.build_id_mapping(False, source_dir=str(source_dir),
+                                             build_stage_callback=stop_after_stage, stop_event=stop_event)
+    assert stage_names == [stage_record['stage'] for stage_record in database_processing.build_report]
+    assert stage_names[-1] == 'resolve_metabolites'
+    assert getattr(database_processing.build_progress, 'stop_event', None) is None
+
+    resumed_id_mapping = database_processing.build_id_mapping(False, resume=True)
+    assert get_univ_id_contents(resumed_id_mapping) == get_univ_id_contents(id_mapping)
+
+
+def test_cancel_update_async(build_settings, monkeypatch):
+    # A cancelled update returns once its build thread has stopped, even if it is cancelled again while stopping
+    source_dir = build_settings / "source"
+    write_database_files(source_dir)
+    database_processing.set_files_dir(str(build_settings / "files"))
+    cancelled_twice, build_stopped = threading.Event(), threading.Event()
+    run_update = async_api.run_id_mapper_update
+
+    async def cancel_update():
+        loop = asyncio.get_running_loop()
+        cancelled_stages, updates_done = [], []
+
+        def cancel_once(stage_record):
+            if not cancelled_stages:
+                cancelled_stages.append(stage_record['stage'])
+                update.cancel()
+
+        def cancel_again():
+            update.cancel()
+            loop.call_soon(continue_build)  # after the update handles the cancellation
+
+        def continue_build():
+            updates_done.append(update.done())
+            cancelled_twice.set()
+
+        def run_id_mapper_update(*args):
+            *update_args, build_stage_callback, stop_event = args
+
+            def report_stage(stage_record):
+                build_stage_callback(stage_record)
+                if stop_event.wait(10):  # the update is cancelled again once the build is stopping
+                    loop.call_soon_threadsafe(cancel_again)
+                    cancelled_twice.wait(10)
+
+            try:
+                run_update(*update_args, report_stage, stop_event)
+            finally:
+                build_stopped.set()
+
+        monkeypatch.setattr(async_api, 'run_id_mapper_update', run_id_mapper_update)
+        update = asyncio.ensure_future(async_api.update_id_mapper_async(
+            force=True, source_dir=str(source_dir), progress_callback=cancel_once))
+        with pytest.raises(asyncio.CancelledError):
+            await update
+        assert build_stopped.is_set()
+        assert cancelled_stages == ['load_source_files']
+        assert updates_done == [False]
+
+    asyncio.run(cancel_update())
+    assert [stage_record['stage'] for stage_record in database_processing.build_report] == ['load_source_files']
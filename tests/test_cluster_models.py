@@ -0,0 +1,85 @@
+"""
+    Tests of clustering models by the Jaccard distances of their reactions or metabolites: the distances computed in
+    blocks against a computation with sets, the nearest-neighbor chain linkage against SciPy, and the number of clusters
+    of the cluster assignments.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import numpy as np
+import pytest
+
+from mergem import __cluster_models as cluster_models
+
+
+def get_model_features(rnd, num_models, num_features):
+    """
+    Returns random arrays of unique feature codes of models, including a model without features
+    and features found in a single model.
+    """
+    model_features = [np.unique(rnd.integers(0, num_features, rnd.integers(1, num_features)))
+                      for _ in range(num_models - 1)]
+    return model_features + [np.zeros(0, dtype=np.int64)]
+
+
+def get_tie_free_distances(rnd, num_models):
+    distances = np.zeros((num_models, num_models))
+    distances[np.triu_indices(num_models, 1)] = rnd.permutation(num_models * (num_models - 1) // 2) + 1
+    return (distances + distances.T) / len(distances) ** 2
+
+
+@pytest.mark.parametrize("block_size", [3, 4096])
+def test_jaccard_distances(monkeypatch, block_size):
+    # blocks smaller than the number of models and of shared features split both the rows and the features
+    monkeypatch.setattr(cluster_models, 'feature_block_size', block_size)
+    rnd = np.random.default_rng(0)
+    model_features = get_model_features(rnd, 8, 20)
+    distances = cluster_models.compute_jaccard_distances(model_features, 20)
+
+    feature_sets = [set(features.tolist()) for features in model_features]
+    expected_distances = [[1 - len(features & other_features) / len(features | other_features)
+                           if features | other_features else 0
+                           for other_features in feature_sets] for features in feature_sets]
+    assert np.allclose(distances, expected_distances)
+
+
+@pytest.mark.parametrize("method", cluster_models.linkage_methods)
+def test_linkage_as_scipy(method):
+    hierarchy = pytest.importorskip("scipy.cluster.hierarchy")
+    distance = pytest.importorskip("scipy.spatial.distance")
+    rnd = np.random.default_rng(1)
+    for num_models in [2, 3, 10, 25]:
+        distances = get_tie_free_distances(rnd, num_models)
+        linkage = cluster_models.compute_linkage(distances.copy(), method)
+
+        scipy_linkage = hierarchy.linkage(distance.squareform(distances), method)
+        assert np.allclose(linkage[:, 2], scipy_linkage[:, 2])
+        assert np.array_equal(linkage[:, [0, 1, 3]], scipy_linkage[:, [0, 1, 3]])
+
+
+def test_number_of_clusters():
+    rnd = np.random.default_rng(2)
+    num_models = 12
+    # distances without ties, and distances of identical models, all tied
+    for distances in [get_tie_free_distances(rnd, num_models), np.zeros((num_models, num_models))]:
+        linkage = cluster_models.compute_linkage(distances, 'average')
+        for num_clusters in range(1, num_models + 1):
+            clusters = cluster_models.get_clusters(linkage, num_clusters=num_clusters)
+            assert sorted(set(clusters)) == list(range(1, num_clusters + 1))
+
+            # clusters are numbered in the suggested merge order
+            merge_order_clusters = [clusters[model_index] for model_index in cluster_models.get_leaf_order(linkage)]
+            assert merge_order_clusters == sorted(merge_order_clusters)
+
+
+def test_clusters_as_scipy():
+    hierarchy = pytest.importorskip("scipy.cluster.hierarchy")
+    rnd = np.random.default_rng(3)
+    num_models = 12
+    linkage = cluster_models.compute_linkage(get_tie_free_distances(rnd, num_models), 'average')
+
+    for num_clusters in range(1, num_models + 1):
+        clusters = cluster_models.get_clusters(linkage, num_clusters=num_clusters)
+        # the same models are grouped as by SciPy, whose clusters are numbered differently
+        scipy_clusters = hierarchy.fcluster(linkage, num_clusters, criterion='maxclust')
+        assert len(set(zip(clusters, scipy_clusters))) == len(set(scipy_clusters)) == num_clusters
@@ -0,0 +1,43 @@
+"""
+    Tests that the compact mapping tables have the same keys, values, and order as the dictionaries they represent.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from pickle import dumps, loads
+
+from mergem.__compact_tables import CompactIdMapper, CompactPropertyTable
+
+id_mapper = {'C00001': 1, 'cpd00001': 1, 'MNXM2': 2, '15377': 1, 'h2o_é': 3}
+prop_dict = {1: {'Name': ['water', 'H2O'], 'ids': ['kegg:C00001', 'seed:cpd00001', 'chebi:15377'],
+                 'formula': ['H2O'], 'mass': [18.015, '18.0106'], 'inchikey': [], 'xref_links': []},
+             2: {'Name': ['oxygen'], 'ids': ['metanetx:MNXM2', 'no_prefix'], 'formula': ['O2'], 'mass': [],
+                 'inchikey': ['MYMOFIZGZYHOMD-UHFFFAOYSA-N'], 'xref_links': ['http://identifiers.org/mnx/MNXM2']},
+             3: {'ids': ['bigg:h2o_é'], 'EC_num': ['1.1.1.1']}}
+
+
+def test_id_mapper():
+    compact_id_mapper = loads(dumps(CompactIdMapper(id_mapper)))
+
+    assert dict(compact_id_mapper) == id_mapper
+    assert list(compact_id_mapper.items()) == list(id_mapper.items())
+    assert compact_id_mapper.get('MNXM3') is None
+    assert 'h2o_é' in compact_id_mapper
+
+
+def test_property_table():
+    compact_prop_dict = loads(dumps(CompactPropertyTable(prop_dict)))
+
+    assert {univ_id: properties for univ_id, properties in compact_prop_dict.items()} == prop_dict
+    assert compact_prop_dict.get(4) is None
+    assert compact_prop_dict[1] is compact_prop_dict[1]
+
+
+def test_cached_rows():
+    compact_prop_dict = CompactPropertyTable(prop_dict)
+    compact_prop_dict.max_cached_rows = 2
+    for univ_id in prop_dict:
+        assert compact_prop_dict[univ_id] == prop_dict[univ_id]
+
+    assert len(compact_prop_dict.cached_rows) <= 2
+    assert not loads(dumps(compact_prop_dict)).cached_rows
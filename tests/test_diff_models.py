@@ -0,0 +1,84 @@
+"""
+    Tests of comparing two versions of the cobra textbook model with diff and with the -d option of the command line:
+    metabolites and reactions added, removed, renamed through their mergem id or their reaction key in either
+    direction, and reactions with the same id and changed stoichiometry.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import cobra
+import pandas as pd
+from click.testing import CliRunner
+
+import mergem
+from mergem import cli
+
+
+def get_versions(textbook, met_univ_id_dict):
+    met_univ_id_dict['ATP'] = met_univ_id_dict['atp']
+
+    # an unmapped metabolite only in the old version
+    old_model = textbook.copy()
+    old_model.add_metabolites([cobra.Metabolite('old_c', compartment='c')])
+
+    new_model = textbook.copy()
+    new_model.remove_reactions([new_model.reactions.PGK])
+    # a metabolite with another id mapped to the same mergem id, which reactions keep their ids with
+    new_model.metabolites.atp_c.id = 'ATP_c'
+    # a reaction with another id and the same stoichiometry, and one with another id and the reverse stoichiometry
+    new_model.reactions.ACALD.id = 'ACALD_alt'
+    reversed_reaction = new_model.reactions.ACKr
+    reversed_reaction.add_metabolites({metabolite: -2 * coefficient
+                                       for metabolite, coefficient in reversed_reaction.metabolites.items()})
+    reversed_reaction.id = 'ACKr_rev'
+    # reactions with the same id and another stoichiometric coefficient, or another metabolite
+    new_model.reactions.PFK.add_metabolites({new_model.metabolites.adp_c: 1})
+    new_model.reactions.TPI.add_metabolites({new_model.metabolites.h2o_c: -1})
+    # a reaction and an unmapped metabolite only in the new version
+    new_metabolite = cobra.Metabolite('xyz_c', compartment='c')
+    new_reaction = cobra.Reaction('NEW1')
+    new_reaction.add_metabolites({new_metabolite: -1, new_model.metabolites.pyr_c: 1})
+    new_model.add_reactions([new_reaction])
+
+    return old_model, new_model
+
+
+expected_differences = [('metabolite', 'removed', 'old_c', None),
+                        ('metabolite', 'added', None, 'xyz_c'),
+                        ('metabolite', 'renamed', 'atp_c', 'ATP_c'),
+                        ('reaction', 'removed', 'PGK', None),
+                        ('reaction', 'added', None, 'NEW1'),
+                        ('reaction', 'renamed', 'ACALD', 'ACALD_alt'),
+                        ('reaction', 'renamed', 'ACKr', 'ACKr_rev'),
+                        ('reaction', 'stoichiometry', 'PFK', 'PFK'),
+                        ('reaction', 'stoichiometry', 'TPI', 'TPI')]
+
+
+def get_rows(differences):
+    return [tuple(None if pd.isna(value) else value for value in row)
+            for row in differences[['type', 'change', 'old_id', 'new_id']].itertuples(index=False)]
+
+
+def test_diff(textbook, mapping_tables):
+    old_model, new_model = get_versions(textbook, mapping_tables)
+    differences = mergem.diff(old_model, new_model)
+
+    assert get_rows(differences) == expected_differences
+    assert get_rows(mergem.diff(old_model, old_model)) == []
+
+
+def test_diff_command(textbook, mapping_tables, tmp_path):
+    old_model, new_model = get_versions(textbook, mapping_tables)
+    old_filename, new_filename = str(tmp_path / "old.xml"), str(tmp_path / "new.xml")
+    cobra.io.write_sbml_model(old_model, old_filename)
+    cobra.io.write_sbml_model(new_model, new_filename)
+    output_filename = str(tmp_path / "differences.csv")
+
+    result = CliRunner().invoke(cli.main, [old_filename, new_filename, '-d', '-v', '-o', output_filename])
+    assert result.exit_code == 0, result.output
+    assert get_rows(pd.read_csv(output_filename)) == expected_differences
+    assert "Reactions renamed: 2" in result.output
+
+    result = CliRunner().invoke(cli.main, [old_filename, new_filename, '-d', '-o', str(tmp_path / "differences.xml")])
+    assert "Invalid output file format" in result.output
+    assert not (tmp_path / "differences.xml").exists()
@@ -0,0 +1,139 @@
+"""
+    Tests of download_file against the local stand-in HTTP server: resuming partial files, replacing partial files
+    of a changed file, not modified replies, unsatisfiable ranges, and retries of failed downloads.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from hashlib import sha256
+
+import pytest
+
+from mergem import __database_processing as database_processing
+
+content = bytes(range(256)) * 40
+last_modified = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+def serve_file(stub_server, path="/file", file_content=content, etag='"v2"'):
+    stub_server.files[path] = {'content': file_content, 'etag': etag, 'last_modified': last_modified}
+    return stub_server.url + path
+
+
+def write_partial_file(filename, partial_content, etag=None, last_modified=None):
+    with open(filename + ".part", 'wb') as partial_file:
+        partial_file.write(partial_content)
+    if etag or last_modified:
+        database_processing.save_partial_validators(filename + ".part", etag, last_modified)
+
+
+def check_download(filename, file_stats, etag='"v2"', file_content=content):
+    with open(filename, 'rb') as f:
+        assert f.read() == file_content
+    assert file_stats['size'] == len(file_content)
+    assert file_stats['sha256'] == sha256(file_content).hexdigest()
+    assert file_stats['etag'] == etag
+    assert file_stats['last_modified'] == last_modified
+
+
+def test_download(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    file_stats = database_processing.download_file(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+    assert file_stats['attempts'] == 1
+    assert not (download_settings / "file.part").exists()
+    assert not (download_settings / "file.part.json").exists()
+
+
+def test_resume_unchanged_file(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    write_partial_file(filename, content[:1000], etag='"v2"', last_modified=last_modified)
+    file_stats = database_processing.download_file(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+    path, headers = stub_server.requests[-1]
+    assert headers['Range'] == "bytes=1000-"
+    assert headers['If-Range'] == '"v2"'
+
+
+def test_resume_changed_file(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    write_partial_file(filename, b"OLD-" * 250, etag='"v1"')
+    file_stats = database_processing.download_file(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+
+
+def test_partial_file_without_validators(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    write_partial_file(filename, b"OLD-" * 250)
+    file_stats = database_processing.download_file(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+    assert 'Range' not in stub_server.requests[-1][1]
+
+
+def test_resume_after_truncated_download(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    url = serve_file(stub_server)
+    stub_server.failures["/file"].append('truncate')
+    file_stats = database_processing.download_file(url, filename)
+
+    check_download(filename, file_stats)
+    assert file_stats['attempts'] == 2
+    assert stub_server.requests[-1][1]['Range'] == f"bytes={len(content) // 2}-"
+
+
+def test_retry_incomplete_chunked_download(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    url = serve_file(stub_server)
+    stub_server.failures["/file"].append('truncate_chunked')
+    file_stats = database_processing.download_file(url, filename)
+
+    check_download(filename, file_stats)
+    assert file_stats['attempts'] == 2
+
+
+def test_unsatisfiable_range(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    write_partial_file(filename, content + b"extra", etag='"v2"')
+    file_stats = database_processing.download_file(serve_file(stub_server), filename)
+
+    check_download(filename, file_stats)
+    assert [request[1].get('Range') for request in stub_server.requests] == [f"bytes={len(content) + 5}-", None]
+
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_retry_server_errors(stub_server, download_settings, status):
+    filename = str(download_settings / "file")
+    url = serve_file(stub_server)
+    stub_server.failures["/file"].extend([status, status])
+    file_stats = database_processing.download_file(url, filename)
+
+    check_download(filename, file_stats)
+    assert file_stats['attempts'] == 3
+
+
+def test_retries_exhausted(stub_server, download_settings, monkeypatch):
+    monkeypatch.setattr(database_processing, 'max_download_retries', 2)
+    url = serve_file(stub_server)
+    stub_server.failures["/file"].extend([500] * 3)
+
+    with pytest.raises(database_processing.urllib.error.HTTPError):
+        database_processing.download_file(url, str(download_settings / "file"))
+    assert len(stub_server.requests) == 3
+
+
+def test_client_errors_not_retried(stub_server, download_settings):
+    with pytest.raises(database_processing.urllib.error.HTTPError):
+        database_processing.download_file(stub_server.url + "/missing", str(download_settings / "file"))
+    assert len(stub_server.requests) == 1
+
+
+def test_not_modified(stub_server, download_settings):
+    filename = str(download_settings / "file")
+    file_stats = database_processing.download_file(serve_file(stub_server), filename, {'If-None-Match': '"v2"'})
+
+    assert file_stats is None
+    assert not (download_settings / "file").exists()
@@ -0,0 +1,111 @@
+"""
+    Tests of the KEGG compound download against a local stand-in of the KEGG API: batched requests,
+    resuming from checkpoints, retries, and the request rate limit.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from pickle import load
+from time import perf_counter
+import os
+
+import pytest
+
+from mergem import __database_processing as database_processing
+
+kegg_ids = [f"C{index:05d}" for index in range(1, 24)]
+
+
+def get_compounds(path, headers, request_times):
+    request_times.append(perf_counter())
+    ids = path.split('/get/', 1)[1].split('+')
+    entries = [f"ENTRY       {kegg_id}                      Compound\n"
+               f"NAME        Compound {kegg_id};\n"
+               f"FORMULA     C{int(kegg_id[1:])}H2O\n"
+               f"EXACT_MASS  {int(kegg_id[1:])}.5\n"
+               f"            ChEBI: {int(kegg_id[1:]) + 1000}\n"
+               f"///" for kegg_id in ids]
+    return 200, "\n".join(entries).encode()
+
+
+@pytest.fixture
+def kegg_server(stub_server, download_settings, monkeypatch):
+    stub_server.routes["/info/cpd"] = lambda path, headers: (
+        200, b"compound         KEGG COMPOUND Database\ncpd              Release 110.0+/05-01, May 24\n")
+    stub_server.routes["/list/compound"] = lambda path, headers: (
+        200, "".join(f"cpd:{kegg_id}\tCompound {kegg_id}\n" for kegg_id in kegg_ids).encode())
+    stub_server.kegg_times = []
+    stub_server.prefix_routes["get"] = lambda path, headers: get_compounds(path, headers, stub_server.kegg_times)
+
+    monkeypatch.setattr(database_processing, 'kegg_api_url', stub_server.url)
+    monkeypatch.setattr(database_processing, 'files_dir', str(download_settings) + "/")
+    monkeypatch.setattr(database_processing, 'kegg_batch_size', 5)
+    monkeypatch.setattr(database_processing, 'kegg_requests_per_second', 50)
+    return stub_server
+
+
+def get_batch_requests(stub_server):
+    return [path.split('/get/', 1)[1].split('+') for path, _ in stub_server.requests if path.startswith('/get/')]
+
+
+def load_kegg_file(filename):
+    with open(database_processing.files_dir + filename, 'rb') as kegg_file:
+        return load(kegg_file)
+
+
+def test_release_filename(kegg_server):
+    assert database_processing.get_kegg_release_filename() == "kegg_110-0.p"
+
+
+def test_batches(kegg_server):
+    database_processing.download_kegg_compounds("kegg.p")
+    kegg_compounds = load_kegg_file("kegg.p")
+
+    batches = get_batch_requests(kegg_server)
+    assert all(len(batch) <= 5 for batch in batches)
+    assert sorted(kegg_id for batch in batches for kegg_id in batch) == kegg_ids
+    assert list(kegg_compounds) == kegg_ids
+    assert kegg_compounds["C00012"] == {'Name': ['CompoundC00012'], 'mass': ['12.5'], 'formula': ['C12H2O'],
+                                        'chebi': ['chebi:1012']}
+    assert not os.path.exists(database_processing.files_dir + "kegg.p.partial")
+
+
+def test_resume_from_checkpoint(kegg_server, monkeypatch):
+    # The download fails after some batches, leaving a checkpoint with the compounds downloaded
+    monkeypatch.setattr(database_processing, 'max_download_retries', 0)
+    monkeypatch.setattr(database_processing, 'max_kegg_workers', 1)
+    failing_batch = "+".join(kegg_ids[10:15])
+    kegg_server.failures["/get/" + failing_batch].append(500)
+    with pytest.raises(database_processing.requests.HTTPError):
+        database_processing.download_kegg_compounds("kegg.p")
+
+    with open(database_processing.files_dir + "kegg.p.partial", 'rb') as checkpoint_file:
+        checkpoint = load(checkpoint_file)
+    assert set(kegg_ids[:10]) <= set(checkpoint)
+    assert not set(kegg_ids[10:15]) & set(checkpoint)
+
+    kegg_server.requests.clear()
+    database_processing.download_kegg_compounds("kegg.p")
+    requested_ids = {kegg_id for batch in get_batch_requests(kegg_server) for kegg_id in batch}
+    assert requested_ids == set(kegg_ids) - set(checkpoint)
+    assert list(load_kegg_file("kegg.p")) == kegg_ids
+    assert not os.path.exists(database_processing.files_dir + "kegg.p.partial")
+
+
+def test_retry(kegg_server):
+    kegg_server.failures["/get/" + "+".join(kegg_ids[:5])].extend([503, 429])
+    database_processing.download_kegg_compounds("kegg.p")
+
+    assert list(load_kegg_file("kegg.p")) == kegg_ids
+    assert get_batch_requests(kegg_server).count(kegg_ids[:5]) == 3
+
+
+def test_rate_limit(kegg_server, monkeypatch):
+    monkeypatch.setattr(database_processing, 'kegg_requests_per_second', 10)
+    database_processing.download_kegg_compounds("kegg.p")
+
+    # Requests of all workers are spaced by the rate limit, allowing for the scheduling of the server threads
+    request_times = sorted(kegg_server.kegg_times)
+    assert len(request_times) == 5
+    assert request_times[-1] - request_times[0] >= 4 / 10 - 0.05
+    assert min(later - earlier for earlier, later in zip(request_times, request_times[1:])) >= 1 / 10 - 0.05
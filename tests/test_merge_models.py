@@ -0,0 +1,294 @@
+"""
+    Tests of merging copies of the cobra textbook model with a small metabolite mapping table: renaming the
+    metabolites and reactions of the merged model, the ids of duplicate reactions of community models, the
+    preprocessing cache of model files, the merged GPRs and annotations of duplicate reactions and metabolites,
+    the annotations extended from the properties of universal ids, the near-duplicate reactions of the models, and
+    the tables of the sources of the merged metabolites and reactions.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+import pickle
+
+from collections import Counter
+
+import cobra
+import pandas as pd
+import pytest
+
+import mergem
+from mergem import __merge_models as merge_models
+from mergem import __model_handling as model_handling
+from test_merge_subsets import get_panel
+
+
+def get_members(textbook, members):
+    member_models = []
+    for member in range(members):
+        member_model = textbook.copy()
+        member_model.id = f"member{member}"
+        member_models.append(member_model)
+    return member_models
+
+
+def check_ids(model):
+    assert all(model.metabolites.get_by_id(metabolite.id) is metabolite for metabolite in model.metabolites)
+    assert all(model.reactions.get_by_id(reaction.id) is reaction for reaction in model.reactions)
+    assert all(model.constraints[metabolite.id] is metabolite.constraint for metabolite in model.metabolites)
+    assert all(model.variables[reaction.id] is reaction.forward_variable for reaction in model.reactions)
+
+
+def test_merge_keeps_ids(textbook, mapping_tables):
+    merged_model = mergem.merge(get_members(textbook, 2))['merged_model']
+
+    check_ids(merged_model)
+    assert {metabolite.id for metabolite in merged_model.metabolites} == \
+           {metabolite.id for metabolite in textbook.metabolites}
+    # the objective reactions of the models are merged into a single reaction
+    assert {reaction.id for reaction in merged_model.reactions} == \
+           {reaction.id for reaction in textbook.reactions} - {'Biomass_Ecoli_core'} | {'merged-objectives'}
+
+
+@pytest.mark.parametrize("numbered, duplicate_ids", [(False, ['ACALD', 'ACALD~', 'ACALD~~']),
+                                                     (True, ['ACALD', 'ACALD~', 'ACALD~2'])])
+def test_community_duplicate_reaction_ids(textbook, mapping_tables, monkeypatch, numbered, duplicate_ids):
+    monkeypatch.setattr(merge_models, 'numbered_duplicate_reac_ids', numbered)
+    community_model = mergem.merge(get_members(textbook, 3), community_model=True)['merged_model']
+
+    check_ids(community_model)
+    assert [reaction.id for reaction in community_model.reactions if reaction.id.rstrip('~2') == 'ACALD'] == \
+           duplicate_ids
+
+
+def test_rename_duplicate_id(textbook):
+    model = textbook.copy()
+    ids = [reaction.id for reaction in model.reactions]
+    with pytest.raises(ValueError):
+        merge_models.rename_reactions(model, {model.reactions.ACALD: 'ACALD2', model.reactions.PGK: 'ACALD2'})
+
+    assert [reaction.id for reaction in model.reactions] == ['ACALD2' if reac_id == 'ACALD' else reac_id
+                                                             for reac_id in ids]
+    check_ids(model)
+
+
+def test_preprocessing_cache(textbook, tmp_path, monkeypatch):
+    met_univ_id_dict = {'C00080': 1, 'h': 1, 'atp': 2}
+    met_univ_id_dict_file = tmp_path / "metaboliteIdMapper.p"
+    met_univ_id_dict_file.write_bytes(pickle.dumps(met_univ_id_dict))
+    monkeypatch.setattr(model_handling, 'met_univ_id_dict', met_univ_id_dict)
+    monkeypatch.setattr(model_handling, 'met_univ_id_dict_file', str(met_univ_id_dict_file))
+    monkeypatch.setattr(merge_models, 'use_preprocessing_cache', True)
+    monkeypatch.setattr(merge_models, 'preprocessing_cache_dir', str(tmp_path / "cache"))
+    model_file = str(tmp_path / "textbook.xml")
+    cobra.io.write_sbml_model(textbook, model_file)
+
+    preprocessed_model = merge_models.preprocess_model(textbook, model_file, False, False)
+    assert preprocessed_model['mergem_ids']['atp_c'] == "mergem_2_c"
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+    assert merge_models.preprocess_model(textbook, model_file, False, False) == preprocessed_model
+
+    # an update of the mapping tables invalidates the cached preprocessing
+    met_univ_id_dict['atp'] = 3
+    met_univ_id_dict_file.write_bytes(pickle.dumps(met_univ_id_dict) + b"updated")
+    assert merge_models.preprocess_model(textbook, model_file, False, False)['mergem_ids']['atp_c'] == "mergem_3_c"
+    assert len(list((tmp_path / "cache").iterdir())) == 2
+
+
+def merge_reaction_rules(textbook, rules):
+    models = []
+    for rule in rules:
+        model = textbook.copy()
+        model.reactions.ACALD.gene_reaction_rule = rule
+        models.append(model)
+    return mergem.merge(models)['merged_model'].reactions.ACALD.gene_reaction_rule
+
+
+@pytest.mark.parametrize("rules, merged_rule", [
+    (["b1 and b2", "b3"], "(b1 and b2) or b3"),
+    (["b1 or (b2 and (b3 or b4))", "b5"], "b1 or (b2 and (b3 or b4)) or b5"),
+    (["(b1 or b2) and b3", "b4"], "((b1 or b2) and b3) or b4"),
+    (["(b1 and b2) or b3", "b3", "b1 and b2"], "(b1 and b2) or b3"),
+    (["", "b1"], "b1"),
+    (["b1", ""], "b1"),
+    # alternatives contained in another clause are kept, and repeated alternatives are not
+    (["b1 and b2", "b1"], "(b1 and b2) or b1"),
+    (["b1 or b2", "b2 or b1"], "b1 or b2")])
+def test_merged_gpr(textbook, mapping_tables, rules, merged_rule):
+    assert merge_reaction_rules(textbook, rules) == merged_rule
+
+
+def test_split_gpr_clauses():
+    assert model_handling.split_gpr_clauses("b1 or ((b2 or b3)) or (b4 and (b5 or b6))") == \
+           ["b1", "b2", "b3", "b4 and (b5 or b6)"]
+    assert model_handling.is_enclosed("((b1 or b2))")
+    assert not model_handling.is_enclosed("(b1 or b2) and (b3 or b4)")
+    assert not model_handling.is_enclosed("b1")
+
+
+def test_merged_annotations(textbook, mapping_tables):
+    annotations = [{'kegg.reaction': 'R1', 'ec-code': ['1.1', '1.2'], 'sbo': 'SBO:0000176'},
+                   {'kegg.reaction': ['R2', 'R1'], 'ec-code': '1.2', 'rhea': 'x', 'sbo': 'SBO:0000176'},
+                   {'kegg.reaction': 'R3', 'rhea': ['y', 'x']}]
+    models = []
+    for annotation in annotations:
+        model = textbook.copy()
+        model.reactions.ACALD.annotation = dict(annotation)
+        model.metabolites.acald_c.annotation = dict(annotation)
+        models.append(model)
+    merged_model = mergem.merge(models)['merged_model']
+
+    # values are merged in the order of the models without duplicates, and single values stay strings
+    merged_annotation = {'kegg.reaction': ['R1', 'R2', 'R3'], 'ec-code': ['1.1', '1.2'], 'sbo': 'SBO:0000176',
+                         'rhea': ['x', 'y']}
+    assert merged_model.reactions.ACALD.annotation == merged_annotation
+    assert list(merged_model.reactions.ACALD.annotation) == list(merged_annotation)
+    assert merged_model.metabolites.acald_c.annotation == merged_annotation
+    # the merged model is built from the first model, and the annotations of the others are not changed
+    assert [model.reactions.ACALD.annotation for model in models[1:]] == annotations[1:]
+
+
+def set_property_tables(textbook, met_univ_id_dict, monkeypatch):
+    met_univ_id_prop_dict = {univ_id: {'ids': [f"bigg.metabolite:{met_id}", f"metanetx.chemical:MNXM{univ_id}",
+                                               f"chebi:{1000 + univ_id}", f"chebi:{2000 + univ_id}"],
+                                       'formula': [f"C{univ_id}"], 'inchikey': f"KEY{univ_id}"}
+                             for met_id, univ_id in met_univ_id_dict.items() if met_id != 'C00080'}
+    reac_univ_id_dict = {reaction.id: univ_id for univ_id, reaction in enumerate(textbook.reactions, 1)}
+    reac_univ_id_prop_dict = {univ_id: {'ids': [f"bigg.reaction:{reac_id}", f"seed.reaction:rxn{univ_id:05d}"],
+                                        'EC_num': [f"1.1.1.{univ_id}"]}
+                              for reac_id, univ_id in reac_univ_id_dict.items()}
+    monkeypatch.setattr(model_handling, 'met_univ_id_prop_dict', met_univ_id_prop_dict)
+    monkeypatch.setattr(model_handling, 'reac_univ_id_dict', reac_univ_id_dict)
+    monkeypatch.setattr(model_handling, 'reac_univ_id_prop_dict', reac_univ_id_prop_dict)
+    return met_univ_id_prop_dict, reac_univ_id_prop_dict
+
+
+def get_extended_annotations(textbook):
+    merged_model = mergem.merge(get_members(textbook, 2), extend_annot=True)['merged_model']
+    return ({metabolite.id: metabolite.annotation for metabolite in merged_model.metabolites},
+            {reaction.id: reaction.annotation for reaction in merged_model.reactions})
+
+
+def test_extended_annotations(textbook, mapping_tables, tmp_path, monkeypatch):
+    met_univ_id_prop_dict, reac_univ_id_prop_dict = set_property_tables(textbook, mapping_tables, monkeypatch)
+    met_univ_id_annot_dict_file, reac_univ_id_annot_dict_file = tmp_path / "metAnnot.p", tmp_path / "reacAnnot.p"
+    monkeypatch.setattr(model_handling, 'met_univ_id_annot_dict_file', str(met_univ_id_annot_dict_file))
+    monkeypatch.setattr(model_handling, 'reac_univ_id_annot_dict_file', str(reac_univ_id_annot_dict_file))
+
+    # without saved annotations, the annotations of each universal id are created when first used
+    monkeypatch.setattr(model_handling, 'met_univ_id_annot_dict', None)
+    monkeypatch.setattr(model_handling, 'reac_univ_id_annot_dict', None)
+    annotations = get_extended_annotations(textbook)
+    assert set(model_handling.met_univ_id_annot_dict) <= set(met_univ_id_prop_dict)
+    assert model_handling.met_univ_id_annot_dict[mapping_tables['atp']] == \
+           {'bigg.metabolite': 'atp', 'metanetx.chemical': f"MNXM{mapping_tables['atp']}",
+            'chebi': [f"CHEBI:{1000 + mapping_tables['atp']}", f"CHEBI:{2000 + mapping_tables['atp']}"]}
+    assert annotations[0]['atp_c']['chebi'][-2:] == [f"CHEBI:{1000 + mapping_tables['atp']}",
+                                                     f"CHEBI:{2000 + mapping_tables['atp']}"]
+    assert annotations[1]['ACALD']['bigg.reaction'] == 'ACALD'
+
+    # the annotations saved by update_id_mapper give the same annotations
+    met_univ_id_annot_dict_file.write_bytes(pickle.dumps(
+        {univ_id: model_handling.create_metabolite_annotations(props)
+         for univ_id, props in met_univ_id_prop_dict.items()}))
+    reac_univ_id_annot_dict_file.write_bytes(pickle.dumps(
+        {univ_id: model_handling.create_reaction_annotations(props)
+         for univ_id, props in reac_univ_id_prop_dict.items()}))
+    monkeypatch.setattr(model_handling, 'met_univ_id_annot_dict', None)
+    monkeypatch.setattr(model_handling, 'reac_univ_id_annot_dict', None)
+    assert get_extended_annotations(textbook) == annotations
+    assert len(model_handling.met_univ_id_annot_dict) == len(met_univ_id_prop_dict)
+
+
+def get_metabolite_signs(reaction):
+    # protons, mapped to the mergem id of C00080, are ignored
+    return {(metabolite.id, coefficient > 0) for metabolite, coefficient in reaction.metabolites.items()
+            if metabolite.id.rsplit('_', 1)[0] != 'h'}
+
+
+def find_near_duplicates_by_pairs(merged_model, reac_sources, max_difference):
+    """
+    Compares every pair of reactions of the merged model, in both directions, to find the reactions of different
+    models sharing metabolites that differ by at most max_difference metabolites.
+    """
+    near_duplicates = set()
+    reactions = [reaction for reaction in merged_model.reactions if reaction.id != 'merged-objectives']
+    for index, reaction in enumerate(reactions):
+        for other_reaction in reactions[index + 1:]:
+            if not reac_sources[reaction.id].keys().isdisjoint(reac_sources[other_reaction.id]):
+                continue
+
+            signs, other_signs = get_metabolite_signs(reaction), get_metabolite_signs(other_reaction)
+            if {met_id for met_id, _ in signs}.isdisjoint(met_id for met_id, _ in other_signs):
+                continue
+
+            reverse_signs = {(met_id, not sign) for met_id, sign in other_signs}
+            difference = min(max(len(signs - compared_signs), len(compared_signs - signs))
+                             for compared_signs in (other_signs, reverse_signs))
+            if difference <= max_difference:
+                near_duplicates.add((reaction.id, other_reaction.id, difference))
+
+    return near_duplicates
+
+
+@pytest.mark.parametrize("max_difference", [1, 2, 3])
+def test_near_duplicate_reactions(textbook, mapping_tables, max_difference):
+    # a reaction with an extra metabolite, a reaction with two extra metabolites, and a reversed reaction with an
+    # extra metabolite, each in one model
+    model1 = textbook.copy()
+    model1.reactions.ACALD.add_metabolites({model1.metabolites.h2o_c: -1})
+    model1.reactions.PGK.add_metabolites({model1.metabolites.h2o_c: -1, model1.metabolites.pi_c: 1})
+    model2 = textbook.copy()
+    reversed_reaction = model2.reactions.ACKr
+    reversed_reaction.add_metabolites({metabolite: -2 * coefficient
+                                       for metabolite, coefficient in reversed_reaction.metabolites.items()})
+    reversed_reaction.add_metabolites({model2.metabolites.h2o_c: 1})
+    results = mergem.merge([textbook.copy(), model1, model2], near_duplicates=max_difference)
+
+    near_duplicates = results['near_duplicate_reactions']
+    assert set(near_duplicates) == find_near_duplicates_by_pairs(results['merged_model'], results['reac_sources'],
+                                                                 max_difference)
+    assert len(near_duplicates) == len(set(near_duplicates))
+    assert [difference for _, _, difference in near_duplicates] == \
+           sorted(difference for _, _, difference in near_duplicates)
+    assert ('ACALD', 'ACALD~', 1) in near_duplicates
+    assert ('ACKr', 'ACKr~', 1) in near_duplicates
+    assert (('PGK', 'PGK~', 2) in near_duplicates) == (max_difference >= 2)
+    # reactions of the same model that differ by at most max_difference metabolites are not reported
+    same_model_near_duplicates = find_near_duplicates_by_pairs(
+        textbook, {reaction.id: {index: []} for index, reaction in enumerate(textbook.reactions)}, max_difference)
+    assert same_model_near_duplicates
+    assert same_model_near_duplicates.isdisjoint(near_duplicates)
+
+
+def test_sources_table(textbook, mapping_tables):
+    # a model with two reactions of the same stoichiometry, which are both sources of one merged reaction
+    duplicate_model = textbook.copy()
+    duplicate_reaction = duplicate_model.reactions.ACALD.copy()
+    duplicate_reaction.id = 'ACALD2'
+    duplicate_model.add_reactions([duplicate_reaction])
+    panel = get_panel(textbook, mapping_tables) + [duplicate_model]
+    results = mergem.merge([model.copy() for model in panel])
+    assert results['reac_sources']['ACALD'][len(panel) - 1] == ['ACALD', 'ACALD2']
+    table_results = mergem.merge([model.copy() for model in panel], sources_table=True)
+
+    for sources_key, presence_key, id_column in [('met_sources', 'met_presence', 'met_id'),
+                                                 ('reac_sources', 'reac_presence', 'reac_id')]:
+        sources_dict, sources_table, presence = \
+            results[sources_key], table_results[sources_key], table_results[presence_key]
+        ids = list(sources_dict)
+
+        # a row for each original id of each model, with the merged ids as categories in the order of the model
+        assert list(sources_table.columns) == [id_column, 'model_index', 'original_id']
+        assert list(sources_table[id_column].cat.categories) == ids
+        assert Counter(zip(sources_table[id_column], sources_table['model_index'], sources_table['original_id'])) == \
+               Counter((merged_id, model_index, original_id) for merged_id, sources in sources_dict.items()
+                       for model_index, original_ids in sources.items()
+                       for original_id in (original_ids if isinstance(original_ids, list) else [original_ids]))
+
+        # a sparse column for each model, with 1 for the merged ids with a source in the model
+        assert list(presence.index) == ids and presence.index.name == id_column
+        assert list(presence.columns) == list(range(len(panel)))
+        assert all(isinstance(dtype, pd.SparseDtype) for dtype in presence.dtypes)
+        assert {merged_id: {model_index for model_index in presence.columns if presence.at[merged_id, model_index]}
+                for merged_id in ids} == {merged_id: set(sources) for merged_id, sources in sources_dict.items()}
+        assert set(presence.sparse.to_dense().values.ravel()) == {0, 1}
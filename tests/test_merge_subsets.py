@@ -0,0 +1,75 @@
+"""
+    Tests of merge_subsets against merge: the statistics of every pair and leave-one-out subset of a panel of
+    variants of the cobra textbook model, reconciled without building merged models, are those of merging the
+    models of the subset.
+
+    Copyright (c) Lobo Lab (https://lobolab.umbc.edu)
+"""
+
+from itertools import permutations
+
+import cobra
+import numpy as np
+import pytest
+
+import mergem
+from mergem import __merge_subsets as merge_subsets
+
+
+def get_panel(textbook, met_univ_id_dict):
+    met_univ_id_dict['ATP'] = met_univ_id_dict['atpB'] = met_univ_id_dict['atp']
+
+    # reactions removed, a metabolite with another id mapped to the same mergem id, a reaction with another id
+    # and the same stoichiometry, and a reaction with an unmapped metabolite
+    model1 = textbook.copy()
+    model1.remove_reactions([model1.reactions.PGK, model1.reactions.PFK])
+    model1.metabolites.atp_c.id = 'ATP_c'
+    model1.reactions.ACALD.id = 'ACALD_alt'
+    unmapped_metabolite = cobra.Metabolite('xyz_c', compartment='c')
+    new_reaction = cobra.Reaction('NEW1')
+    new_reaction.add_metabolites({unmapped_metabolite: -1, model1.metabolites.pyr_c: 1})
+    model1.add_reactions([new_reaction])
+
+    # a reaction with the same id and another stoichiometry, and two metabolites mapped to the same mergem id,
+    # both in one reaction and one replacing the other in another reaction
+    model2 = textbook.copy()
+    model2.remove_reactions([model2.reactions.GLCpts])
+    model2.reactions.ACALD.add_metabolites({model2.metabolites.h2o_c: -1})
+    model2.metabolites.atp_c.id = 'ATP_c'
+    second_atp = cobra.Metabolite('atpB_c', compartment='c')
+    both_reaction, replaced_reaction = cobra.Reaction('ATPX'), cobra.Reaction('ATPY')
+    both_reaction.add_metabolites({model2.metabolites.ATP_c: -1, second_atp: 1})
+    replaced_reaction.add_metabolites({second_atp: -1, model2.metabolites.adp_c: 1, model2.metabolites.pi_c: 1})
+    model2.add_reactions([both_reaction, replaced_reaction])
+
+    # a reaction with another stoichiometric coefficient, a reaction differing only in protons, and the
+    # metabolite id of the first model mapped to the same mergem id as atp_c
+    model3 = textbook.copy()
+    model3.reactions.PGK.add_metabolites({model3.metabolites.atp_c: 1})
+    model3.reactions.ACKr.add_metabolites({model3.metabolites.h_c: 1})
+    model1_atp = cobra.Metabolite('ATP_c', compartment='c')
+    atp_reaction = cobra.Reaction('ATPZ')
+    atp_reaction.add_metabolites({model1_atp: -1, model3.metabolites.adp_c: 1})
+    model3.add_reactions([atp_reaction])
+
+    return [textbook.copy(), model1, model2, model3]
+
+
+@pytest.mark.parametrize("exact_sto, use_prot, set_objective", [(False, False, 'merge'), (True, False, 'merge'),
+                                                                (False, True, 'merge'), (False, False, 0)])
+def test_subsets_as_merge(textbook, mapping_tables, monkeypatch, exact_sto, use_prot, set_objective):
+    monkeypatch.setattr(merge_subsets, 'max_subset_workers', 1)
+    panel = get_panel(textbook, mapping_tables)
+    pairs = [list(pair) for pair in permutations(range(len(panel)), 2)]
+    leave_one_out = [[index for index in range(len(panel)) if index != left_out] for left_out in range(len(panel))]
+    subsets = pairs + leave_one_out + [list(range(len(panel)))]
+
+    results = mergem.merge_subsets(panel, subsets, set_objective=set_objective, exact_sto=exact_sto,
+                                   use_prot=use_prot)
+
+    for subset, result in zip(subsets, results):
+        merge_result = mergem.merge([panel[index].copy() for index in subset], set_objective=set_objective,
+                                    exact_sto=exact_sto, use_prot=use_prot)
+        assert result['num_met_merged'] == merge_result['num_met_merged'], subset
+        assert result['num_reac_merged'] == merge_result['num_reac_merged'], subset
+        assert np.allclose(result['jacc_matrix'], merge_result['jacc_matrix'], equal_nan=True), subset